@@ -328,6 +328,11 @@ class AnnotateWindow(QBzrWindow):
         self.log_list.header().hideSection(logmodel.COL_DATE)
         self.log_list.parent_annotate_window = self
         self.log_branch_loaded = False
+        self.log_revids = None
+        """The revisions of the annotation to load once the log is loaded."""
+        self.connect(self.log_list.log_model,
+                     QtCore.SIGNAL("loaded()"),
+                     self.log_loaded)
         
         self.connect(self.log_list.selectionModel(),
                      QtCore.SIGNAL("selectionChanged(QItemSelection, QItemSelection)"),
@@ -540,46 +545,60 @@ class AnnotateWindow(QBzrWindow):
 
         self.text_edit.emit(QtCore.SIGNAL("documentChangeFinished()"))
         
+        self.processEvents()
+        highlight_document(self.text_edit, path)
         self.processEvents()
         
-        just_loaded_log = False
         if not self.log_branch_loaded:
+            # The log is loaded in a thread, which uses the repository, so
+            # the revisions are loaded once it is done, in log_loaded. It is
+            # started once the branch is unlocked.
             self.log_branch_loaded = True
-            bi = BranchInfo('', self.working_tree, self.branch)
-            self.log_list.load(
-                (bi,), bi, [self.fileId], self.no_graph,
-                logmodel.WithWorkingTreeGraphVizLoader)
-            
-            gv = self.log_list.log_model.graph_viz
-            self.annotate_bar.adjustWidth(len(lines),
-                                          gv.revisions[0].revno_sequence[0])
-            
-            just_loaded_log = True
-            
-            # Show the revisions the we know about from the annotate.
-            filter = self.log_list.log_model.file_id_filter
-            changed_revs = []
-            for revid in self.rev_indexes.keys():
-                rev = gv.revid_rev[revid]
-                filter.filter_file_id[rev.index] = True
-                changed_revs.append(rev)
-            filter.filter_changed_callback(changed_revs, last_call=True)
+            self.log_revids = ordered_revids
+            QtCore.QTimer.singleShot(0, self.load_log)
+            return
         
+        load_revisions(ordered_revids, self.branch.repository,
+                       revisions_loaded = self.revisions_loaded,
+                       pass_prev_loaded_rev = True)
         self.processEvents()
-        highlight_document(self.text_edit, path)
+    
+    @reports_exception()
+    def load_log(self):
+        bi = BranchInfo('', self.working_tree, self.branch)
+        self.log_list.load(
+            (bi,), bi, [self.fileId], self.no_graph,
+            logmodel.WithWorkingTreeGraphVizLoader)
+    
+    def log_loaded(self):
+        if self.log_revids is None:
+            return
+        ordered_revids = self.log_revids
+        self.log_revids = None
+        
+        gv = self.log_list.log_model.graph_viz
+        self.annotate_bar.adjustWidth(len(self.old_lines),
+                                      gv.revisions[0].revno_sequence[0])
+        
+        # Show the revisions the we know about from the annotate.
+        filter = self.log_list.log_model.file_id_filter
+        changed_revs = []
+        for revid in self.rev_indexes.keys():
+            rev = gv.revid_rev[revid]
+            filter.filter_file_id[rev.index] = True
+            changed_revs.append(rev)
+        filter.filter_changed_callback(changed_revs, last_call=True)
+        
         self.processEvents()
         load_revisions(ordered_revids, self.branch.repository,
                        revisions_loaded = self.revisions_loaded,
                        pass_prev_loaded_rev = True)
         self.processEvents()
         
-        if just_loaded_log:
-            # Check for any other revisions we don't know about
-            
-            filter = self.log_list.log_model.file_id_filter
-            revids = [rev.revid for rev in gv.revisions
-                      if rev.revid not in self.rev_indexes]
-            filter.load(revids)
+        # Check for any other revisions we don't know about
+        revids = [rev.revid for rev in gv.revisions
+                  if rev.revid not in self.rev_indexes]
+        filter.load(revids)
     
     def translate_positions(self, old_lines, new_lines, old_positions):
         sm = SequenceMatcher(None, old_lines, new_lines)
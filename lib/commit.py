@@ -181,6 +181,11 @@ class PendingMergesList(LogList):
         self.log_model.load(
             (bi,), bi, None, False, logmodel.PendingMergesGraphVizLoader)
     
+    def graph_loaded(self):
+        # load_tree loads the model directly, without the context menu that
+        # LogList makes, and the revnos are hidden.
+        pass
+    
     def create_context_menu(self, file_ids):
         super(PendingMergesList, self).create_context_menu(file_ids)
         showinfo = QtGui.QAction("Show &information...", self)
@@ -28,6 +28,7 @@ from bzrlib import cmdline, errors, trace
 
 from bzrlib.plugins.qbzr.lib import ui_merge_config
 from bzrlib.plugins.qbzr.lib.i18n import gettext, N_
+from bzrlib.plugins.qbzr.lib.revisionmetadata import RevisionDiskCache
 from bzrlib.plugins.qbzr.lib.spellcheck import SpellChecker
 from bzrlib.plugins.qbzr.lib.util import (
     BTN_OK,
@@ -302,6 +303,22 @@ class QBzrConfigWindow(QBzrDialog):
         grid.addWidget(label, 2, 0)
         grid.addLayout(checkoutBasedirHBox, 2, 1)
 
+        self.revisionCacheCheckBox = QtGui.QCheckBox(
+            gettext("Cache revisions of &remote branches on disk"))
+        self.revisionCacheSizeSpinner = QtGui.QSpinBox()
+        self.revisionCacheSizeSpinner.setRange(1000, 10000000)
+        self.revisionCacheSizeSpinner.setSingleStep(1000)
+        self.revisionCacheSizeSpinner.setToolTip(gettext(
+            "Maximum number of revisions to cache for each repository"))
+        self.connect(self.revisionCacheCheckBox,
+            QtCore.SIGNAL("toggled(bool)"),
+            self.revisionCacheSizeSpinner.setEnabled)
+        revisionCacheHBox = QtGui.QHBoxLayout()
+        revisionCacheHBox.addWidget(self.revisionCacheCheckBox)
+        revisionCacheHBox.addWidget(self.revisionCacheSizeSpinner)
+        revisionCacheHBox.addStretch(10)
+        grid.addLayout(revisionCacheHBox, 3, 0, 1, 2)
+
         return tabwidget
 
     def load(self):
@@ -363,6 +380,16 @@ class QBzrConfigWindow(QBzrDialog):
         if checkoutBasedir:
             self.checkoutBasedirEdit.setText(checkoutBasedir)
 
+        # Revision cache
+        revisionCache = qconfig.get_option_as_bool('revision_cache')
+        self.revisionCacheCheckBox.setChecked(revisionCache != False)
+        self.revisionCacheSizeSpinner.setEnabled(revisionCache != False)
+        try:
+            revisionCacheSize = int(qconfig.get_option('revision_cache_size'))
+        except (TypeError, ValueError):
+            revisionCacheSize = RevisionDiskCache.max_revisions
+        self.revisionCacheSizeSpinner.setValue(revisionCacheSize)
+
         # Aliases
         aliases = parser.get('ALIASES', {})
         for alias, command in aliases.items():
@@ -517,6 +544,16 @@ class QBzrConfigWindow(QBzrDialog):
         checkout_basedir = unicode(self.checkoutBasedirEdit.text())
         qconfig.set_option('checkout_basedir', checkout_basedir)
 
+        # Revision cache
+        if self.revisionCacheCheckBox.isChecked():
+            qconfig.set_option('revision_cache', None)
+        else:
+            qconfig.set_option('revision_cache', 'False')
+        revision_cache_size = self.revisionCacheSizeSpinner.value()
+        if revision_cache_size == RevisionDiskCache.max_revisions:
+            revision_cache_size = None
+        qconfig.set_option('revision_cache_size', revision_cache_size)
+
         # Aliases
         parser['ALIASES'] = {}
         for index in range(self.aliasesList.topLevelItemCount()):
@@ -31,12 +31,12 @@ from bzrlib.plugins.qbzr.lib.util import (
 from bzrlib.lazy_import import lazy_import
 lazy_import(globals(), '''
 import errno
-import re
 import time
 import sys
 import os
 import glob
-from bzrlib.patiencediff import PatienceSequenceMatcher as SequenceMatcher
+from bzrlib.plugins.qbzr.lib import diffgroups
+from bzrlib.plugins.qbzr.lib.diffcache import diff_cache, get_tree_key
 from bzrlib.plugins.qbzr.lib.i18n import gettext, ngettext, N_
 from bzrlib import trace, osutils, cmdline
 from bzrlib.workingtree import WorkingTree
@@ -49,6 +49,7 @@ qconfig = get_qbzr_config()
 default_diff = qconfig.get_option("default_diff")
 if default_diff is None:
     default_diff = ""
+diff_algorithm = qconfig.get_option("diff_algorithm")
 ext_diffs = {gettext("Builtin Diff"):""}
 for name, command in qconfig.get_section('EXTDIFF').items():
     ext_diffs[name] = command
@@ -290,6 +291,7 @@ class DiffItem(object):
         self._lines = None
         self._binary = None
         self._group_cache = {}
+        self._tree_keys = None
         self._encodings = [None, None]
         self._ulines = [None, None]
 
@@ -302,10 +304,15 @@ class DiffItem(object):
             and (self.kind[0] == 'file' or self.kind[1] == 'file')):
             lines = []
             binary = False
+            tree_keys = self.tree_keys
             for ix, tree in enumerate(self.trees):
                 content = ()
                 if self.versioned[ix] and self.kind[ix] == 'file':
-                    content = get_file_lines_from_tree(tree, self.file_id)
+                    content = diff_cache.get_lines(tree_keys[ix], self.file_id)
+                    if content is None:
+                        content = get_file_lines_from_tree(tree, self.file_id)
+                        diff_cache.set_lines(tree_keys[ix], self.file_id,
+                                             content)
                 lines.append(content)
                 binary = binary or is_binary_content(content)
             self._lines = lines
@@ -314,6 +321,15 @@ class DiffItem(object):
             self._lines = ((),())
             self._binary = False
 
+    @property
+    def tree_keys(self):
+        """The diffcache tree keys of the file in each tree."""
+        if self._tree_keys is None:
+            self._tree_keys = tuple([get_tree_key(tree, self.file_id, date)
+                                     for tree, date in zip(self.trees,
+                                                           self.dates)])
+        return self._tree_keys
+
     @property
     def lines(self):
         if self._lines is None:
@@ -340,26 +356,43 @@ class DiffItem(object):
             elif self.versioned == (False, True):
                 groups = [[('insert', 0, 0, 0, len(lines[1]))]]
             else:
-                groups = self.difference_groups(lines, complete, ignore_whitespace)
+                groups = diff_cache.get_groups(self.tree_keys, self.file_id,
+                                               complete, ignore_whitespace,
+                                               diff_algorithm)
+                if groups is None:
+                    groups = self.difference_groups(lines, complete, ignore_whitespace)
+                    self.set_groups(complete, ignore_whitespace, groups)
         else:
             groups = []
 
         self._group_cache[key] = groups
         return groups
 
-    def difference_groups(self, lines, complete, ignore_whitespace):
-        left, right = lines
-        if ignore_whitespace:
-            re_whitespaces = re.compile("\s+")
-            left  = (re_whitespaces.sub(" ", line) for line in left)
-            right = (re_whitespaces.sub(" ", line) for line in right)
-        matcher = SequenceMatcher(None, left, right)
-        if complete:
-            groups = list([matcher.get_opcodes()])
-        else:
-            groups = list(matcher.get_grouped_opcodes())
+    def needs_difference_groups(self, complete, ignore_whitespace):
+        """Return whether groups has to run difference_groups, which is slow
+        for big files."""
+        key = (complete, ignore_whitespace)
+        if (key in self._group_cache or self.binary or
+            self.versioned != (True, True)):
+            return False
+        groups = diff_cache.get_groups(self.tree_keys, self.file_id,
+                                       complete, ignore_whitespace,
+                                       diff_algorithm)
+        if groups is not None:
+            self._group_cache[key] = groups
+            return False
+        return True
 
-        return groups
+    def set_groups(self, complete, ignore_whitespace, groups):
+        """Set the groups that difference_groups returned, when they were
+        worked out somewhere else, such as in a DiffGroupsPipeline."""
+        self._group_cache[(complete, ignore_whitespace)] = groups
+        diff_cache.set_groups(self.tree_keys, self.file_id, complete,
+                              ignore_whitespace, diff_algorithm, groups)
+
+    def difference_groups(self, lines, complete, ignore_whitespace):
+        return diffgroups.difference_groups(lines, complete, ignore_whitespace,
+                                            diff_algorithm)
 
     def get_unicode_lines(self, encodings):
         """Return pair of unicode lines for each side of diff.
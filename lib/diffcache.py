@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Cache of the lines of files and the groups of their diffs, that is shared
+by all the windows of the process.
+
+Files are identified by a tree key, from `get_tree_key`, and their file id.
+The texts of revision trees never change, so their key is the revision id.
+The key of a working tree includes the modification time and size of the
+file, so that once the file is changed, its old lines and groups are not used
+again. As with the sha1 cache of the dirstate, files that were modified in
+the last few seconds are not cached, as they could be changed again without
+their modification time changing.
+"""
+
+import time
+
+from bzrlib.lru_cache import LRUSizeCache
+from bzrlib.revisiontree import RevisionTree
+from bzrlib.workingtree import WorkingTree
+from bzrlib.workingtree_4 import DirStateRevisionTree
+
+
+min_working_file_age = 3
+"""Files in working trees that were modified less than this many seconds ago
+are not cached."""
+
+
+def get_tree_key(tree, file_id, mtime):
+    """Return the key for a file of a tree, or None if it can't be cached.
+
+    :param mtime: The modification time of the file in the tree.
+    """
+    if isinstance(tree, (RevisionTree, DirStateRevisionTree)):
+        return ('revision', tree.get_revision_id())
+    if isinstance(tree, WorkingTree):
+        if mtime is None or mtime > time.time() - min_working_file_age:
+            return None
+        size = tree.get_file_size(file_id)
+        if size is None:
+            return None
+        return ('working', tree.basedir, mtime, size)
+    return None
+
+
+def _lines_size(lines):
+    return sum([len(line) for line in lines]) + 1
+
+
+def _groups_size(groups):
+    return sum([len(group) for group in groups]) + 1
+
+
+class DiffCache(object):
+    """Cache of the lines of files and the groups of their diffs.
+
+    Both are kept in LRUSizeCaches. The size of lines is the number of
+    bytes, and the size of groups is the number of opcodes.
+    """
+
+    def __init__(self, max_lines_size=64 * 1024 * 1024,
+                 max_opcodes=1000000):
+        self._lines = LRUSizeCache(max_lines_size,
+                                   compute_size=_lines_size)
+        self._groups = LRUSizeCache(max_opcodes,
+                                    compute_size=_groups_size)
+
+    def get_lines(self, tree_key, file_id):
+        """Return the lines of a file, or None if they are not cached."""
+        if tree_key is None:
+            return None
+        return self._lines.get((tree_key, file_id))
+
+    def set_lines(self, tree_key, file_id, lines):
+        if tree_key is not None:
+            self._lines[(tree_key, file_id)] = lines
+
+    def get_groups(self, tree_keys, file_id, complete, ignore_whitespace,
+                   algorithm):
+        """Return the groups of a diff of a file, or None if they are not
+        cached.
+
+        :param tree_keys: Pair of the tree keys of the old and new file.
+        """
+        if None in tree_keys:
+            return None
+        return self._groups.get((tuple(tree_keys), file_id, complete,
+                                 ignore_whitespace, algorithm))
+
+    def set_groups(self, tree_keys, file_id, complete, ignore_whitespace,
+                   algorithm, groups):
+        if None not in tree_keys:
+            self._groups[(tuple(tree_keys), file_id, complete,
+                          ignore_whitespace, algorithm)] = groups
+
+    def clear(self):
+        self._lines.clear()
+        self._groups.clear()
+
+
+diff_cache = DiffCache()
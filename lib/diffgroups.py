@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Working out the groups of opcodes that the diff views show.
+
+There is a choice of algorithms to match the lines with, in `algorithms`.
+They are all difflib.SequenceMatcher subclasses, so they give the opcodes
+that the diff views expect.
+"""
+
+from array import array
+import atexit
+from collections import deque
+import difflib
+import itertools
+import re
+import sys
+import time
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from bzrlib import trace
+from bzrlib.patiencediff import PatienceSequenceMatcher
+
+
+_whitespace_re = re.compile("\s+")
+
+
+class MyersSequenceMatcher(difflib.SequenceMatcher):
+    """Match lines with Myers' algorithm, which finds the fewest lines to
+    delete and insert.
+
+    Its time grows with the number of lines times the number of changes, so
+    once more than max_cost lines have to be changed, or it takes longer
+    than max_time seconds, the lines that have not been matched yet are
+    matched with patience diff instead.
+    """
+
+    max_cost = 1000
+    max_time = 2.0
+
+    def __init__(self, isjunk=None, a='', b=''):
+        if isjunk is not None:
+            raise ValueError('isjunk is not supported')
+        difflib.SequenceMatcher.__init__(self, None, a, b)
+
+    def set_seq2(self, b):
+        # The index of the lines of b that difflib builds is not used.
+        if b is self.b:
+            return
+        self.b = b
+        self.matching_blocks = self.opcodes = None
+        self.fullbcount = None
+
+    def get_matching_blocks(self):
+        if self.matching_blocks is not None:
+            return self.matching_blocks
+        a, b = self.a, self.b
+        len_a, len_b = len(a), len(b)
+
+        # Lines that are the same at the start and end don't need to go
+        # through the algorithm.
+        start = 0
+        while start < len_a and start < len_b and a[start] == b[start]:
+            start += 1
+        end_a, end_b = len_a, len_b
+        while end_a > start and end_b > start and a[end_a - 1] == b[end_b - 1]:
+            end_a -= 1
+            end_b -= 1
+
+        blocks = [(0, 0, start)]
+        middle = self._myers_blocks(a[start:end_a], b[start:end_b])
+        if middle is None:
+            middle = PatienceSequenceMatcher(
+                None, a[start:end_a], b[start:end_b]).get_matching_blocks()
+        for i, j, size in middle:
+            if size:
+                blocks.append((start + i, start + j, size))
+        blocks.append((end_a, end_b, len_a - end_a))
+        blocks.append((len_a, len_b, 0))
+
+        # Join blocks that follow on from each other, and drop empty ones.
+        matching_blocks = []
+        for i, j, size in blocks:
+            if not size:
+                continue
+            if matching_blocks:
+                last_i, last_j, last_size = matching_blocks[-1]
+                if last_i + last_size == i and last_j + last_size == j:
+                    matching_blocks[-1] = (last_i, last_j, last_size + size)
+                    continue
+            matching_blocks.append((i, j, size))
+        matching_blocks.append((len_a, len_b, 0))
+        self.matching_blocks = matching_blocks
+        return matching_blocks
+
+    def _myers_blocks(self, a, b):
+        """Return the matching blocks of a and b, without the dummy at the
+        end, or None if that costs too much."""
+        n, m = len(a), len(b)
+        max_d = min(n + m, self.max_cost)
+        offset = max_d + 1
+        v = array('i', [0] * (2 * max_d + 3))
+        # The values of v for k = -d - 1 to d + 1, at the start of each d.
+        history = []
+        deadline = time.time() + self.max_time
+        for d in xrange(max_d + 1):
+            if d % 16 == 0 and time.time() > deadline:
+                return None
+            history.append(v[offset - d - 1:offset + d + 2])
+            for k in xrange(-d, d + 1, 2):
+                if k == -d or (k != d and
+                               v[offset + k - 1] < v[offset + k + 1]):
+                    x = v[offset + k + 1]
+                else:
+                    x = v[offset + k - 1] + 1
+                y = x - k
+                while x < n and y < m and a[x] == b[y]:
+                    x += 1
+                    y += 1
+                v[offset + k] = x
+                if x >= n and y >= m:
+                    return self._myers_backtrack(history, n, m)
+        return None
+
+    def _myers_backtrack(self, history, x, y):
+        blocks = []
+        for d in xrange(len(history) - 1, 0, -1):
+            v = history[d]
+            k = x - y
+            # v holds k = -d - 1 to d + 1.
+            if k == -d or (k != d and v[k - 1 + d + 1] < v[k + 1 + d + 1]):
+                prev_k = k + 1
+                prev_x = v[prev_k + d + 1]
+                snake_x = prev_x
+            else:
+                prev_k = k - 1
+                prev_x = v[prev_k + d + 1]
+                snake_x = prev_x + 1
+            if x > snake_x:
+                blocks.append((snake_x, snake_x - k, x - snake_x))
+            x, y = prev_x, prev_x - prev_k
+        if x:
+            blocks.append((0, 0, x))
+        blocks.reverse()
+        return blocks
+
+
+algorithms = {
+    'patience': PatienceSequenceMatcher,
+    'myers': MyersSequenceMatcher,
+    'difflib': difflib.SequenceMatcher,
+    }
+"""Dict of algorithm name -> SequenceMatcher class."""
+
+default_algorithm = 'patience'
+
+
+def get_matcher_class(algorithm):
+    """Return the SequenceMatcher class for an algorithm name, or for the
+    default algorithm, if it is None or unknown."""
+    if algorithm is None:
+        algorithm = default_algorithm
+    try:
+        return algorithms[algorithm]
+    except KeyError:
+        trace.mutter('qbzr: unknown diff algorithm %r' % algorithm)
+        return algorithms[default_algorithm]
+
+
+def difference_groups(lines, complete, ignore_whitespace, algorithm=None):
+    """Return the groups of opcodes for the differences between the lines
+    of two files.
+
+    :param lines: Pair of lists of lines.
+    :param complete: If True, return one group with all the lines, rather
+        than groups of the changes with some lines of context.
+    :param algorithm: One of the names in `algorithms`. The default is
+        default_algorithm.
+    """
+    left, right = lines
+    if ignore_whitespace:
+        left  = [_whitespace_re.sub(" ", line) for line in left]
+        right = [_whitespace_re.sub(" ", line) for line in right]
+    matcher = get_matcher_class(algorithm)(None, left, right)
+    if complete:
+        groups = list([matcher.get_opcodes()])
+    else:
+        groups = list(matcher.get_grouped_opcodes())
+
+    return groups
+
+
+def _difference_groups(args):
+    # Worker processes pass one argument. The jobs of pipelines that have
+    # been closed are skipped.
+    generation = args[0]
+    if (_closed_generations[generation % len(_closed_generations)] ==
+        generation):
+        return None
+    return difference_groups(*args[1:])
+
+
+def get_worker_count():
+    """Return the number of worker processes to work out groups in, which
+    is 0 if worker processes can't be used.
+
+    One cpu is left for the ui, and there are never more workers than items
+    that a DiffGroupsPipeline reads ahead.
+    """
+    if multiprocessing is None or sys.platform == 'win32':
+        # On Windows, worker processes start by running the main script
+        # again, and bzr.exe, or plugins loaded from the plugin path, can't
+        # be imported that way.
+        return 0
+    try:
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+    return min(max(cpus - 1, 1), DiffGroupsPipeline.lookahead)
+
+
+_pool = None
+
+_closed_generations = None
+"""Array shared with the workers. When a DiffGroupsPipeline is closed, its
+generation is put in it, at generation % its length, so that the workers
+skip the jobs of the pipeline that they have not started yet."""
+
+_generations = itertools.count(1)
+
+
+def get_pool(processes):
+    """Return the pool of worker processes that is shared by all the
+    DiffGroupsPipelines of this process.
+
+    The workers are started the first time this is called, with processes
+    workers, rather than for each diff window, and are stopped when the
+    process exits. They are forked from the process as it is then, which is
+    the ui process, with Qt loaded, but they only run difference_groups.
+    """
+    global _pool, _closed_generations
+    if _pool is None:
+        _closed_generations = multiprocessing.RawArray('l', 256)
+        _pool = multiprocessing.Pool(processes, _init_worker,
+                                     (_closed_generations,))
+        atexit.register(_close_pool)
+    return _pool
+
+
+def _init_worker(closed_generations):
+    global _closed_generations
+    _closed_generations = closed_generations
+
+
+def _close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.terminate()
+        _pool.join()
+        _pool = None
+
+
+class DiffGroupsPipeline(object):
+    """Work out the groups of DiffItems ahead of when they are shown.
+
+    The lines of the items are read in the thread that iterates over the
+    pipeline, as the trees can't be used from other threads. The groups of
+    files with at least min_parallel_lines lines are worked out in the pool
+    of worker processes from get_pool, while the items before them are
+    shown. The items are
+    yielded in order, and their groups for complete and ignore_whitespace
+    have been worked out by then, or are quick to work out.
+    """
+
+    lookahead = 16
+    """Maximum number of items that are read before they are yielded."""
+
+    min_parallel_lines = 2000
+    """Files with fewer lines than this are not worth sending to a worker
+    process."""
+
+    wait_interval = 0.05
+    """Seconds between calls to update_ui while waiting for a worker."""
+
+    def __init__(self, items, complete, ignore_whitespace, update_ui=None,
+                 processes=None, algorithm=None):
+        """
+        :param items: Iterable of DiffItems.
+        :param algorithm: Passed to difference_groups.
+        :param update_ui: Called while waiting for worker processes.
+        :param processes: Number of worker processes, which defaults to
+            what get_worker_count returns. If 0, the groups are worked out
+            when they are asked for.
+        """
+        self.items = items
+        self.complete = complete
+        self.ignore_whitespace = ignore_whitespace
+        self.algorithm = algorithm
+        self.update_ui = update_ui
+        if processes is None:
+            processes = get_worker_count()
+        self.processes = processes
+        self.pool = None
+        self.generation = None
+
+    def start(self, di):
+        """Start working out the groups of an item in a worker process, if
+        it is worth it.
+
+        :return: The AsyncResult for the groups, or None.
+        """
+        if (not self.processes or
+            not di.needs_difference_groups(self.complete,
+                                           self.ignore_whitespace)):
+            return None
+        lines = di.lines
+        if len(lines[0]) + len(lines[1]) < self.min_parallel_lines:
+            return None
+        if self.pool is None:
+            self.pool = get_pool(self.processes)
+            self.generation = _generations.next()
+        return self.pool.apply_async(
+            _difference_groups,
+            ((self.generation, lines, self.complete, self.ignore_whitespace,
+              self.algorithm),))
+
+    def close(self):
+        """Skip the jobs of this pipeline that the workers have not started.
+
+        The pool is shared, so it is left running for the next pipeline.
+        """
+        if self.pool is not None:
+            _closed_generations[self.generation % len(_closed_generations)] = \
+                self.generation
+            self.pool = None
+
+    def __iter__(self):
+        items = iter(self.items)
+        pending = deque()
+
+        def read_next():
+            if len(pending) >= self.lookahead:
+                return False
+            try:
+                di = items.next()
+            except StopIteration:
+                return False
+            pending.append((di, self.start(di)))
+            return True
+
+        try:
+            while pending or read_next():
+                di, result = pending[0]
+                while result is not None and not result.ready():
+                    # Keep the workers busy with the items after this one.
+                    if not read_next():
+                        result.wait(self.wait_interval)
+                    if self.update_ui:
+                        self.update_ui()
+                pending.popleft()
+                if result is not None:
+                    di.set_groups(self.complete, self.ignore_whitespace,
+                                  result.get())
+                # Start on the next item before this one is shown.
+                read_next()
+                yield di
+        finally:
+            self.close()
@@ -390,6 +390,11 @@ def setup_guidebar_entries(gb):
 class _SidebySideDiffView(QtGui.QSplitter):
     """Widget to show differences in side-by-side format."""
 
+    max_formatted_lines = 10000
+    """Diffs that show more lines than this, of both files, are shown without syntax highlighting,
+    or highlighting of the changes within lines, as they need a text format
+    for each token, which takes a lot of time and memory."""
+
     def __init__(self, parent=None):
         QtGui.QSplitter.__init__(self, QtCore.Qt.Horizontal, parent)
         self.setHandleWidth(30)
@@ -546,7 +551,14 @@ class _SidebySideDiffView(QtGui.QSplitter):
                 return lines
             
             lines = [fix_last_line(l) for l in lines]
-            if have_pygments:
+            # Count the lines that are shown, which unless the complete
+            # files are shown, is less than the lines of the files.
+            shown_lines = 0
+            for group in groups:
+                for tag, i0, i1, j0, j1 in group:
+                    shown_lines += (i1 - i0) + (j1 - j0)
+            plain = shown_lines > self.max_formatted_lines
+            if have_pygments and not plain:
                 use_pygments = True
                 try:
                     def getTokens(p, d, path):
@@ -580,10 +592,18 @@ class _SidebySideDiffView(QtGui.QSplitter):
                 else:
                     cursor.insertText(line)
             
+            def insertLines(cursor, ls):
+                if use_pygments:
+                    for l in ls:
+                        insertLine(cursor, l)
+                elif ls:
+                    # One insert for all the lines is a lot quicker than one
+                    # for each line.
+                    cursor.insertText("".join(ls))
+            
             def insertIxs(ixs):
                 for cursor, line, ix in zip(cursors, display_lines, ixs):
-                    for l in line[ix[0]:ix[1]]:
-                        insertLine(cursor, l)
+                    insertLines(cursor, line[ix[0]:ix[1]])
             
             def modifyFormatForTag (format, tag):
                 if tag == "replace":
@@ -665,7 +685,7 @@ class _SidebySideDiffView(QtGui.QSplitter):
                     else:
                         y_top = [cursor.block().layout() for cursor in self.cursors]
                         g_top = [cursor.block().blockNumber() for cursor in self.cursors]
-                        if tag == "replace":
+                        if tag == "replace" and not plain:
                             insertIxsWithChangesHighlighted(ixs)
                         else:
                             insertIxs(ixs)
@@ -692,8 +712,7 @@ class _SidebySideDiffView(QtGui.QSplitter):
                         exlines = display_lines[1][j0:j1]
                         linediff = linediff - len(exlines)
                         cursor = cursors[1]
-                    for l in exlines:
-                        insertLine(cursor, l)
+                    insertLines(cursor, exlines)
 
                 if i % 100 == 0:
                     QtCore.QCoreApplication.processEvents()
@@ -821,6 +840,18 @@ class SimpleDiffView(GuideBarPanel):
 class _SimpleDiffView(QtGui.QTextBrowser):
     """Widget to show differences in unidiff format."""
 
+    chunk_lines = 1000
+    """Maximum number of lines that are joined into one string to insert."""
+
+    commit_lines = 20000
+    """Number of lines after which the document is updated, and shown, while
+    a file is being added."""
+
+    max_formatted_lines = 50000
+    """Diffs that show more lines than this are shown in one text format,
+    without the colors of the deleted and inserted lines, so that the
+    document does not need a fragment for each change."""
+
     def __init__(self, parent=None):
         QtGui.QTextBrowser.__init__(self, parent)
         self.doc = QtGui.QTextDocument(parent)
@@ -930,23 +961,56 @@ class _SimpleDiffView(QtGui.QTextBrowser):
             a = fix_last_line(lines[0])
             b = fix_last_line(lines[1])
 
+            # Count the lines that are shown, which for a diff of the
+            # changes is less than the lines of the files.
+            shown_lines = 0
+            for group in groups:
+                for tag, i0, i1, j0, j1 in group:
+                    if tag == "equal":
+                        shown_lines += i1 - i0
+                    else:
+                        shown_lines += (i1 - i0) + (j1 - j0)
+            if shown_lines > self.max_formatted_lines:
+                equal_format = delete_format = insert_format = \
+                        hunk_format = self.monospacedFormat
+            else:
+                equal_format = self.monospacedFormat
+                delete_format = self.monospacedDeleteFormat
+                insert_format = self.monospacedInsertFormat
+                hunk_format = self.monospacedHunkFormat
+
+            # The lines are inserted a chunk at a time, rather than joining
+            # all the lines of an opcode into one string, and the edit block
+            # is ended from time to time, so that big files are shown as they
+            # are added.
+            uncommitted = [0]
+            def insert_lines(prefix, lines, start, end, format):
+                for offset in xrange(start, end, self.chunk_lines):
+                    chunk_end = min(offset + self.chunk_lines, end)
+                    self.cursor.insertText(
+                        "".join([prefix + l for l in lines[offset:chunk_end]]),
+                        format)
+                    uncommitted[0] += chunk_end - offset
+                    if uncommitted[0] >= self.commit_lines:
+                        uncommitted[0] = 0
+                        self.cursor.endEditBlock()
+                        QtCore.QCoreApplication.processEvents()
+                        self.cursor.beginEditBlock()
+
             for i, group in enumerate(groups):
                 if group:
                     i0, i1, j0, j1 = \
                             group[0][1], group[-1][2], group[0][3], group[-1][4]
                     self.cursor.insertText(
                         "@@ -%d,%d +%d,%d @@\n" % (i0+1, i1-i0, j0+1, j1-j0),
-                        self.monospacedHunkFormat)
+                        hunk_format)
                 for tag, i0, i1, j0, j1 in group:
                     if tag == "equal":
-                        text = "".join(" " + l for l in a[i0:i1])
-                        self.cursor.insertText(text, self.monospacedFormat)
+                        insert_lines(" ", a, i0, i1, equal_format)
                     else:
                         start = self.cursor.block().blockNumber()
-                        text = "".join("-" + l for l in a[i0:i1])
-                        self.cursor.insertText(text, self.monospacedDeleteFormat)
-                        text = "".join("+" + l for l in b[j0:j1])
-                        self.cursor.insertText(text, self.monospacedInsertFormat)
+                        insert_lines("-", a, i0, i1, delete_format)
+                        insert_lines("+", b, j0, j1, insert_format)
                         end = self.cursor.block().blockNumber()
                         guidebar_data[tag].append((start, end - start))
         else:
@@ -46,7 +46,9 @@ from bzrlib.plugins.qbzr.lib.diff import (
     ExtDiffMenu,
     DiffItem,
     ExtDiffContext,
+    diff_algorithm,
     )
+from bzrlib.plugins.qbzr.lib.diffgroups import DiffGroupsPipeline
 
 from bzrlib.plugins.qbzr.lib.i18n import gettext, ngettext, N_
 from bzrlib.plugins.qbzr.lib.util import (
@@ -429,11 +431,16 @@ class DiffWindow(QBzrWindow):
         
         try:
             no_changes = True   # if there is no changes found we need to inform the user
-            for di in DiffItem.iter_items(self.trees,
-                                          specific_files=self.specific_files,
-                                          filter=self.filter_options.check,
-                                          lock_trees=True):
-                lines = di.lines
+            # The groups of big files are worked out in worker processes,
+            # while the files before them are shown.
+            items = DiffItem.iter_items(self.trees,
+                                        specific_files=self.specific_files,
+                                        filter=self.filter_options.check,
+                                        lock_trees=True)
+            for di in DiffGroupsPipeline(items, self.complete,
+                                         self.ignore_whitespace,
+                                         self.processEvents,
+                                         algorithm=diff_algorithm):
                 self.processEvents()
                 groups = di.groups(self.complete, self.ignore_whitespace)
                 self.processEvents()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Helpers for the caches that QBzr keeps on disk.
+
+Caches live in the ``qbzr-cache`` directory of the bazaar configuration
+directory. Each kind of cache gets its own sub directory, and keeps one file
+per repository (or set of repositories), named after a hash of the repository
+urls.
+
+Cache files are only ever a speed up. Anything that goes wrong while reading
+or writing them is logged, and treated as if there was no cache.
+"""
+
+import marshal
+import os
+import zlib
+
+from bzrlib import osutils, trace
+from bzrlib.config import config_dir
+
+
+def get_cache_dir(kind):
+    """Return the directory for the cache of the given kind, creating it if
+    needed."""
+    path = osutils.pathjoin(config_dir(), 'qbzr-cache', kind)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def get_repos_cache_filename(kind, repos):
+    """Return the filename of the cache file of the given kind for repos.
+
+    :param repos: A repository, or a list of repositories.
+    """
+    if not isinstance(repos, (list, tuple)):
+        repos = [repos]
+    key = '\n'.join(sorted([repo.base for repo in repos]))
+    return osutils.pathjoin(get_cache_dir(kind), osutils.sha_string(key))
+
+
+def read_cache_file(filename, format):
+    """Read data written with `write_cache_file`.
+
+    :return: The data, or None if the file does not exist, is corrupt, or was
+        written with a different format.
+    """
+    try:
+        f = open(filename, 'rb')
+        try:
+            content = f.read()
+        finally:
+            f.close()
+    except (IOError, OSError):
+        return None
+    try:
+        file_format, data = marshal.loads(zlib.decompress(content))
+    except (ValueError, EOFError, TypeError, zlib.error):
+        trace.mutter('qbzr: ignoring corrupt cache file %s' % filename)
+        return None
+    if file_format != format:
+        return None
+    return data
+
+
+def write_cache_file(filename, format, data):
+    """Write data, which must be marshalable, to a cache file.
+
+    The file is replaced atomically, so readers never see a partial file.
+    """
+    content = zlib.compress(marshal.dumps((format, data)), 1)
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    try:
+        f = open(tmp_filename, 'wb')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+        osutils.rename(tmp_filename, filename)
+    except (IOError, OSError), e:
+        trace.mutter('qbzr: could not write cache file %s: %s'
+                     % (filename, e))
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
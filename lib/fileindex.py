@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Index of the files that each revision of a repository touches.
+
+A revision touches a file if it introduces a new text of the file, and it
+touches a directory if it touches the directory itself, or anything in it.
+This lets qlog show the log of a file or directory without checking each
+revision in the repository. The index is a sqlite database in the ``files``
+cache directory, and is added to as revisions are needed.
+"""
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from bzrlib import errors, trace
+
+
+def get_touched_file_ids(repo, revids):
+    """Return the file ids that each revision in revids touches.
+
+    The repository must be locked.
+
+    :return: A dict of revid to a set of file ids, which includes the
+        directories that contain the files that the revision changed.
+    """
+    revid_file_ids = dict([(revid, set()) for revid in revids])
+    altered = repo.fileids_altered_by_revision_ids(revids)
+    for file_id, file_revids in altered.iteritems():
+        for revid in file_revids:
+            if revid in revid_file_ids:
+                revid_file_ids[revid].add(file_id)
+
+    for inv in repo.iter_inventories(revids):
+        file_ids = revid_file_ids[inv.revision_id]
+        for file_id in list(file_ids):
+            try:
+                parent_id = inv[file_id].parent_id
+                # Stop at a directory that is already there, as the
+                # directories that contain it are there too, or will be
+                # added when we get to it.
+                while parent_id is not None and parent_id not in file_ids:
+                    file_ids.add(parent_id)
+                    parent_id = inv[parent_id].parent_id
+            except errors.NoSuchId:
+                pass
+    return revid_file_ids
+
+
+class FileRevisionsIndex(object):
+    """Index of the files that each revision of a repository touches.
+
+    If sqlite is not available, or anything goes wrong with the database,
+    the index is marked as broken, and can't be used.
+    """
+
+    query_batch_size = 500
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._conn = None
+        self._indexed_revids = None
+        self.broken = sqlite3 is None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.filename)
+            conn.text_factory = str
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS revisions (
+                    revid TEXT PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS touched (
+                    file_id TEXT, revid TEXT);
+                CREATE INDEX IF NOT EXISTS touched_file_id
+                    ON touched (file_id);
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def _error(self, e):
+        trace.mutter('qbzr: file index %s disabled: %s'
+                     % (self.filename, e))
+        self.broken = True
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def get_indexed_revids(self):
+        """Return the set of revids that have been indexed."""
+        if self._indexed_revids is None:
+            self._indexed_revids = set()
+            if not self.broken:
+                try:
+                    self._indexed_revids.update([revid for (revid,) in
+                        self._connect().execute(
+                            'SELECT revid FROM revisions')])
+                except sqlite3.Error, e:
+                    self._error(e)
+        return self._indexed_revids
+
+    def get_unindexed_revids(self, revids):
+        """Return the revids in revids that have not been indexed."""
+        indexed_revids = self.get_indexed_revids()
+        return [revid for revid in revids if revid not in indexed_revids]
+
+    def add_revisions(self, repo, revids):
+        """Work out which files the revisions touch, and add them to the
+        index.
+
+        The repository must be locked.
+
+        :return: What get_touched_file_ids returns for the revisions.
+        """
+        revid_file_ids = get_touched_file_ids(repo, revids)
+        self.add_touched_file_ids(revid_file_ids)
+        return revid_file_ids
+
+    def add_touched_file_ids(self, revid_file_ids):
+        """Add what get_touched_file_ids returned to the index."""
+        if self.broken:
+            return
+        indexed_revids = self.get_indexed_revids()
+        try:
+            conn = self._connect()
+            for revid, file_ids in revid_file_ids.iteritems():
+                if revid in indexed_revids:
+                    continue
+                indexed_revids.add(revid)
+                cursor = conn.execute('INSERT OR IGNORE INTO revisions '
+                                      '(revid) VALUES (?)', (revid,))
+                if cursor.rowcount == 0:
+                    # Another process has indexed it.
+                    continue
+                conn.executemany('INSERT INTO touched (file_id, revid) '
+                                 'VALUES (?, ?)',
+                                 [(file_id, revid) for file_id in file_ids])
+            conn.commit()
+        except sqlite3.Error, e:
+            self._error(e)
+
+    def get_touching_revids(self, file_ids):
+        """Return the set of indexed revids that touch any of file_ids, or
+        None if the index is broken."""
+        if self.broken:
+            return None
+        revids = set()
+        file_ids = list(file_ids)
+        try:
+            conn = self._connect()
+            for offset in xrange(0, len(file_ids), self.query_batch_size):
+                batch = file_ids[offset:offset + self.query_batch_size]
+                revids.update([revid for (revid,) in conn.execute(
+                    'SELECT revid FROM touched WHERE file_id IN (%s)'
+                    % ','.join(['?'] * len(batch)), batch)])
+        except sqlite3.Error, e:
+            self._error(e)
+            return None
+        return revids
@@ -18,25 +18,79 @@
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 #import weakref
-from time import clock
+from time import clock, time
 
 from PyQt4 import QtCore
 
 from bzrlib.transport.local import LocalTransport
 from bzrlib.repository import Repository
 from bzrlib.remote import RemoteRepository
+from bzrlib.plugins.qbzr.lib import diskcache
+from bzrlib.plugins.qbzr.lib.revisionmetadata import (
+    RevisionDiskCache,
+    RevisionMetadataStore,
+    )
 from bzrlib.plugins.qbzr.lib.uifactory import current_throbber
+from bzrlib.plugins.qbzr.lib.util import get_qbzr_config
 
-cached_revisions = {} #weakref.WeakValueDictionary()
+cached_revisions = RevisionMetadataStore()
 """Global cache of revisions."""
 
+_revision_disk_caches = {}
+
+def get_revision_disk_cache(repo):
+    """Return the on disk cache of revisions for a repository, or None if
+    the cache is turned off with the revision_cache option."""
+    config = get_qbzr_config()
+    if config.get_option_as_bool('revision_cache') == False:
+        return None
+    try:
+        filename = diskcache.get_repos_cache_filename('revisions', repo)
+    except (IOError, OSError):
+        return None
+    if filename not in _revision_disk_caches:
+        max_revisions = None
+        try:
+            max_revisions = int(config.get_option('revision_cache_size'))
+        except (TypeError, ValueError):
+            pass
+        _revision_disk_caches[filename] = RevisionDiskCache(filename,
+                                                            max_revisions)
+    return _revision_disk_caches[filename]
+
+target_batch_time = 0.25
+"""How long, in seconds, loading a batch of revisions should take. Batches
+are made bigger or smaller to get close to this, so that the ui can be updated
+between batches without too many round trips."""
+
+max_batch_size = 500
+
+_batch_sizes = {}
+"""Batch size that worked for each repository, by repository base."""
+
+def adapt_batch_size(batch_size, batch_len, batch_time):
+    """Return the batch size to use for the next batch, after batch_len
+    revisions took batch_time seconds to load."""
+    if batch_time > target_batch_time:
+        return max(batch_size // 2, 1)
+    if batch_time < target_batch_time / 2 and batch_len >= batch_size:
+        return min(batch_size * 2, max_batch_size)
+    return batch_size
+
 def load_revisions(revids, repo,
                    time_before_first_ui_update = 0.5,
                    local_batch_size = 30,
                    remote_batch_size = 5,
                    before_batch_load = None,
                    revisions_loaded = None,
-                   pass_prev_loaded_rev = False):
+                   pass_prev_loaded_rev = False,
+                   with_messages = False):
+    """Load revisions, from cached_revisions, or from the repository.
+    
+    Messages are only kept for some of the revisions in cached_revisions, so
+    if the full messages are needed, pass with_messages=True, which loads
+    the revisions whose message was dropped again.
+    """
     
     start_time = clock()
     showed_throbber = False
@@ -45,15 +99,13 @@ def load_revisions(revids, repo,
     throbber = current_throbber()
     
     try:
-        for revid in [revid for revid in revids
-                      if revid in cached_revisions]:
-            return_revisions[revid] = cached_revisions[revid]
+        return_revisions, revids = cached_revisions.lookup(
+            revids, with_messages=with_messages)
         if pass_prev_loaded_rev:
             if revisions_loaded is not None:
                 revisions_loaded(return_revisions, False)
         
         revs_loaded = {}
-        revids = [revid for revid in revids if revid not in cached_revisions]
         if revids:
             if isinstance(repo, Repository) or isinstance(repo, RemoteRepository):
                 repo_revids=((repo, revids),)
@@ -64,8 +116,22 @@ def load_revisions(revids, repo,
                 repo_is_local = isinstance(repo.bzrdir.transport, LocalTransport)
                 if repo_is_local:
                     batch_size = local_batch_size
+                    disk_cache = None
                 else:
                     batch_size = remote_batch_size
+                    # Loading revisions from remote repositories is slow, so
+                    # keep them on disk.
+                    disk_cache = get_revision_disk_cache(repo)
+                
+                if revids and disk_cache is not None:
+                    disk_revids = set()
+                    for rev in disk_cache.get_revisions(revids):
+                        rev = cached_revisions.add_revision(rev, repo)
+                        return_revisions[rev.revision_id] = rev
+                        revs_loaded[rev.revision_id] = rev
+                        disk_revids.add(rev.revision_id)
+                    revids = [revid for revid in revids
+                              if revid not in disk_revids]
                 
                 if revids:
                     repo.lock_read()
@@ -73,7 +139,9 @@ def load_revisions(revids, repo,
                         if not repo_is_local:
                             update_ui()
                         
-                        for offset in range(0, len(revids), batch_size):
+                        batch_size = _batch_sizes.get(repo.base, batch_size)
+                        offset = 0
+                        while offset < len(revids):
                             
                             running_time = clock() - start_time
                             
@@ -88,17 +156,25 @@ def load_revisions(revids, repo,
                                 update_ui()
                             
                             batch_revids = revids[offset:offset+batch_size]
+                            offset += len(batch_revids)
                             
                             if before_batch_load is not None:
                                 stop = before_batch_load(repo, batch_revids)
                                 if stop:
                                     break
                             
-                            for rev in repo.get_revisions(batch_revids):
-                                cached_revisions[rev.revision_id] = rev
+                            batch_start_time = time()
+                            revs = repo.get_revisions(batch_revids)
+                            batch_size = adapt_batch_size(
+                                batch_size, len(batch_revids),
+                                time() - batch_start_time)
+                            _batch_sizes[repo.base] = batch_size
+                            if disk_cache is not None:
+                                disk_cache.add_revisions(revs)
+                            for rev in revs:
+                                rev = cached_revisions.add_revision(rev, repo)
                                 return_revisions[rev.revision_id] = rev
                                 revs_loaded[rev.revision_id] = rev
-                                rev.repository = repo
                     finally:
                         repo.unlock()
             
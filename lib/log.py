@@ -80,6 +80,7 @@ class LogWindow(QBzrWindow):
     FilterSearchRole = QtCore.Qt.UserRole + 104
     FilterTagRole = QtCore.Qt.UserRole + 105
     FilterBugRole = QtCore.Qt.UserRole + 106
+    FilterCommitterRole = QtCore.Qt.UserRole + 107
 
     def __init__(self, locations=None,
                  branch=None, tree=None, specific_file_ids=None,
@@ -159,6 +160,8 @@ class LogWindow(QBzrWindow):
                                 QtCore.QVariant(self.FilterMessageRole))
         self.searchType.addItem(gettext("Authors"),
                                 QtCore.QVariant(self.FilterAuthorRole))
+        self.searchType.addItem(gettext("Committers"),
+                                QtCore.QVariant(self.FilterCommitterRole))
         self.searchType.addItem(gettext("Revision IDs"),
                                 QtCore.QVariant(self.FilterIdRole))
         self.searchType.addItem(gettext("Revision Numbers"),
@@ -178,6 +181,9 @@ class LogWindow(QBzrWindow):
                                 self.throbber,
                                 self,
                                 action_commands=True)
+        self.connect(self.log_list.log_model,
+                     QtCore.SIGNAL("loaded()"),
+                     self.log_loaded)
 
         logbox.addWidget(self.throbber)
         logbox.addWidget(self.log_list)
@@ -235,6 +241,8 @@ class LogWindow(QBzrWindow):
         self.refresh_button.setDisabled(True)
         self.throbber.show()
         self.processEvents()
+        # The log is loaded in a thread, and log_loaded is called once it is
+        # done.
         try:
             # Set window title. 
             lt = self._locations_for_title(self.locations)
@@ -252,11 +260,14 @@ class LogWindow(QBzrWindow):
             self.connect(self.log_list.selectionModel(),
                          QtCore.SIGNAL("selectionChanged(QItemSelection, QItemSelection)"),
                          self.update_selection)
-            
-            self.load_search_indexes(branches)
-        finally:
+        except:
             self.refresh_button.setDisabled(False)
             self.throbber.hide()
+            raise
+    
+    def log_loaded(self):
+        self.load_search_indexes(self.log_list.log_model.graph_viz.branches)
+        self.refresh_button.setDisabled(False)
     
     def get_branches_and_file_ids(self):
         if self.branch:
@@ -477,6 +488,8 @@ class LogWindow(QBzrWindow):
                 field = "message"
             elif role == self.FilterAuthorRole:
                 field = "author"
+            elif role == self.FilterCommitterRole:
+                field = "committer"
             elif role == self.FilterSearchRole:
                 field = "index"
             elif role == self.FilterTagRole:
@@ -33,11 +33,20 @@ Usage example
 
 """
 
+from bisect import bisect_left
+import copy
 import gc
-from itertools import izip
+import operator
+import Queue
+import sys
+import threading
+from array import array
+from itertools import imap, izip
+from time import time
 
 from bzrlib import errors
 from bzrlib.bzrdir import BzrDir
+from bzrlib.repository import Repository
 from bzrlib.transport.local import LocalTransport
 from bzrlib.revision import NULL_REVISION, CURRENT_REVISION
 from bzrlib.graph import (
@@ -47,6 +56,13 @@ from bzrlib.graph import (
     DictParentsProvider,
     )
 
+from bzrlib.plugins.qbzr.lib import diskcache
+from bzrlib.plugins.qbzr.lib.fileindex import (
+    FileRevisionsIndex,
+    get_touched_file_ids,
+    )
+from bzrlib.plugins.qbzr.lib.tagindex import TagIndex
+
 
 class BranchInfo(object):
     """Wrapper for a branch, it's working tree, if available, and a label."""
@@ -66,48 +82,320 @@ class BranchInfo(object):
         return False
 
 
+class RevisionStore(object):
+    """Columnar storage for the data of the revisions in a graph.
+    
+    Rather than having a python object, a revno tuple, and a merges list for
+    each revision, the data is kept in typed arrays, indexed by the revision
+    index. `RevisionData` objects are views on a row of the store.
+    """
+    
+    def __init__(self):
+        self.revids = []
+        self.merge_depths = array('i')
+        self.end_of_merges = array('b')
+        
+        self.revno_offsets = array('i', [0])
+        self.revno_parts = array('i')
+        """The revno of the revision with index i is
+        revno_parts[revno_offsets[i]:revno_offsets[i + 1]]"""
+        
+        self.branch_numbers = array('i')
+        """Index in branch_ids of the branch_id of each revision."""
+        self.branch_ids = []
+        self.branch_colors = []
+        self.branch_id_numbers = {}
+        
+        self.merged_by = array('i')
+        """Index of the revision that merges each revision, or -1."""
+        
+        self.merges_offsets = array('i', [0])
+        self.merges = array('i')
+        """The indexes of the revisions merged by the revision with index i
+        are merges[merges_offsets[i]:merges_offsets[i + 1]]"""
+    
+    def __len__(self):
+        return len(self.revids)
+    
+    def get_branch_number(self, branch_id):
+        number = self.branch_id_numbers.get(branch_id)
+        if number is None:
+            number = len(self.branch_ids)
+            self.branch_id_numbers[branch_id] = number
+            self.branch_ids.append(branch_id)
+            self.branch_colors.append(reduce(lambda x, y: x + y,
+                                             branch_id, 0))
+        return number
+    
+    def extend_merge_sorted(self, merge_sorted_revisions):
+        """Add revisions from merge_sort nodes."""
+        for node in merge_sorted_revisions:
+            revno = tuple(node.revno)
+            self.revids.append(node.key)
+            self.merge_depths.append(node.merge_depth)
+            self.end_of_merges.append(bool(node.end_of_merge))
+            self.revno_parts.extend(revno)
+            self.revno_offsets.append(len(self.revno_parts))
+            self.branch_numbers.append(self.get_branch_number(revno[:-1]))
+        count = len(merge_sorted_revisions)
+        self.merged_by.extend(array('i', [-1]) * count)
+        self.merges_offsets.extend(array('i', [len(self.merges)]) * count)
+    
+    def extend_mainline(self, revids, first_revno):
+        """Add mainline revisions, newest first, without merge sorting them.
+        
+        :param first_revno: The revno of the first of revids. Each revision
+            after it has a revno one less.
+        """
+        for offset, revid in enumerate(revids):
+            revno = first_revno - offset
+            self.revids.append(revid)
+            self.merge_depths.append(0)
+            self.end_of_merges.append(revno == 1)
+            self.revno_parts.append(revno)
+            self.revno_offsets.append(len(self.revno_parts))
+            self.branch_numbers.append(self.get_branch_number(()))
+        count = len(revids)
+        self.merged_by.extend(array('i', [-1]) * count)
+        self.merges_offsets.extend(array('i', [len(self.merges)]) * count)
+    
+    def set_merges(self, merge_indexes, merged_indexes):
+        """Set the merges of all the revisions.
+        
+        :param merge_indexes: Array of indexes of merging revisions.
+        :param merged_indexes: Array of the indexes of the revision merged by
+            the corresponding item in merge_indexes. The merges of a revision
+            are kept in the order given.
+        """
+        offsets = array('i', [0]) * (len(self) + 1)
+        for index in merge_indexes:
+            offsets[index + 1] += 1
+        for index in xrange(len(self)):
+            offsets[index + 1] += offsets[index]
+        
+        positions = array('i', offsets)
+        merges = array('i', [0]) * len(merged_indexes)
+        for index, merged_index in izip(merge_indexes, merged_indexes):
+            merges[positions[index]] = merged_index
+            positions[index] += 1
+        
+        self.merges_offsets = offsets
+        self.merges = merges
+    
+    def iter_revnos(self):
+        """Return an iterator of the revno of each revision, by index."""
+        parts = self.revno_parts
+        offsets = self.revno_offsets
+        for index in xrange(len(self)):
+            yield tuple(parts[offsets[index]:offsets[index + 1]])
+    
+    def get_max_mainline_revno(self):
+        """Return the biggest first part of the revnos, or 0."""
+        parts = self.revno_parts
+        return max([parts[offset] for offset in self.revno_offsets[:-1]]
+                   or [0])
+    
+    def prepend(self, other):
+        """Insert the revisions of another store before the revisions of
+        this store.
+        
+        The indexes of the revisions in this store are increased by the
+        number of revisions in other. The indexes in other must already take
+        this into account.
+        """
+        count = len(other)
+        
+        def shift(values, increment):
+            return array('i', [value + increment for value in values])
+        
+        self.revids[0:0] = other.revids
+        self.merge_depths = other.merge_depths + self.merge_depths
+        self.end_of_merges = other.end_of_merges + self.end_of_merges
+        
+        self.revno_offsets = (other.revno_offsets[:-1] +
+                              shift(self.revno_offsets,
+                                    len(other.revno_parts)))
+        self.revno_parts = other.revno_parts + self.revno_parts
+        
+        numbers = [self.get_branch_number(branch_id)
+                   for branch_id in other.branch_ids]
+        self.branch_numbers = (array('i', [numbers[number] for number
+                                           in other.branch_numbers]) +
+                               self.branch_numbers)
+        
+        merged_by = array('i', self.merged_by)
+        for index, value in enumerate(merged_by):
+            if value != -1:
+                merged_by[index] = value + count
+        self.merged_by = other.merged_by + merged_by
+        
+        self.merges_offsets = (other.merges_offsets[:-1] +
+                               shift(self.merges_offsets, len(other.merges)))
+        self.merges = other.merges + shift(self.merges, count)
+
+
 class RevisionData(object):
     """
     Container for data for a revision in the graph that gets calculated
     when the graph is loaded.
+    
+    The data is stored in a `RevisionStore`. This is just a view on it.
     """
     
     # Instance of this object are typically named "rev".
     
-    __slots__ = ["index", "_merge_sort_node", "branch", "_revno_str",
-                 "merges", "merged_by", 'branch_id', 'color']
+    __slots__ = ["index", "_store"]
     
-    def __init__(self, index, merge_sort_node):
+    def __init__(self, store, index):
         """Create a new RevisionData instance."""
+        self._store = store
         self.index = index
-        self._merge_sort_node = merge_sort_node
-        self.branch = None
-        self._revno_str = None
-        self.merges = []
+    
+    revid = property(lambda self: self._store.revids[self.index])
+    merge_depth = property(lambda self: self._store.merge_depths[self.index])
+    end_of_merge = property(
+        lambda self: bool(self._store.end_of_merges[self.index]))
+    
+    def get_revno_sequence(self):
+        offsets = self._store.revno_offsets
+        return tuple(self._store.revno_parts[offsets[self.index]:
+                                             offsets[self.index + 1]])
+    revno_sequence = property(get_revno_sequence)
+    
+    branch_id = property(lambda self: self._store.branch_ids[
+        self._store.branch_numbers[self.index]])
+    color = property(lambda self: self._store.branch_colors[
+        self._store.branch_numbers[self.index]])
+    
+    def get_merges(self):
         """Revision indexes that this revision merges"""
-        self.merged_by = None
+        offsets = self._store.merges_offsets
+        return list(self._store.merges[offsets[self.index]:
+                                       offsets[self.index + 1]])
+    merges = property(get_merges)
+    
+    def get_merged_by(self):
         """Revision index that merges this revision."""
-        self.branch_id = self._merge_sort_node.revno[0:-1]
-        self.color = reduce(lambda x, y: x + y, self.branch_id, 0)
+        merged_by = self._store.merged_by[self.index]
+        if merged_by == -1:
+            return None
+        return merged_by
     
-    revid = property(lambda self: self._merge_sort_node.key)
-    merge_depth = property(lambda self: self._merge_sort_node.merge_depth)
-    revno_sequence = property(lambda self: self._merge_sort_node.revno)
-    end_of_merge = property(lambda self: self._merge_sort_node.end_of_merge)
+    def set_merged_by(self, merged_by):
+        if merged_by is None:
+            merged_by = -1
+        self._store.merged_by[self.index] = merged_by
+    merged_by = property(get_merged_by, set_merged_by)
     
     def get_revno_str(self):
-        if self._revno_str is None:
-            self._revno_str = ".".join(["%d" % (revno)
-                                for revno in self.revno_sequence])
-            if self.revid.startswith(CURRENT_REVISION):
-                self._revno_str += " ?"
-        return self._revno_str
+        revno_str = ".".join(["%d" % (revno)
+                              for revno in self.revno_sequence])
+        if self.revid.startswith(CURRENT_REVISION):
+            revno_str += " ?"
+        return revno_str
     revno_str = property(get_revno_str)
     
     def __repr__(self):
         return "%s <%s %s>" % (self.__class__.__name__, self.revno_str,
                               self.revid)
 
+class RevisionList(object):
+    """Sequence of the `RevisionData` of the revisions in a `RevisionStore`,
+    by index.
+    
+    The RevisionData for a revision is only created when it is first asked
+    for, and the same object is returned after that.
+    """
+    
+    def __init__(self, store):
+        self._store = store
+        self._revs = [None] * len(store)
+    
+    def __len__(self):
+        return len(self._revs)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self._revs)))]
+        rev = self._revs[index]
+        if rev is None:
+            if index < 0:
+                index += len(self._revs)
+            rev = RevisionData(self._store, index)
+            self._revs[index] = rev
+        return rev
+    
+    def __iter__(self):
+        revs = self._revs
+        store = self._store
+        for index in xrange(len(revs)):
+            rev = revs[index]
+            if rev is None:
+                rev = RevisionData(store, index)
+                revs[index] = rev
+            yield rev
+    
+    def prepend(self, new_revs):
+        """Insert new_revs before the revisions we have, and increase the
+        index of those by the number of new_revs.
+        
+        The store must already have the new revisions.
+        """
+        new_count = len(new_revs)
+        for rev in self._revs:
+            if rev is not None:
+                rev.index += new_count
+        for rev in new_revs:
+            rev._store = self._store
+        self._revs[0:0] = new_revs
+
+
+class RevisionMap(object):
+    """Dict like map of a key, such as the revid, of the revisions in a
+    `RevisionList` to their `RevisionData`.
+    
+    The map of keys to revision indexes is built in one go, the first time
+    it is needed, from get_keys, which must return the key of each revision,
+    by index.
+    """
+    
+    def __init__(self, revisions, get_keys):
+        self.revisions = revisions
+        self.get_keys = get_keys
+        self._key_index = None
+    
+    def get_key_index(self):
+        """Return a dict of key to revision index."""
+        if self._key_index is None:
+            key_index = {}
+            for index, key in enumerate(self.get_keys()):
+                key_index[key] = index
+            self._key_index = key_index
+        return self._key_index
+    
+    def invalidate(self):
+        """Forget the map, because revisions were added."""
+        self._key_index = None
+    
+    def __len__(self):
+        return len(self.get_key_index())
+    
+    def __iter__(self):
+        return iter(self.get_key_index())
+    
+    def __contains__(self, key):
+        return key in self.get_key_index()
+    
+    def __getitem__(self, key):
+        return self.revisions[self.get_key_index()[key]]
+    
+    def get(self, key, default=None):
+        index = self.get_key_index().get(key)
+        if index is None:
+            return default
+        return self.revisions[index]
+
+
 class BranchLine(object):
     """Container for data for a branch line, aka merge line."""
     
@@ -125,6 +413,150 @@ class BranchLine(object):
         return "%s <%s>" % (self.__class__.__name__, self.branch_id)
 
 
+class GraphCache(object):
+    """On disk cache of the revision graph, and of it's merge_sort.
+    
+    Revisions are immutable, so the parents of a revision never go stale, and
+    the cached parents can be used to answer iter_ancestry for all the
+    revisions that were loaded before. Only the ancestry of new heads has to
+    be loaded from the repositories.
+    
+    The merge_sort depends on the heads it was computed for, so it is only
+    reused if the heads have not changed.
+    """
+    
+    format = 'qbzr graph cache 1'
+    
+    def __init__(self, filename):
+        self.filename = filename
+        
+        self.parents = {}
+        """Dict of revid -> parent revids, for all cached revisions."""
+        
+        self.heads = None
+        """Heads that the cached merge_sort was computed for."""
+        
+        self.revids = []
+        """Cached revids, in merge_sort order."""
+        
+        self.merge_depths = None
+        self.end_of_merges = None
+        self.revno_lens = None
+        self.revno_parts = None
+    
+    def load(self):
+        data = diskcache.read_cache_file(self.filename, self.format)
+        if data is None:
+            return
+        (heads, revids, parent_counts, parent_indexes, merge_depths,
+         end_of_merges, revno_lens, revno_parts) = data
+        
+        def to_array(typecode, s):
+            a = array(typecode)
+            a.fromstring(s)
+            return a
+        
+        parent_counts = to_array('i', parent_counts)
+        parent_indexes = to_array('i', parent_indexes)
+        
+        parents = {}
+        pos = 0
+        for revid, count in izip(revids, parent_counts):
+            if count < 0:
+                # Ghosts, and revisions that may change, are not cached.
+                continue
+            parents[revid] = tuple([revids[parent_index] for parent_index
+                                    in parent_indexes[pos:pos + count]])
+            pos += count
+        
+        self.parents = parents
+        self.heads = heads
+        self.revids = revids
+        self.merge_depths = to_array('i', merge_depths)
+        self.end_of_merges = to_array('b', end_of_merges)
+        self.revno_lens = to_array('b', revno_lens)
+        self.revno_parts = to_array('i', revno_parts)
+    
+    def get_store(self, heads, graph_parents):
+        """Return a RevisionStore with the cached merge_sort if it is valid
+        for heads and graph_parents, else None.
+        
+        graph_parents must not include the 'top:' node.
+        """
+        if (self.heads is None or heads is None or
+            tuple(heads) != self.heads or
+            len(graph_parents) != len(self.revids)):
+            return None
+        
+        store = RevisionStore()
+        store.revids = self.revids
+        store.merge_depths = self.merge_depths
+        store.end_of_merges = self.end_of_merges
+        store.revno_parts = self.revno_parts
+        count = len(self.revids)
+        
+        revno_offsets = array('i', [0]) * (count + 1)
+        branch_numbers = array('i', [0]) * count
+        pos = 0
+        for index, revno_len in enumerate(self.revno_lens):
+            branch_id = tuple(self.revno_parts[pos:pos + revno_len - 1])
+            branch_numbers[index] = store.get_branch_number(branch_id)
+            pos += revno_len
+            revno_offsets[index + 1] = pos
+        store.revno_offsets = revno_offsets
+        store.branch_numbers = branch_numbers
+        
+        store.merged_by = array('i', [-1]) * count
+        store.merges_offsets = array('i', [0]) * (count + 1)
+        return store
+    
+    def save(self, heads, graph_parents, merge_sorted, uncachable):
+        """Save the graph and it's merge_sort to disk.
+        
+        :param heads: Heads the merge_sort was computed for, or None if the
+            merge_sort should not be reused.
+        :param graph_parents: Dict of revid -> parents. Must not include the
+            'top:' node.
+        :param merge_sorted: merge_sort nodes for graph_parents.
+        :param uncachable: Revids which parents must not be cached, e.g.
+            ghosts.
+        """
+        revids = [node.key for node in merge_sorted]
+        revid_index = dict(izip(revids, xrange(len(revids))))
+        
+        parent_counts = array('i')
+        parent_indexes = array('i')
+        merge_depths = array('i')
+        end_of_merges = array('b')
+        revno_lens = array('b')
+        revno_parts = array('i')
+        
+        for node in merge_sorted:
+            revid = node.key
+            parents = graph_parents.get(revid)
+            if (parents is None or revid in uncachable or
+                revid.startswith(CURRENT_REVISION) or
+                [parent for parent in parents if parent not in revid_index]):
+                parent_counts.append(-1)
+            else:
+                parent_counts.append(len(parents))
+                parent_indexes.extend([revid_index[parent]
+                                       for parent in parents])
+            merge_depths.append(node.merge_depth)
+            end_of_merges.append(bool(node.end_of_merge))
+            revno_lens.append(len(node.revno))
+            revno_parts.extend(node.revno)
+        
+        if heads is not None:
+            heads = tuple(heads)
+        
+        diskcache.write_cache_file(self.filename, self.format, (
+            heads, revids, parent_counts.tostring(),
+            parent_indexes.tostring(), merge_depths.tostring(),
+            end_of_merges.tostring(), revno_lens.tostring(),
+            revno_parts.tostring()))
+
+
 class GhostRevisionError(errors.InternalBzrError):
 
     _fmt = "{%(revision_id)s} is a ghost."
@@ -134,6 +566,38 @@ class GhostRevisionError(errors.InternalBzrError):
         self.revision_id = revision_id
 
 
+class RepoParentsProvider(object):
+    """Parents provider for a repository, that records in revid_repo that
+    the repository has the revisions that it found, if no other repository
+    was recorded for them first."""
+    
+    def __init__(self, repo, revid_repo):
+        self.repo = repo
+        self.parents_provider = repo._make_parents_provider()
+        self.revid_repo = revid_repo
+    
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, self.repo)
+    
+    def record(self, parent_map):
+        revid_repo = self.revid_repo
+        repo = self.repo
+        for revid in parent_map:
+            if revid not in revid_repo:
+                revid_repo[revid] = repo
+        return parent_map
+    
+    def get_parent_map(self, keys):
+        return self.record(self.parents_provider.get_parent_map(keys))
+    
+    def get_cached_parent_map(self, keys):
+        get_cached = getattr(self.parents_provider, 'get_cached_parent_map',
+                             None)
+        if get_cached is None:
+            return {}
+        return self.record(get_cached(keys))
+
+
 class GraphVizLoader(object):
     """
     Loads graph for branches and provides computed layout for visual
@@ -152,6 +616,10 @@ class GraphVizLoader(object):
     # revisions is filtered_revs. Revision indexes in this list are called
     # f_index.
     
+    graph_cache_enabled = False
+    """If True, the graph is cached on disk with a GraphCache, so that loading
+    the same branches again only needs to load the new revisions."""
+    
     def __init__(self, branches, primary_bi, no_graph):
         self.branches = branches
         """List of BranchInfo for each branch."""
@@ -163,6 +631,17 @@ class GraphVizLoader(object):
         """A list of repositories that revisions will be attempted to be loaded        
         from first."""
         
+        self.revid_repo = {}
+        """Dict of revid -> the repository to load the revision from.
+        
+        This is filled in by the parents providers as the graph is loaded, and
+        by get_repo_revids for revisions that are in a local_repo_copies
+        repository. Revisions that are not in it are loaded from the
+        repository of their branch."""
+        
+        self.local_copy_missing_revids = set()
+        """Revids that are not in any of local_repo_copies."""
+        
         self.revid_head_info = {}
         """Dict with a keys of head revid and value of
             (list of (branch, label),
@@ -176,13 +655,18 @@ class GraphVizLoader(object):
         
         self.ghosts = set()
         
+        self.store = RevisionStore()
         self.revisions = []
         """List of RevisionInfo from merge_sort."""
         
         self.revid_rev = {}
         self.graph_children = {}
         
-        self.tags = {}      # map revid -> tags set
+        self.tags = TagIndex()
+        """TagIndex of the tags of the branches. This is replaced with a new
+        index each time the tags are loaded."""
+        
+        self.graph_cache = None
     
     def load(self):
         # Get a unique list of repositories. If the url is the same,
@@ -219,6 +703,257 @@ class GraphVizLoader(object):
             self.unlock_branches()
     
     
+    def update(self):
+        """Add revisions that were added to the branch since `load` was
+        called, without reloading the whole graph.
+        
+        This is only possible for a single branch, which has no working tree
+        heads or pending merges, and that has only moved forward, i.e. the old
+        tip is a left hand ancestor of the new tip. New revisions are inserted
+        at the start of `revisions`, so the index of existing revisions
+        increases by the number of new revisions.
+        
+        :return: List of the new RevisionData, or None if the graph could not
+            be updated, and must be reloaded with `load`.
+        """
+        changes = self.read_update()
+        if changes is None:
+            return None
+        return self.apply_update(changes)
+    
+    def read_update(self):
+        """Read what `apply_update` needs from the branch and repositories.
+        
+        This does not change the graph, so the graph may still be used while
+        this runs in another thread.
+        
+        :return: A tuple to pass to `apply_update`, or None if the graph
+            could not be updated, and must be reloaded with `load`.
+        """
+        if len(self.branches) != 1 or len(self.revid_head_info) != 1:
+            return None
+        bi = self.branches[0]
+        old_head_revid = self.revid_head_info.keys()[0]
+        
+        # load_branch_heads records the heads that it finds, so let it do
+        # that on a copy.
+        heads = copy.copy(self)
+        heads.revid_head_info = {}
+        heads.revid_branch_info = {}
+        
+        self.lock_read_branches()
+        try:
+            load_heads, sort_heads, extra_parents = heads.load_branch_heads(bi)
+            if (len(heads.revid_head_info) != 1 or len(sort_heads) != 1 or
+                extra_parents or sort_heads[0] == NULL_REVISION):
+                return None
+            new_head_revid = sort_heads[0]
+            
+            new_graph_parents, ghosts = self.read_new_graph_parents(
+                new_head_revid)
+            tags = self.read_tags()
+        finally:
+            self.unlock_branches()
+        return (heads.revid_head_info, old_head_revid, new_head_revid,
+                new_graph_parents, ghosts, tags)
+    
+    def apply_update(self, changes):
+        """Insert the new revisions read by `read_update` into the graph.
+        
+        :return: List of the new RevisionData, or None if the graph could not
+            be updated, and must be reloaded with `load`.
+        """
+        (revid_head_info, old_head_revid, new_head_revid,
+         new_graph_parents, ghosts, tags) = changes
+        self.ghosts.update(ghosts)
+        new_revs = self.load_new_revisions(old_head_revid, new_head_revid,
+                                           new_graph_parents)
+        if new_revs is None:
+            return None
+        self.revid_head_info = revid_head_info
+        self.revid_branch_info = {}
+        self.tags = tags
+        return new_revs
+    
+    def read_new_graph_parents(self, new_head_revid):
+        """Walk the ancestry of new_head_revid, stopping at revisions that we
+        already have.
+        
+        :return: (dict of revid -> parent revids of the new revisions,
+                  set of the new ghosts)
+        """
+        graph = Graph(StackedParentsProvider(
+            [RepoParentsProvider(repo, self.revid_repo)
+             for repo in self.repos]))
+        new_graph_parents = {}
+        ghosts = set()
+        pending = set([new_head_revid])
+        while pending:
+            parent_map = graph.get_parent_map(pending)
+            next_pending = set()
+            for revid in pending:
+                parent_revids = parent_map.get(revid)
+                if parent_revids is None:
+                    # Ghost
+                    ghosts.add(revid)
+                    parent_revids = ()
+                elif parent_revids == (NULL_REVISION,):
+                    parent_revids = ()
+                new_graph_parents[revid] = parent_revids
+                for parent_revid in parent_revids:
+                    if (parent_revid not in self.revid_rev and
+                        parent_revid not in new_graph_parents):
+                        next_pending.add(parent_revid)
+            pending = next_pending
+            self.update_ui()
+        return new_graph_parents, ghosts
+    
+    def load_new_revisions(self, old_head_revid, new_head_revid,
+                           new_graph_parents):
+        """Insert the revisions between old_head_revid and new_head_revid,
+        read by `read_new_graph_parents`, into the graph.
+        
+        :return: List of the new RevisionData, or None if old_head_revid is
+            not a left hand ancestor of new_head_revid, or the new revisions
+            change the revisions that we already have. If None is returned,
+            known_graph may have been changed, so the graph must be reloaded
+            with `load`.
+        """
+        if old_head_revid == new_head_revid:
+            return []
+        
+        # Check that the old head is on the left hand ancestry of the new
+        # head.
+        revid = new_head_revid
+        while revid in new_graph_parents:
+            parent_revids = new_graph_parents[revid]
+            if not parent_revids:
+                return None
+            revid = parent_revids[0]
+        if revid != old_head_revid:
+            return None
+        
+        for revid, parent_revids in new_graph_parents.iteritems():
+            self.known_graph.add_node(revid, parent_revids)
+        # The new revisions are merge sorted before the revisions that we
+        # already have. Those keep the same revno, and merge depth. This
+        # merge sorts the whole history, as the revnos of new merged
+        # revisions depend on the branches that were merged before them.
+        merge_sorted_revisions = self.known_graph.merge_sort(new_head_revid)
+        new_count = len(new_graph_parents)
+        if merge_sorted_revisions[new_count].key != old_head_revid:
+            return None
+        new_store = RevisionStore()
+        new_store.extend_merge_sorted(merge_sorted_revisions[:new_count])
+        del merge_sorted_revisions
+        new_revs = [RevisionData(new_store, index)
+                    for index in xrange(new_count)]
+        
+        new_revid_rev = dict([(rev.revid, rev) for rev in new_revs])
+        if not self.no_graph:
+            merge_info = self.compute_new_merge_info(new_revs, new_revid_rev)
+            if merge_info is None:
+                return None
+        
+        # Only known_graph and ghosts have been changed up till now. Insert
+        # the new revisions. This shifts the revisions that we already have,
+        # which is O(n), but cheap next to the merge sort.
+        self.store.prepend(new_store)
+        self.revisions.prepend(new_revs)
+        self.revid_rev.invalidate()
+        self.revno_rev.invalidate()
+        self.max_mainline_revno = max(self.max_mainline_revno,
+                                      new_store.get_max_mainline_revno())
+        
+        if not self.no_graph:
+            self.insert_branch_lines(new_revs, merge_info)
+        return new_revs
+    
+    def compute_new_merge_info(self, new_revs, new_revid_rev):
+        """Compute merges and merged_by for new revisions, as
+        `compute_merge_info` would have.
+        
+        Revisions that we already have are not changed. Their indexes in the
+        merges of new revisions are as they will be after the new revisions
+        are inserted.
+        
+        :return: List of (branch_id, merged_by_branch_id), or None if the
+            merged_by of a revision that we already have would change.
+        """
+        new_count = len(new_revs)
+        branch_merges = []
+        merge_indexes = array('i')
+        merged_indexes = array('i')
+        
+        def set_merged_by(rev, merged_by, do_branches=False):
+            if merged_by is None:
+                return True
+            
+            if rev.revid in new_revid_rev:
+                rev.merged_by = merged_by
+                merged_indexes.append(rev.index)
+            else:
+                if rev.merged_by is None:
+                    return False
+                merged_indexes.append(rev.index + new_count)
+            merge_indexes.append(merged_by)
+            
+            if do_branches:
+                branch_merges.append((rev.branch_id,
+                                      new_revs[merged_by].branch_id))
+            return True
+        
+        for rev in new_revs:
+            parents = []
+            for parent_revid in self.known_graph.get_parent_keys(rev.revid):
+                if parent_revid in new_revid_rev:
+                    parents.append(new_revid_rev[parent_revid])
+                else:
+                    parents.append(self.revid_rev[parent_revid])
+            
+            if len(parents) > 0:
+                if rev.branch_id == parents[0].branch_id:
+                    if not set_merged_by(parents[0], rev.merged_by):
+                        return None
+            
+            for parent in parents[1:]:
+                if rev.merge_depth <= parent.merge_depth:
+                    if not set_merged_by(parent, rev.index,
+                                         do_branches=True):
+                        return None
+        
+        new_revs[0]._store.set_merges(merge_indexes, merged_indexes)
+        return branch_merges
+    
+    def insert_branch_lines(self, new_revs, branch_merges):
+        """Add new revisions to `branch_lines`.
+        
+        :param branch_merges: as returned by `compute_new_merge_info`.
+        """
+        new_branch_line_revs = {}
+        for rev in new_revs:
+            if rev.branch_id not in self.branch_lines:
+                self.branch_lines[rev.branch_id] = BranchLine(rev.branch_id)
+            branch_line = self.branch_lines[rev.branch_id]
+            new_branch_line_revs.setdefault(rev.branch_id, []).append(rev)
+            branch_line.merge_depth = max(rev.merge_depth,
+                                          branch_line.merge_depth)
+        
+        for branch_id, revs in new_branch_line_revs.iteritems():
+            self.branch_lines[branch_id].revs[0:0] = revs
+        
+        for branch_id, merged_by_branch_id in branch_merges:
+            merged_by_branch_merges = \
+                self.branch_lines[merged_by_branch_id].merges
+            branch_merged_by = self.branch_lines[branch_id].merged_by
+            if not branch_id in merged_by_branch_merges:
+                merged_by_branch_merges.append(branch_id)
+            if not merged_by_branch_id in branch_merged_by:
+                branch_merged_by.append(merged_by_branch_id)
+        
+        self.branch_ids = self.branch_lines.keys()
+        self.branch_ids.sort(key=self.branch_id_sort_key)
+    
     def load_current_dir_repo(self):
         # There are no local repositories. Try open the repository
         # of the current directory, and try load revisions data from
@@ -229,7 +964,7 @@ class GraphVizLoader(object):
         try:
             bzrdir, relpath = BzrDir.open_containing(u".")
             repo = bzrdir.find_repository()
-            self.repos.add(repo)
+            self.repos.append(repo)
             self.local_repo_copies.append(repo)
         except Exception:
             pass
@@ -264,15 +999,15 @@ class GraphVizLoader(object):
     #        repo.unlock()
     
     def load_tags(self):
-        self.tags = {}
+        self.tags = self.read_tags()
+    
+    def read_tags(self):
+        """Return a TagIndex of the tags of the branches."""
+        tags = TagIndex()
         for bi in self.branches:
             # revid to tags map
-            branch_tags = bi.branch.tags.get_reverse_tag_dict()
-            for revid, tags in branch_tags.iteritems():
-                if revid in self.tags:
-                    self.tags[revid].update(set(tags))
-                else:
-                    self.tags[revid] = set(tags)
+            tags.add_reverse_tag_dict(bi.branch.tags.get_reverse_tag_dict())
+        return tags
 
     def append_head_info(self, revid, branch_info, tag):
         if not revid == NULL_REVISION:
@@ -359,9 +1094,24 @@ class GraphVizLoader(object):
         sort_heads = [revid for load_heads_, sort_heads_ in branches_heads
                       for revid in sort_heads_]
         
-        parents_providers = [repo._make_parents_provider() \
+        self.revid_repo = {}
+        parents_providers = [RepoParentsProvider(repo, self.revid_repo)
                              for repo in self.repos]
         parents_providers.append(DictParentsProvider(extra_parents))
+        
+        if self.graph_cache_enabled:
+            try:
+                filename = diskcache.get_repos_cache_filename('graph',
+                                                              self.repos)
+            except (IOError, OSError):
+                filename = None
+            if filename is not None:
+                self.graph_cache = GraphCache(filename)
+                self.graph_cache.load()
+                # Ask the cache first, so that we only go to the repositories
+                # for revisions that we have not seen before.
+                parents_providers.insert(
+                    0, DictParentsProvider(self.graph_cache.parents))
         self.graph = Graph(StackedParentsProvider(parents_providers))
         
         return sort_heads, self.graph.iter_ancestry(sort_heads)
@@ -395,7 +1145,31 @@ class GraphVizLoader(object):
                 return KnownGraph(graph_parents)
             self.known_graph = make_kg()
             
-            merge_sorted_revisions = self.known_graph.merge_sort('top:')
+            # The parents of working tree revisions change without the revid
+            # changing, so a merge_sort with them in the heads can't be
+            # reused.
+            cache_heads = head_revids
+            for revid in head_revids:
+                if revid.startswith(CURRENT_REVISION):
+                    cache_heads = None
+            
+            del graph_parents["top:"]
+            self.store = None
+            if self.graph_cache is not None:
+                self.store = self.graph_cache.get_store(cache_heads,
+                                                        graph_parents)
+            if self.store is None:
+                merge_sorted_revisions = self.known_graph.merge_sort('top:')
+                # Get rid of the 'top:' revision
+                merge_sorted_revisions.pop(0)
+                if self.graph_cache is not None:
+                    self.graph_cache.save(cache_heads, graph_parents,
+                                          merge_sorted_revisions, self.ghosts)
+                self.store = RevisionStore()
+                self.store.extend_merge_sorted(merge_sorted_revisions)
+                del merge_sorted_revisions
+            self.graph_cache = None
+            
             # So far, we are a bit faster than the pure-python code. But the
             # last step hurts. Specifically, we take
             #   377ms KnownGraph(self.graph_parents)
@@ -425,26 +1199,19 @@ class GraphVizLoader(object):
             # self.revisions *is* a little bit slower. Probably because pyrex
             # MergeSortNodes use long integers rather than PyIntObject and thus
             # create them on-the-fly.
-
-            # Get rid of the 'top:' revision
-            merge_sorted_revisions.pop(0)
-            self.revisions = [RevisionData(index, node)
-                for index, node in enumerate(merge_sorted_revisions)]
+            # The RevisionData objects are now only created when needed, by
+            # RevisionList, and revid_rev and revno_rev are only built when
+            # first used.
             if enabled:
                 gc.enable()
         else:
-            self.revisions = ()
+            self.store = RevisionStore()
         
-        self.revid_rev = {}
-        self.revno_rev = {}
-        
-        self.max_mainline_revno = 0
-        
-        for rev in self.revisions:
-            self.max_mainline_revno = max(self.max_mainline_revno, 
-                                          rev.revno_sequence[0])
-            self.revid_rev[rev.revid] = rev
-            self.revno_rev[rev.revno_sequence] = rev
+        self.revisions = RevisionList(self.store)
+        self.revid_rev = RevisionMap(self.revisions,
+                                     lambda: self.store.revids)
+        self.revno_rev = RevisionMap(self.revisions, self.store.iter_revnos)
+        self.max_mainline_revno = self.store.get_max_mainline_revno()
         
     def branch_id_sort_key(self, x):
         merge_depth = self.branch_lines[x].merge_depth
@@ -509,22 +1276,22 @@ class GraphVizLoader(object):
             branch_line.revs.append(rev)
             branch_line.merge_depth = max(rev.merge_depth,
                                           branch_line.merge_depth)
-            rev.branch = branch_line
         
         self.branch_ids = self.branch_lines.keys()
         
         self.branch_ids.sort(key=self.branch_id_sort_key)
     
     def compute_merge_info(self):
+        merge_indexes = array('i')
+        merged_indexes = array('i')
         
-        def set_merged_by(rev, merged_by, merged_by_rev, do_branches=False):
+        def set_merged_by(rev, merged_by, do_branches=False):
             if merged_by is None:
                 return
             
-            if merged_by_rev is None:
-                merged_by_rev = self.revisions[merged_by]
             rev.merged_by = merged_by
-            merged_by_rev.merges.append(rev.index)
+            merge_indexes.append(merged_by)
+            merged_indexes.append(rev.index)
             
             if do_branches:
                 branch_id = rev.branch_id
@@ -545,22 +1312,19 @@ class GraphVizLoader(object):
             
             if len(parents) > 0:
                 if rev.branch_id == parents[0].branch_id:
-                    set_merged_by(parents[0], rev.merged_by, None)
+                    set_merged_by(parents[0], rev.merged_by)
             
             for parent in parents[1:]:
                 if rev.merge_depth <= parent.merge_depth:
-                    set_merged_by(parent, rev.index, rev, do_branches=True)
+                    set_merged_by(parent, rev.index, do_branches=True)
+        
+        self.store.set_merges(merge_indexes, merged_indexes)
         
     def compute_head_info(self):
-        def get_revid_head(heads):
-            map = {}
-            for i in xrange(len(heads)):
-                prev_revids = [revid for revid, head in heads[:i]]
-                unique_ancestors = self.graph.find_unique_ancestors(
-                    heads[i][0], prev_revids)
-                for ancestor_revid in unique_ancestors:
-                    map[ancestor_revid] = heads[i][1]
-            return map
+        # Calling graph.find_unique_ancestors for every head, against every
+        # other head, gets very slow when there are lots of branches. Rather,
+        # give each head a bit, and work out which heads each revision is an
+        # ancestor of, in one pass over the merge sorted revisions.
         
         if len(self.branches) > 1:
             head_revid_branch_info = sorted(
@@ -568,20 +1332,40 @@ class GraphVizLoader(object):
                  for revid, (head_info, ur) in self.revid_head_info.iteritems()
                  for (branch_info, tag) in head_info],
                 key=lambda x: not repo_is_local(x[1].branch.repository))
-            self.revid_branch_info = get_revid_head(head_revid_branch_info)
         else:
-            self.revid_branch_info = {}
+            head_revid_branch_info = []
         
         head_count = 0
         for head_info, ur in self.revid_head_info.itervalues():
             head_count += len(head_info)
         
+        if not head_revid_branch_info and head_count <= 1:
+            self.revid_branch_info = {}
+            return
+        
+        revid_bit = {}
+        def get_bit(revid):
+            if revid not in revid_bit:
+                revid_bit[revid] = 1 << len(revid_bit)
+            return revid_bit[revid]
+        
+        # The heads in head_revid_branch_info must get the lowest bits, in
+        # order, so that the lowest bit set for a revision is the first head
+        # that it is an ancestor of.
+        bit_branch_info = {}
+        for revid, branch_info in head_revid_branch_info:
+            bit = get_bit(revid)
+            if bit not in bit_branch_info:
+                bit_branch_info[bit] = branch_info
+        
+        heads_bits = 0
+        for revid in self.revid_head_info:
+            heads_bits |= get_bit(revid)
+        
+        merged_head_other_revid = {}
         if head_count > 1:
-            # Populate unique revisions for heads
-            for revid, (head_info, ur) in self.revid_head_info.iteritems():
-                rev = None
-                if revid in self.revid_rev:
-                    rev = self.revid_rev[revid]
+            for revid in self.revid_head_info:
+                rev = self.revid_rev.get(revid)
                 if rev and rev.merged_by:
                     # This head has been merged.
                     # d
@@ -589,22 +1373,86 @@ class GraphVizLoader(object):
                     # b c
                     # |/
                     # a
-                    # if revid == c,then we want other_revids = [b]
-                    
+                    # if revid == c,then we want other_revid = b
                     merged_by_revid = self.revisions[rev.merged_by].revid
-                    other_revids = [self.known_graph
-                                    .get_parent_keys(merged_by_revid)[0]]
-                else:
-                    other_revids = [other_revid for other_revid \
-                        in self.revid_head_info.iterkeys() \
-                        if not other_revid == revid]
+                    other_revid = self.known_graph.get_parent_keys(
+                        merged_by_revid)[0]
+                    get_bit(other_revid)
+                    merged_head_other_revid[revid] = other_revid
+        
+        rev_bits = self.compute_ancestor_bits(revid_bit)
+        
+        revids = self.store.revids
+        self.revid_branch_info = {}
+        if head_revid_branch_info:
+            for index, revid in enumerate(revids):
+                bits = rev_bits[index] & heads_bits
+                if bits:
+                    self.revid_branch_info[revid] = \
+                        bit_branch_info[bits & -bits]
+        
+        if head_count > 1:
+            # Populate unique revisions for heads
+            bit_ur = {}
+            for revid, (head_info, ur) in self.revid_head_info.iteritems():
                 ur.append(revid)
-                ur.extend([revid for revid \
-                    in self.graph.find_unique_ancestors(revid, other_revids) \
-                    if not revid == NULL_REVISION and revid in self.revid_rev])
-                ur.sort(key=lambda x: self.revid_rev[x].index)
+                if revid in merged_head_other_revid:
+                    bit = revid_bit[revid]
+                    other_bit = revid_bit[merged_head_other_revid[revid]]
+                    ur.extend([revid for index, revid in enumerate(revids)
+                               if rev_bits[index] & bit and
+                                  not rev_bits[index] & other_bit])
+                else:
+                    bit_ur[revid_bit[revid]] = ur
+            
+            if bit_ur:
+                # A revision is unique to a head if that is the only head it
+                # is an ancestor of.
+                for index, revid in enumerate(revids):
+                    ur = bit_ur.get(rev_bits[index] & heads_bits)
+                    if ur is not None:
+                        ur.append(revid)
+            
+            revid_index = self.revid_rev.get_key_index()
+            for head_info, ur in self.revid_head_info.itervalues():
+                ur.sort(key=revid_index.__getitem__)
+    
+    def compute_ancestor_bits(self, revid_bit):
+        """Work out which of the revisions in revid_bit each revision is an
+        ancestor of.
+        
+        :param revid_bit: dict of revid to a distinct bit for that revision.
+        :return: list, by revision index, of the bits of the revisions in
+            revid_bit that each revision is an ancestor of (or is).
+        """
+        revid_index = self.revid_rev.get_key_index()
+        rev_bits = [0] * len(self.revisions)
+        for revid, bit in revid_bit.iteritems():
+            index = revid_index.get(revid)
+            if index is not None:
+                rev_bits[index] |= bit
+        
+        # merge_sort puts children before their parents, so the bits for a
+        # revision are complete by the time we get to it.
+        get_parent_keys = self.known_graph.get_parent_keys
+        for index, revid in enumerate(self.store.revids):
+            bits = rev_bits[index]
+            if bits:
+                for parent_revid in get_parent_keys(revid):
+                    parent_index = revid_index.get(parent_revid)
+                    if parent_index is not None:
+                        rev_bits[parent_index] |= bits
+        return rev_bits
     
-    def compute_viz(self, state):
+    def compute_viz(self, state, lazy_lines=False):
+        """Compute the layout of the graph for the revisions that state
+        filters to.
+        
+        :param lazy_lines: If True, the columns of all the revisions are
+            computed, but the lines of each revision are only computed when
+            `ComputedGraphViz.ensure_lines` is called for it. This is much
+            quicker for big graphs, of which only a few rows are shown.
+        """
         
         # Overview:
         # Work out which revision need to be displayed.
@@ -619,8 +1467,11 @@ class GraphVizLoader(object):
         gc.disable()
         try:
             computed = ComputedGraphViz(self)
-            computed.filtered_revs = [ComputedRevisionData(rev) for rev in
+            computed.filtered_revs = [ComputedRevisionData(rev, computed)
+                                      for rev in
                                       state.get_filtered_revisions()]
+            computed.col_indexes = (array('i', [NO_COL_INDEX]) *
+                                    len(computed.filtered_revs))
             
             c_revisions = computed.revisions
             for f_index, c_rev in enumerate(computed.filtered_revs):
@@ -634,6 +1485,8 @@ class GraphVizLoader(object):
                     rev = self.revid_rev[unique_revid]
                     c_rev = c_revisions[rev.index]
                     if c_rev is not None:
+                        if not c_rev.branch_labels:
+                            c_rev.branch_labels = []
                         c_rev.branch_labels.extend(head_info)
                         break
         finally:
@@ -643,6 +1496,7 @@ class GraphVizLoader(object):
         if self.no_graph:
             for c_rev in computed.filtered_revs:
                 c_rev.col_index = c_rev.rev.merge_depth * 0.5
+            computed.set_lines([])
             return computed
         
         # This will hold a tuple of (child, parent, col_index, direct) for each
@@ -838,6 +1692,8 @@ class GraphVizLoader(object):
                             visible = state\
                                 .get_revision_visible_if_branch_visible(pb_rev)
                         if visible:
+                            if not c_rev.twisty_expands_branch_ids:
+                                c_rev.twisty_expands_branch_ids = []
                             (c_rev.twisty_expands_branch_ids
                              .append(parent_branch.branch_id))
                             if not pb_visible:
@@ -965,42 +1821,15 @@ class GraphVizLoader(object):
             append_branch_parent_lines(branch_rev_visible_parents_post)
         
         # It has now been calculated which column a line must go into. Now
-        # copy the lines in to computed_revisions.
-        for (child, parent, line_col_index, direct) in lines:
-            
-            parent_color = parent.rev.color
-            
-            line_length = parent.f_index - child.f_index
-            if line_length == 0:
-                # Nothing to do
-                pass
-            elif line_length == 1:
-                child.lines.append(
-                    (child.col_index,
-                     parent.col_index,
-                     parent_color,
-                     direct))
-            else:
-                # line from the child's column to the lines column
-                child.lines.append(
-                    (child.col_index,
-                     line_col_index,
-                     parent_color,
-                     direct))
-                # lines down the line's column
-                for line_part_f_index in range(child.f_index + 1,
-                                               parent.f_index - 1):
-                    computed.filtered_revs[line_part_f_index].lines.append(
-                        (line_col_index,
-                         line_col_index,
-                         parent_color,
-                         direct))
-                # line from the line's column to the parent's column
-                computed.filtered_revs[parent.f_index - 1].lines.append(
-                    (line_col_index,
-                     parent.col_index,
-                     parent_color,
-                     direct))
+        # copy the lines in to computed_revisions, or leave that to
+        # ensure_lines.
+        computed.set_lines([
+            (child.f_index, parent.f_index, child.col_index, line_col_index,
+             parent.col_index, parent.rev.color, direct)
+            for (child, parent, line_col_index, direct) in lines
+            if parent.f_index != child.f_index])
+        if not lazy_lines:
+            computed.ensure_lines(0, len(computed.filtered_revs))
         
         return computed
     
@@ -1021,7 +1850,28 @@ class GraphVizLoader(object):
         return self.get_revid_branch_info(revid).branch
     
     def get_revid_repo(self, revid):
-        return self.get_revid_branch_info(revid).branch.repository
+        repo = self.revid_repo.get(revid)
+        if repo is None:
+            repo = self.get_revid_branch_info(revid).branch.repository
+        return repo
+    
+    def find_local_copy_revids(self, revids):
+        """Record in revid_repo which of revids are in local_repo_copies.
+        
+        Each revid is only looked up once.
+        """
+        revid_repo = self.revid_repo
+        missing_revids = self.local_copy_missing_revids
+        revids = [revid for revid in revids
+                  if revid not in revid_repo and revid not in missing_revids]
+        for local_repo_copy in self.local_repo_copies:
+            if not revids:
+                break
+            found_revids = local_repo_copy.has_revisions(revids)
+            for revid in found_revids:
+                revid_repo[revid] = local_repo_copy
+            revids = [revid for revid in revids if revid not in found_revids]
+        missing_revids.update(revids)
     
     def get_repo_revids(self, revids):
         """Returns list of tuple of (repo, revids)"""
@@ -1029,10 +1879,8 @@ class GraphVizLoader(object):
         for repo in self.repos:
             repo_revids[repo.base] = []
         
-        for local_repo_copy in self.local_repo_copies:
-            for revid in self.repos[local_repo_copy].has_revisions(revids):
-                revids.remove(revid)
-                repo_revids[local_repo_copy].append(revid)
+        if self.local_repo_copies:
+            self.find_local_copy_revids(revids)
         
         for revid in revids:
             try:
@@ -1099,6 +1947,101 @@ def group_overlapping(groups):
     
     return groups
 
+def filtered_revs_changes(old_filtered_revs, new_filtered_revs):
+    """Work out which rows were removed, and which were inserted, between
+    two layouts.
+    
+    :param old_filtered_revs: `ComputedGraphViz.filtered_revs` of the old
+        layout.
+    :param new_filtered_revs: `ComputedGraphViz.filtered_revs` of the new
+        layout.
+    :return: (removed, inserted). removed is a list of (first, last) ranges
+        of rows in old_filtered_revs that are not in new_filtered_revs.
+        inserted is a list of (first, last) ranges of rows in
+        new_filtered_revs that are not in old_filtered_revs. Both are
+        inclusive, and sorted.
+    """
+    removed = []
+    inserted = []
+    
+    def add_row(ranges, row):
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    
+    old_f_index = 0
+    new_f_index = 0
+    old_count = len(old_filtered_revs)
+    new_count = len(new_filtered_revs)
+    # Both lists are sorted by revision index.
+    while old_f_index < old_count and new_f_index < new_count:
+        old_index = old_filtered_revs[old_f_index].rev.index
+        new_index = new_filtered_revs[new_f_index].rev.index
+        if old_index == new_index:
+            old_f_index += 1
+            new_f_index += 1
+        elif old_index < new_index:
+            add_row(removed, old_f_index)
+            old_f_index += 1
+        else:
+            add_row(inserted, new_f_index)
+            new_f_index += 1
+    if old_f_index < old_count:
+        removed.append((old_f_index, old_count - 1))
+    if new_f_index < new_count:
+        inserted.append((new_f_index, new_count - 1))
+    return removed, inserted
+
+def changed_rows(old_computed, new_computed):
+    """Work out which rows of a new layout are drawn differently to the rows
+    of the same revisions in the old layout.
+    
+    The rows of revisions that are not in old_computed, and the rows that a
+    line that was added, moved or removed passes through, are included.
+    
+    :return: (first, last) inclusive range of rows of new_computed, or None
+        if no rows changed.
+    """
+    new_revs = new_computed.filtered_revs
+    new_rev_indexes = [c_rev.rev.index for c_rev in new_revs]
+    # The indexes of the revisions may have been increased by
+    # `GraphVizLoader.update` since old_computed was computed, so
+    # old_computed.revisions can't be used.
+    old_c_revs = dict([(c_rev.rev.index, c_rev)
+                       for c_rev in old_computed.filtered_revs])
+    changed = [len(new_revs), -1]
+    
+    def add_rows(first, last):
+        changed[0] = min(changed[0], first)
+        changed[1] = max(changed[1], last)
+    
+    for f_index, c_rev in enumerate(new_revs):
+        old_c_rev = old_c_revs.get(c_rev.rev.index)
+        if (old_c_rev is None or
+            old_c_rev.col_index != c_rev.col_index or
+            old_c_rev.twisty_state != c_rev.twisty_state or
+            old_c_rev.branch_labels != c_rev.branch_labels):
+            add_rows(f_index, f_index)
+    
+    def line_keys(computed):
+        # Lines by the indexes of the revisions they go between, rather than
+        # by their rows.
+        revs = computed.filtered_revs
+        return set([(revs[line[0]].rev.index, revs[line[1]].rev.index) +
+                    line[2:] for line in computed.lines])
+    
+    for line_key in line_keys(old_computed) ^ line_keys(new_computed):
+        # A revision that is not in new_computed is drawn between the rows
+        # of the revisions before and after it.
+        first = bisect_left(new_rev_indexes, line_key[0])
+        last = bisect_left(new_rev_indexes, line_key[1])
+        add_rows(first, min(last, len(new_revs) - 1))
+    
+    if changed[1] < changed[0]:
+        return None
+    return tuple(changed)
+
 def range_overlaps (start_a, end_a, start_b, end_b):
     """Tests if two ranges overlap."""
     return (start_b < start_a < end_b or
@@ -1154,6 +2097,11 @@ class PendingMergesGraphVizLoader(GraphVizLoader):
             graph_parents[revid] = tuple(new_parents)
         
         return ["root:", ] + tree_heads[1:], graph_parents.items()
+    
+    def update(self):
+        # The graph is built from the working tree's pending merges, so it
+        # must always be reloaded.
+        return None
 
 
 class WithWorkingTreeGraphVizLoader(GraphVizLoader):
@@ -1242,6 +2190,78 @@ class WithWorkingTreeGraphVizLoader(GraphVizLoader):
         return load_heads, sort_heads, extra_parents
 
 
+class MainlineGraphVizLoader(GraphVizLoader):
+    """GraphVizLoader that only loads the newest revisions of the mainline
+    of the primary branch.
+    
+    The revnos of the mainline come from the revno of the branch tip, so
+    the revisions only need to be walked back as far as they are shown,
+    rather than the whole graph being loaded and merge sorted. This is
+    quick, so it can be shown while the whole graph is loaded.
+    
+    The graph is always loaded as if no_graph was given.
+    """
+    
+    max_revisions = 1000
+    """The number of revisions of the mainline that are loaded."""
+    
+    def load(self):
+        self.no_graph = True
+        bi = self.primary_bi
+        self.repos = [bi.branch.repository]
+        
+        self.lock_read_branches()
+        try:
+            tip_revno, tip_revid = bi.branch.last_revision_info()
+            self.append_head_info(tip_revid, bi, bi.label)
+            
+            # Record the left hand parent of the oldest revision, so that
+            # we know what to diff it against.
+            graph_parents = {}
+            revids = []
+            parent_revid = NULL_REVISION
+            if tip_revid != NULL_REVISION:
+                graph = bi.branch.repository.get_graph()
+                try:
+                    for revid in graph.iter_lefthand_ancestry(
+                            tip_revid, (NULL_REVISION,)):
+                        if len(revids) == self.max_revisions:
+                            parent_revid = revid
+                            break
+                        revids.append(revid)
+                        if len(revids) % 100 == 0:
+                            self.update_ui()
+                except errors.RevisionNotPresent:
+                    # The mainline stops at a ghost.
+                    pass
+            for child_revid, revid in izip(revids, revids[1:]):
+                graph_parents[child_revid] = (revid,)
+            if revids:
+                if parent_revid == NULL_REVISION:
+                    graph_parents[revids[-1]] = ()
+                else:
+                    graph_parents[revids[-1]] = (parent_revid,)
+                    graph_parents[parent_revid] = ()
+            self.known_graph = KnownGraph(graph_parents)
+            
+            self.store = RevisionStore()
+            self.store.extend_mainline(revids, tip_revno)
+            self.revisions = RevisionList(self.store)
+            self.revid_rev = RevisionMap(self.revisions,
+                                         lambda: self.store.revids)
+            self.revno_rev = RevisionMap(self.revisions,
+                                         self.store.iter_revnos)
+            self.max_mainline_revno = tip_revno
+            
+            self.load_tags()
+        finally:
+            self.unlock_branches()
+    
+    def read_update(self):
+        # Only some of the mainline is loaded, so it can't be updated.
+        return None
+
+
 class GraphVizFilterState(object):
     """
     Records the state of which branch lines are expanded, and what filters
@@ -1261,11 +2281,19 @@ class GraphVizFilterState(object):
             self.branch_line_state[rev.branch_id] = None
         
         self.filters = []
+        """Filters decide which revisions are visible. A filter must have a
+        get_revision_visible(rev) method. It may also have a
+        get_revisions_visible() method, which returns a sequence of booleans
+        for all the revisions, by index, or None if all the revisions are
+        visible. This is much quicker for big graphs."""
         
         # This keeps a cache of the filter state so that when one of the
         # filters notifies us of a change, we can check if anything did change.
+        # It is worked out in bulk by update_filter_cache. After that,
+        # revisions that are not known (-1) are worked out one at a time.
         
-        self.filter_cache = [None for rev in self.graph_viz.revisions]
+        self.filter_cache = array('b', [-1]) * len(self.graph_viz.revisions)
+        self.filter_cache_valid = False
     
     def get_filtered_revisions(self):
         if self.graph_viz.no_graph:
@@ -1283,13 +2311,63 @@ class GraphVizFilterState(object):
         visible = self.get_revision_visible_if_branch_visible
         return (rev for rev in rev_whos_branch_is_visible if visible(rev))
     
+    def update_filter_cache(self):
+        """Work out if each revision is visible, if its branch is visible.
+        
+        The filters are evaluated for all the revisions at once, and the
+        results combined. A revision is also visible if any of the revisions
+        that it merges are visible. As merged revisions always come after the
+        revision that merges them, this can be worked out in one pass from
+        the last revision to the first.
+        """
+        revisions = self.graph_viz.revisions
+        visible = None
+        for filter in self.filters:
+            if hasattr(filter, 'get_revisions_visible'):
+                filter_visible = filter.get_revisions_visible()
+                if filter_visible is None:
+                    continue
+            else:
+                get_revision_visible = filter.get_revision_visible
+                filter_visible = [get_revision_visible(rev)
+                                  for rev in revisions]
+            if visible is None:
+                visible = array('b', filter_visible)
+            else:
+                visible = array('b', imap(operator.and_,
+                                          visible, filter_visible))
+        
+        if visible is None:
+            visible = array('b', [1]) * len(revisions)
+        elif not self.graph_viz.no_graph:
+            # A revision may be in the merges of more than one revision, so
+            # this walks the merges of each revision, as
+            # _get_revision_visible_if_branch_visible does, rather than
+            # merged_by.
+            store = self.graph_viz.store
+            merges_offsets = store.merges_offsets
+            merges = store.merges
+            for index in xrange(len(revisions) - 1, -1, -1):
+                if visible[index]:
+                    continue
+                for offset in xrange(merges_offsets[index],
+                                     merges_offsets[index + 1]):
+                    if visible[merges[offset]]:
+                        visible[index] = 1
+                        break
+        
+        self.filter_cache = visible
+        self.filter_cache_valid = True
+    
     def get_revision_visible_if_branch_visible(self, rev):
+        if not self.filter_cache_valid:
+            self.update_filter_cache()
         rev_filter_cache = self.filter_cache[rev.index]
-        if rev_filter_cache is None:
+        if rev_filter_cache == -1:
             rev_filter_cache = \
                 self._get_revision_visible_if_branch_visible(rev)
             self.filter_cache[rev.index] = rev_filter_cache
-        return rev_filter_cache
+        return bool(rev_filter_cache)
     
     def _get_revision_visible_if_branch_visible(self, rev):
         filters_value = True
@@ -1308,12 +2386,24 @@ class GraphVizFilterState(object):
         
         return False
     
+    def revisions_added(self, revs):
+        """Update the state after `GraphVizLoader.update` added revisions.
+        
+        The filters are told about the new revisions, but it is up to the
+        caller to load any data the filters need for them.
+        """
+        self.filter_cache[0:0] = array('b', [-1]) * len(revs)
+        for filter in self.filters:
+            filter.revisions_added(revs)
+    
     def filter_changed(self, revs=None, last_call=True):
         if revs is None:
-            self.filter_cache = [None for rev in self.graph_viz.revisions]
+            self.filter_cache_valid = False
             if self.filter_changed_callback:
                 self.filter_changed_callback()
         else:
+            if not self.filter_cache_valid:
+                self.update_filter_cache()
             pending_revs = revs
             processed_revs = set()
             prev_cached_revs = []
@@ -1325,9 +2415,9 @@ class GraphVizFilterState(object):
                 
                 rev_filter_cache = self.filter_cache[rev.index]
                 
-                if rev_filter_cache is not None:
-                    prev_cached_revs.append((rev, rev_filter_cache))
-                self.filter_cache[rev.index] = None
+                if rev_filter_cache != -1:
+                    prev_cached_revs.append((rev, bool(rev_filter_cache)))
+                self.filter_cache[rev.index] = -1
                 
                 if not self.graph_viz.no_graph:
                     if rev.merged_by is not None:
@@ -1412,11 +2502,29 @@ class FileIdFilter (object):
     Filter that only shows revisions that modify one of the specified files.
     """
     
+    file_index_enabled = False
+    """If True, which files each revision touches is kept on disk with a
+    FileRevisionsIndex, so that this only has to be worked out once for each
+    revision."""
+    
+    parallel_load = True
+    """If True, and the revisions are in more than one local repository, the
+    revisions of each local repository are checked in a worker thread."""
+    
+    target_chunk_time = 0.25
+    """How long, in seconds, checking a chunk of revisions should take.
+    Chunks are made bigger or smaller to get close to this."""
+    
+    max_chunk_size = 2000
+    
     def __init__(self, graph_viz, filter_changed_callback, file_ids):
         self.graph_viz = graph_viz
         self.filter_changed_callback = filter_changed_callback
         self.file_ids = file_ids
         self.has_dir = False
+        self.file_indexes = {}
+        self.load_threads = []
+        self.load_results = Queue.Queue()
         self.filter_file_id = [False for rev in self.graph_viz.revisions]
         
         # don't filter working tree nodes
@@ -1459,63 +2567,243 @@ class FileIdFilter (object):
             revids = [revid for revid in revids
                       if not revid.startswith(CURRENT_REVISION)]
             
+            repo_revids = []
             for repo, revids in self.graph_viz.get_repo_revids(revids):
-                if self.uses_inventory():
-                    chunk_size = 200
-                else:
-                    chunk_size = 500
-                
-                for start in xrange(0, len(revids), chunk_size):
-                    self.load_filter_file_id_chunk(repo, 
-                            revids[start:start + chunk_size])
+                file_index = self.get_file_index(repo)
+                if file_index is not None:
+                    unindexed_revids = self.load_from_file_index(file_index,
+                                                                 revids)
+                    if unindexed_revids is None:
+                        file_index = None
+                    else:
+                        revids = unindexed_revids
+                if revids:
+                    repo_revids.append((repo, revids, file_index))
+            
+            # Repositories can't be used from more than one thread, and
+            # opening a remote repository again may ask for a password, so
+            # only local repositories are checked in worker threads.
+            local_repo_revids = [
+                item for item in repo_revids
+                if isinstance(item[0].bzrdir.transport, LocalTransport)]
+            if self.parallel_load and len(local_repo_revids) > 1:
+                for repo, revids, file_index in local_repo_revids:
+                    thread = FileIdFilterLoadThread(self, repo, revids,
+                                                    file_index)
+                    self.load_threads.append(thread)
+                    thread.start()
+                repo_revids = [item for item in repo_revids
+                               if item not in local_repo_revids]
+            
+            for repo, revids, file_index in repo_revids:
+                repo.lock_read()
+                try:
+                    for result in self.iter_load_chunks(
+                            repo, revids, file_index is not None,
+                            self.graph_viz.update_ui):
+                        self.load_chunk_result(file_index, result)
+                        self.load_thread_results(False)
+                finally:
+                    repo.unlock()
+            self.load_thread_results(True)
             
             self.load_filter_file_id_chunk_finished()
     
-    def load_filter_file_id_chunk(self, repo, revids):
-        def check_text_keys(text_keys):
-            changed_revs = []
-            for file_id, revid in repo.texts.get_parent_map(text_keys):
-                rev = self.graph_viz.revid_rev[revid]
-                self.filter_file_id[rev.index] = True
-                changed_revs.append(rev)
-            
-            self.graph_viz.update_ui()
-            self.filter_changed_callback(changed_revs, False)
-            self.graph_viz.update_ui()
+    def iter_load_chunks(self, repo, revids, use_file_index, update_ui=None):
+        """Check which revisions affect the file_ids, a chunk at a time.
         
-        repo.lock_read()
-        try:
-            if not self.uses_inventory():
-                text_keys = [(file_id, revid) 
-                                for revid in revids
-                                for file_id in self.file_ids]
-                check_text_keys(text_keys)
+        The repository must be locked. The size of the chunks is adapted to
+        how long they take.
+        
+        :return: An iterator of, for each chunk, what get_touched_file_ids
+            returns if use_file_index, else a list of the revids that affect
+            the file_ids.
+        """
+        if self.uses_inventory() or use_file_index:
+            chunk_size = 200
+        else:
+            chunk_size = 500
+        
+        offset = 0
+        while offset < len(revids):
+            chunk_revids = revids[offset:offset + chunk_size]
+            offset += len(chunk_revids)
+            start_time = time()
+            if use_file_index:
+                result = get_touched_file_ids(repo, chunk_revids)
             else:
-                text_keys = []
-                # We have to load the inventory for each revisions, to find
-                # the children of any directories.
-                for inv, revid in izip(repo.iter_inventories(revids), revids):
-                    entries = inv.iter_entries_by_dir(
-                                         specific_file_ids=self.file_ids)
-                    for path, entry in entries:
-                        text_keys.append((entry.file_id, revid))
-                        if entry.kind == "directory":
-                            sub_entries = inv.iter_entries(from_dir=entry)
-                            for rc_path, rc_entry in sub_entries:
-                                text_keys.append((rc_entry.file_id, revid))
-                    
-                    self.graph_viz.update_ui()
+                result = self.get_chunk_touching_revids(repo, chunk_revids,
+                                                        update_ui)
+            chunk_size = self.adapt_chunk_size(chunk_size, len(chunk_revids),
+                                               time() - start_time)
+            yield result
+    
+    def adapt_chunk_size(self, chunk_size, chunk_len, chunk_time):
+        """Return the chunk size to use for the next chunk, after chunk_len
+        revisions took chunk_time seconds to check."""
+        if chunk_time > self.target_chunk_time:
+            return max(chunk_size // 2, 10)
+        if chunk_time < self.target_chunk_time / 2 and chunk_len >= chunk_size:
+            return min(chunk_size * 2, self.max_chunk_size)
+        return chunk_size
+    
+    def get_chunk_touching_revids(self, repo, revids, update_ui=None):
+        """Return the revids in revids that affect the file_ids.
+        
+        The repository must be locked.
+        """
+        if not self.uses_inventory():
+            text_keys = [(file_id, revid) 
+                            for revid in revids
+                            for file_id in self.file_ids]
+        else:
+            text_keys = []
+            # We have to load the inventory for each revisions, to find
+            # the children of any directories.
+            for inv, revid in izip(repo.iter_inventories(revids), revids):
+                entries = inv.iter_entries_by_dir(
+                                     specific_file_ids=self.file_ids)
+                for path, entry in entries:
+                    text_keys.append((entry.file_id, revid))
+                    if entry.kind == "directory":
+                        sub_entries = inv.iter_entries(from_dir=entry)
+                        for rc_path, rc_entry in sub_entries:
+                            text_keys.append((rc_entry.file_id, revid))
                 
-                check_text_keys(text_keys)
-        finally:
-            repo.unlock()
-
+                if update_ui is not None:
+                    update_ui()
+        
+        return [revid for file_id, revid
+                in repo.texts.get_parent_map(text_keys)]
+    
+    def load_chunk_result(self, file_index, result):
+        """Mark the revisions in a result from iter_load_chunks that affect
+        the file_ids."""
+        if file_index is not None:
+            file_index.add_touched_file_ids(result)
+            file_ids = frozenset(self.file_ids)
+            result = [revid for revid, touched in result.iteritems()
+                      if not file_ids.isdisjoint(touched)]
+        self.set_touching(result)
+    
+    def load_thread_results(self, wait):
+        """Mark the revisions that the worker threads found affect the
+        file_ids.
+        
+        :param wait: If True, wait for all the threads to finish, else only
+            handle what they have found so far.
+        """
+        while self.load_threads:
+            try:
+                if wait:
+                    thread, result = self.load_results.get(timeout=0.05)
+                else:
+                    thread, result = self.load_results.get_nowait()
+            except Queue.Empty:
+                if not wait:
+                    return
+                self.graph_viz.update_ui()
+                continue
+            
+            if result is None:
+                thread.join()
+                self.load_threads.remove(thread)
+                if thread.exc_info is not None:
+                    exc_type, exc_value, exc_tb = thread.exc_info
+                    raise exc_type, exc_value, exc_tb
+            else:
+                self.load_chunk_result(thread.file_index, result)
+    
+    def set_touching(self, revids):
+        changed_revs = []
+        for revid in revids:
+            rev = self.graph_viz.revid_rev[revid]
+            self.filter_file_id[rev.index] = True
+            changed_revs.append(rev)
+        
+        self.graph_viz.update_ui()
+        self.filter_changed_callback(changed_revs, False)
+        self.graph_viz.update_ui()
+    
+    def get_file_index(self, repo):
+        """Return the FileRevisionsIndex for repo, or None if it can't be
+        used."""
+        if not self.file_index_enabled:
+            return None
+        if repo.base not in self.file_indexes:
+            try:
+                filename = diskcache.get_repos_cache_filename('files', repo)
+            except (IOError, OSError):
+                return None
+            self.file_indexes[repo.base] = FileRevisionsIndex(filename)
+        file_index = self.file_indexes[repo.base]
+        if file_index.broken:
+            return None
+        return file_index
+    
+    def load_from_file_index(self, file_index, revids):
+        """Mark the revisions in revids that file_index knows affect the
+        file_ids.
+        
+        :return: The revids that have not been indexed yet, or None if the
+            index could not be used.
+        """
+        touching_revids = file_index.get_touching_revids(self.file_ids)
+        if touching_revids is None:
+            return None
+        self.set_touching([revid for revid in revids
+                           if revid in touching_revids])
+        return file_index.get_unindexed_revids(revids)
+    
     def load_filter_file_id_chunk_finished(self):
         self.filter_changed_callback([], True)
         self.graph_viz.throbber_hide()
     
+    def revisions_added(self, revs):
+        # The new revisions have not been checked yet. Call load with their
+        # revids to do so.
+        self.filter_file_id[0:0] = [False for rev in revs]
+    
     def get_revision_visible(self, rev):
         return self.filter_file_id[rev.index]
+    
+    def get_revisions_visible(self):
+        return self.filter_file_id
+
+
+class FileIdFilterLoadThread(threading.Thread):
+    """Thread that checks which revisions of a repository affect the file_ids
+    of a FileIdFilter.
+    
+    The results of each chunk are put on the load_results queue of the
+    filter, followed by None when done. The thread opens the repository
+    again, so that it does not share the repository object with any other
+    thread.
+    """
+    
+    def __init__(self, file_id_filter, repo, revids, file_index):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.file_id_filter = file_id_filter
+        self.repo_url = repo.bzrdir.root_transport.base
+        self.revids = revids
+        self.file_index = file_index
+        self.exc_info = None
+    
+    def run(self):
+        results = self.file_id_filter.load_results
+        try:
+            repo = Repository.open(self.repo_url)
+            repo.lock_read()
+            try:
+                for result in self.file_id_filter.iter_load_chunks(
+                        repo, self.revids, self.file_index is not None):
+                    results.put((self, result))
+            finally:
+                repo.unlock()
+        except:
+            self.exc_info = sys.exc_info()
+        results.put((self, None))
 
 
 class WorkingTreeHasChangeFilter(object):
@@ -1581,11 +2869,28 @@ class WorkingTreeHasChangeFilter(object):
         finally:
             tree.unlock()
     
+    def revisions_added(self, revs):
+        pass
+    
     def get_revision_visible(self, rev):
         if rev.revid.startswith(CURRENT_REVISION):
             return rev.revid in self.tree_revids_with_changes
         else:
             return True
+    
+    def get_revisions_visible(self):
+        visible = array('b', [1]) * len(self.graph_viz.revisions)
+        for wt_revid in self.graph_viz.working_trees:
+            if wt_revid not in self.tree_revids_with_changes:
+                rev = self.graph_viz.revid_rev.get(wt_revid)
+                if rev is not None:
+                    visible[rev.index] = 0
+        return visible
+
+
+NO_COL_INDEX = -1
+"""Stored in `ComputedGraphViz.col_indexes` for revisions without a col_index.
+"""
 
 
 class ComputedRevisionData(object):
@@ -1619,16 +2924,34 @@ class ComputedRevisionData(object):
     """
     
     # Instance of this object are typically named "c_rev".    
-    __slots__ = ['rev', 'f_index', 'lines', 'col_index', 'branch_labels',
+    __slots__ = ['rev', 'f_index', 'lines', '_computed', 'branch_labels',
                  'twisty_state', 'twisty_expands_branch_ids']
     
-    def __init__(self, rev):
+    def __init__(self, rev, computed):
         self.rev = rev
+        self._computed = computed
         self.lines = []
-        self.col_index = None
         self.twisty_state = None
-        self.twisty_expands_branch_ids = []
-        self.branch_labels = []
+        # Most revisions don't have these, so share an empty tuple, rather
+        # than have a list for each revision.
+        self.twisty_expands_branch_ids = ()
+        self.branch_labels = ()
+    
+    def get_col_index(self):
+        half_col_index = self._computed.col_indexes[self.f_index]
+        if half_col_index == NO_COL_INDEX:
+            return None
+        if half_col_index & 1:
+            return half_col_index * 0.5
+        return half_col_index >> 1
+    
+    def set_col_index(self, col_index):
+        if col_index is None:
+            half_col_index = NO_COL_INDEX
+        else:
+            half_col_index = int(round(col_index * 2))
+        self._computed.col_indexes[self.f_index] = half_col_index
+    col_index = property(get_col_index, set_col_index)
 
 
 class ComputedGraphViz(object):
@@ -1639,8 +2962,79 @@ class ComputedGraphViz(object):
         are included.
     :ivar revisions: List `ComputedRevisionData`. Revision that are not
         visible are None.
+    :ivar col_indexes: Array of twice the col_index of each of filtered_revs,
+        as col_indexes may be halves in no_graph mode. `NO_COL_INDEX` is
+        stored for None.
+    :ivar lines: The lines that were passed to `set_lines`.
     """
+    
+    lines_chunk_size = 256
+    """Number of rows for which `ensure_lines` copies lines at a time."""
+    
     def __init__(self, graph_viz):
         self.graph_viz = graph_viz
         self.filtered_revs = []
+        self.col_indexes = array('i')
         self.revisions = [None for i in xrange(len(graph_viz.revisions))]
+        self.lines = []
+        self.line_chunks = []
+    
+    def set_lines(self, lines):
+        """Set the lines that need to be drawn. They are only copied to
+        `ComputedRevisionData.lines` by `ensure_lines`.
+        
+        :param lines: List of (child f_index, parent f_index, child col_index,
+            line col_index, parent col_index, color, direct).
+        """
+        self.lines = lines
+        chunk_size = self.lines_chunk_size
+        chunk_count = ((len(self.filtered_revs) + chunk_size - 1)
+                       // chunk_size)
+        self.line_chunks = [[] for i in xrange(chunk_count)]
+        for line in lines:
+            child_f_index, parent_f_index = line[0], line[1]
+            for chunk_index in xrange(child_f_index // chunk_size,
+                                      (parent_f_index - 1) // chunk_size + 1):
+                self.line_chunks[chunk_index].append(line)
+    
+    def ensure_lines(self, start, end):
+        """Make sure that the lines of filtered_revs[start:end] have been
+        computed."""
+        chunk_size = self.lines_chunk_size
+        start_chunk = max(start, 0) // chunk_size
+        end_chunk = min((end + chunk_size - 1) // chunk_size,
+                        len(self.line_chunks))
+        for chunk_index in xrange(start_chunk, end_chunk):
+            lines = self.line_chunks[chunk_index]
+            if lines is None:
+                continue
+            self.line_chunks[chunk_index] = None
+            self.copy_lines(lines, chunk_index * chunk_size,
+                            min((chunk_index + 1) * chunk_size,
+                                len(self.filtered_revs)))
+    
+    def copy_lines(self, lines, start, end):
+        """Copy the parts of lines that are in rows start to end into
+        `ComputedRevisionData.lines`."""
+        filtered_revs = self.filtered_revs
+        for (child_f_index, parent_f_index, child_col_index, line_col_index,
+             parent_col_index, color, direct) in lines:
+            if parent_f_index - child_f_index == 1:
+                if start <= child_f_index < end:
+                    filtered_revs[child_f_index].lines.append(
+                        (child_col_index, parent_col_index, color, direct))
+                continue
+            
+            # line from the child's column to the lines column
+            if start <= child_f_index < end:
+                filtered_revs[child_f_index].lines.append(
+                    (child_col_index, line_col_index, color, direct))
+            # lines down the line's column
+            for line_part_f_index in xrange(max(child_f_index + 1, start),
+                                            min(parent_f_index - 1, end)):
+                filtered_revs[line_part_f_index].lines.append(
+                    (line_col_index, line_col_index, color, direct))
+            # line from the line's column to the parent's column
+            if start <= parent_f_index - 1 < end:
+                filtered_revs[parent_f_index - 1].lines.append(
+                    (line_col_index, parent_col_index, color, direct))
@@ -21,25 +21,39 @@ from PyQt4 import QtCore, QtGui
 from time import (strftime, localtime, clock)
 import re
 import fnmatch
+import sys
+from array import array
 
+from bzrlib.lru_cache import LRUCache
 from bzrlib.revision import CURRENT_REVISION, Revision
 
-from bzrlib.plugins.qbzr.lib.bugs import get_bug_id
-from bzrlib.plugins.qbzr.lib import loggraphviz
+from bzrlib.plugins.qbzr.lib import diskcache, loggraphviz
 from bzrlib.plugins.qbzr.lib.lazycachedrevloader import (load_revisions,
                                                          cached_revisions)
 from bzrlib.plugins.qbzr.lib.revtreeview import RevIdRole as im_RevIdRole
+from bzrlib.plugins.qbzr.lib.searchindex import (
+    RevisionSearchIndex,
+    pattern_narrows,
+    )
 from bzrlib.plugins.qbzr.lib.i18n import gettext
+from bzrlib.plugins.qbzr.lib.trace import report_exception
 from bzrlib.plugins.qbzr.lib.util import (
     extract_name,
     get_apparent_author,
     runs_in_loading_queue,
-    run_in_loading_queue
+    run_in_loading_queue,
+    hold_loading_queue,
+    release_loading_queue,
     )
 
 RevIdRole = im_RevIdRole
 GraphDataRole = QtCore.Qt.UserRole + 2
 
+branch_label_color = QtGui.QColor(24, 80, 200)
+tag_label_color = QtGui.QColor(80, 128, 32)
+bug_label_color = QtGui.QColor(164, 0, 0)
+label_text_color = QtGui.QColor(QtCore.Qt.white)
+
 header_labels = (gettext("Rev"),
                  gettext("Message"),
                  gettext("Date"),
@@ -62,8 +76,80 @@ class WorkingTreeRevision(Revision):
         self.timestamp = None
         self.tree = tree
 
+class RevisionDisplayRecord(object):
+    """What LogModel shows for a revision, worked out once, rather than
+    each time a row is painted."""
+    
+    __slots__ = ['date', 'author', 'summary', 'bug_labels']
+    
+    def __init__(self, revision, bugtext):
+        self.date = QtCore.QVariant(strftime("%Y-%m-%d %H:%M",
+                                             localtime(revision.timestamp)))
+        self.author = QtCore.QVariant(
+            extract_name(get_apparent_author(revision)))
+        self.summary = QtCore.QVariant(revision.get_summary())
+        self.bug_labels = tuple([
+            (bugtext % bug_id, bug_label_color, label_text_color)
+            for bug_id in cached_revisions.get_bug_ids(revision.revision_id)])
+
+
+class GraphVizLoaderThread(QtCore.QThread):
+    """Thread that runs a method of a GraphVizLoader, such as load, so that
+    the ui is not blocked while it runs.
+    
+    "finished()" is emitted once it is done. The result of the method is
+    then in result, or the exc_info of the error that it raised in exc_info.
+    
+    If mainline is given, it is loaded first, and "mainlineLoaded()" is
+    emitted. The ui may use mainline from then on.
+    """
+    
+    def __init__(self, graph_viz, method, mainline=None):
+        QtCore.QThread.__init__(self)
+        self.graph_viz = graph_viz
+        self.method = method
+        self.mainline = mainline
+        self.mainline_revisions = []
+        """List of (revision, repository) of the first revisions of
+        mainline."""
+        self.result = None
+        self.exc_info = None
+    
+    def run(self):
+        self.graph_viz.in_worker_thread = True
+        try:
+            try:
+                if self.mainline is not None:
+                    self.load_mainline()
+                self.result = self.method()
+            except:
+                self.exc_info = sys.exc_info()
+        finally:
+            self.graph_viz.in_worker_thread = False
+    
+    def load_mainline(self):
+        mainline = self.mainline
+        mainline.in_worker_thread = True
+        try:
+            mainline.load()
+            self.mainline_revisions = mainline.read_revisions(
+                mainline.store.revids[:mainline.preload_revisions])
+        finally:
+            mainline.in_worker_thread = False
+        self.emit(QtCore.SIGNAL("mainlineLoaded()"))
+
+
 class GraphVizLoader(loggraphviz.GraphVizLoader):
     
+    graph_cache_enabled = True
+    
+    load_in_thread = True
+    """If True, LogModel loads the graph in a GraphVizLoaderThread, rather
+    than on the ui thread."""
+    
+    in_worker_thread = False
+    """True while a method is running in a GraphVizLoaderThread."""
+    
     def __init__(self, branches, primary_bi, no_graph,
                  processEvents,  throbber):
         self.processEvents = processEvents
@@ -71,8 +157,13 @@ class GraphVizLoader(loggraphviz.GraphVizLoader):
         loggraphviz.GraphVizLoader.__init__(
             self, branches, primary_bi, no_graph)
     
+    def loaded(self):
+        """Called on the ui thread, once the graph has been loaded."""
+        pass
+    
     def update_ui(self):
-        self.processEvents()
+        if not self.in_worker_thread:
+            self.processEvents()
     
     def throbber_show(self):
         self.throbber.show()
@@ -84,13 +175,20 @@ class GraphVizLoader(loggraphviz.GraphVizLoader):
         self.on_filter_changed()
 
     def load_revisions(self, revids):
+        if self.in_worker_thread:
+            # lazycachedrevloader updates the ui, which may only be done
+            # from the main thread.
+            return loggraphviz.GraphVizLoader.load_revisions(self, revids)
         return load_revisions(revids, self.get_repo_revids)
 
 
 class PendingMergesGraphVizLoader(
         loggraphviz.PendingMergesGraphVizLoader,
         GraphVizLoader):
-    pass
+    
+    # There are only a few pending merges, and the commit dialog uses the
+    # tree straight after.
+    load_in_thread = False
 
 class WithWorkingTreeGraphVizLoader(
         loggraphviz.WithWorkingTreeGraphVizLoader,
@@ -99,12 +197,44 @@ class WithWorkingTreeGraphVizLoader(
     def load(self):
         super(WithWorkingTreeGraphVizLoader, self).load()
         
-        for wt_revid, tree in self.working_trees.iteritems():
+        self.working_tree_revisions = [
+            WorkingTreeRevision(wt_revid, tree)
+            for wt_revid, tree in self.working_trees.iteritems()]
+    
+    def loaded(self):
+        for rev in self.working_tree_revisions:
             # bla - nasty hack.
-            cached_revisions[wt_revid] = WorkingTreeRevision(wt_revid, tree)
+            cached_revisions[rev.revision_id] = rev
+
+class MainlineGraphVizLoader(
+        loggraphviz.MainlineGraphVizLoader,
+        GraphVizLoader):
+    
+    preload_revisions = 100
+    """The number of revisions that are read with the mainline, so that the
+    first page of the log can be shown with them."""
+    
+    def read_revisions(self, revids):
+        """Read revisions from the repositories, without using
+        cached_revisions, which may only be used on the ui thread.
+        
+        :return: List of (revision, repository).
+        """
+        revisions = []
+        for repo, repo_revids in self.get_repo_revids(revids):
+            if repo_revids:
+                repo.lock_read()
+                try:
+                    revisions.extend([(rev, repo) for rev in
+                                      repo.get_revisions(repo_revids)])
+                finally:
+                    repo.unlock()
+        return revisions
 
 
 class FileIdFilter(loggraphviz.FileIdFilter):
+    file_index_enabled = True
+    
     @runs_in_loading_queue
     def load(self, revids=None):
         super(FileIdFilter, self).load(revids)
@@ -148,6 +278,14 @@ class FilterScheduler(object):
             self.last_call_time = 0
 
 class LogModel(QtCore.QAbstractTableModel):
+    
+    max_row_changes = 100
+    """If more ranges of rows than this change when the layout is
+    recomputed, the view is told that the whole layout changed."""
+    
+    max_display_records = 1000
+    """The number of RevisionDisplayRecords to keep. Only the rows around
+    those that are shown need them."""
 
     def __init__(self, processEvents, throbber, parent=None):
         QtCore.QAbstractTableModel.__init__(self, parent)
@@ -163,72 +301,343 @@ class LogModel(QtCore.QAbstractTableModel):
         self.clicked_f_index = None
         self.last_rev_is_placeholder = False
         self.bugtext = gettext("bug #%s")
+        self.tag_labels_tags = None
+        self.tag_labels = {}
+        """Dict of revid -> labels for the tags of the revision, for
+        tag_labels_tags."""
+        self.display_records = LRUCache(self.max_display_records)
+        """LRUCache of revid -> RevisionDisplayRecord, for the revisions
+        that have been loaded, and shown most recently."""
+        self.graph_data = {}
+        """Dict of row -> GraphDataRole data, for the rows of computed."""
+        self.changing_rows = None
+        """While compute_lines tells the view which rows were removed and
+        inserted, the ComputedRevisionData of the rows the view has been told
+        about, rather than those of computed."""
+        
+        self.file_ids = None
+        self.file_id_filter = None
+        self.working_tree_filter = None
+        # Searches that are asked for before the first graph is loaded are
+        # passed on to the filter of that graph.
+        self.prop_search_filter = PropertySearchFilter(self.graph_viz,
+                                                       self.state.filter_changed)
+        self.load_args = None
+        """The arguments of the last call to load."""
+        self.loader_thread = None
+        """The GraphVizLoaderThread that is loading, or updating, the graph,
+        or None."""
+        self.pending_load = None
+        """The method to call once loader_thread is done, if load or refresh
+        was called while it was running."""
     
     def load(self, branches, primary_bi, file_ids, no_graph,
              graph_provider_type):
+        """Load the graph of branches.
+        
+        Unless graph_provider_type.load_in_thread is False, the graph is
+        loaded in a thread, and this returns straight away. Until it is
+        loaded, the newest revisions of the mainline of primary_bi are shown.
+        "loaded()" is emitted once the graph is shown.
+        """
+        if self.loader_thread is not None:
+            self.pending_load = lambda: self.load(
+                branches, primary_bi, file_ids, no_graph, graph_provider_type)
+            return
+        self.load_args = (branches, primary_bi, file_ids, no_graph,
+                          graph_provider_type)
+        
+        graph_viz = graph_provider_type(
+            branches, primary_bi, no_graph, 
+            processEvents=self.processEvents, throbber=self.throbber)
+        if not graph_viz.load_in_thread:
+            self.throbber.show()
+            self.processEvents()
+            try:
+                graph_viz.load()
+                self.show_graph(graph_viz, file_ids)
+            finally:
+                self.throbber.hide()
+            self.emit(QtCore.SIGNAL("loaded()"))
+            return
+        
+        if primary_bi is not None and not file_ids:
+            # Filtering by file would hide most of the mainline.
+            mainline = MainlineGraphVizLoader(
+                (primary_bi,), primary_bi, True,
+                processEvents=self.processEvents, throbber=self.throbber)
+        else:
+            mainline = None
+        thread = GraphVizLoaderThread(graph_viz, graph_viz.load, mainline)
+        self.connect(thread, QtCore.SIGNAL("mainlineLoaded()"),
+                     self.mainline_loaded)
+        self.start_loader_thread(thread, self.graph_loaded)
+    
+    def start_loader_thread(self, thread, finished):
+        """Start a GraphVizLoaderThread, and call finished once it is done.
+        
+        The thread uses the branches and repositories, so the loading queue
+        is held, and the search is paused, until end_loader_thread is
+        called. The thread does not change the graph that is shown, so the
+        ui may still use it.
+        """
         self.throbber.show()
-        self.processEvents()        
+        hold_loading_queue()
+        self.prop_search_filter.paused = True
+        self.loader_thread = thread
+        self.connect(thread, QtCore.SIGNAL("finished()"), finished)
+        thread.start()
+    
+    def end_loader_thread(self):
+        """Undo start_loader_thread, once the thread is finished, and run
+        what was queued while it ran.
+        
+        :return: The thread.
+        """
+        thread = self.loader_thread
+        thread.wait()
+        self.loader_thread = None
+        self.throbber.hide()
+        self.prop_search_filter.paused = False
+        QtCore.QTimer.singleShot(1, self.prop_search_filter.run_pending)
+        release_loading_queue()
+        return thread
+    
+    def loader_thread_done(self, thread):
+        """Report the error of a GraphVizLoaderThread, or emit "loaded()"."""
+        if thread.exc_info is not None:
+            parent = QtCore.QObject.parent(self)
+            if isinstance(parent, QtGui.QWidget):
+                report_exception(exc_info=thread.exc_info,
+                                 window=parent.window())
+            else:
+                report_exception(exc_info=thread.exc_info)
+        else:
+            self.emit(QtCore.SIGNAL("loaded()"))
+    
+    def run_pending_load(self):
+        """Start the load, or refresh, that was asked for while the
+        loader_thread ran."""
+        pending_load = self.pending_load
+        self.pending_load = None
+        if pending_load is not None:
+            pending_load()
+    
+    def mainline_loaded(self):
+        """Show the mainline that was loaded by the loader_thread, until the
+        whole graph is loaded."""
+        thread = self.loader_thread
+        if thread is None or thread.mainline is None:
+            return
+        mainline = thread.mainline
+        for rev, repo in thread.mainline_revisions:
+            cached_revisions.add_revision(rev, repo)
+        
+        state = loggraphviz.GraphVizFilterState(mainline, self.compute_lines)
+        # Keep the expanded branches for the graph that is being loaded.
+        state.branch_line_state.update(self.state.branch_line_state)
+        computed = self.compute_viz(mainline, state)
+        
+        self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
+        self.graph_viz = mainline
+        self.state = state
+        self.file_id_filter = None
+        self.working_tree_filter = None
+        self.computed = computed
+        self.graph_data = {}
+        self.emit(QtCore.SIGNAL("layoutChanged()"))
+        self.emit(QtCore.SIGNAL("mainlineLoaded()"))
+    
+    def graph_loaded(self):
+        thread = self.loader_thread
         try:
-            graph_viz = graph_provider_type(
-                branches, primary_bi, no_graph, 
-                processEvents=self.processEvents, throbber=self.throbber)
-            graph_viz.load()
-            graph_viz.on_filter_changed = self.on_filter_changed
-            
-            state = loggraphviz.GraphVizFilterState(
-                graph_viz, self.compute_lines)
-            # Copy the expanded branches from the old state to the new.
-            for (branch_id, value) in self.state.branch_line_state.iteritems():
+            if thread.exc_info is None:
+                self.show_graph(thread.graph_viz, self.load_args[2])
+        finally:
+            self.end_loader_thread()
+        self.loader_thread_done(thread)
+        self.run_pending_load()
+    
+    def show_graph(self, graph_viz, file_ids):
+        """Show a graph that has been loaded, with filters for file_ids."""
+        graph_viz.loaded()
+        graph_viz.on_filter_changed = self.on_filter_changed
+        
+        state = loggraphviz.GraphVizFilterState(
+            graph_viz, self.compute_lines)
+        # Copy the expanded branches from the old state to the new.
+        if not graph_viz.no_graph:
+            for (branch_id,
+                 value) in self.state.branch_line_state.iteritems():
                 if branch_id in graph_viz.branch_lines:
                     state.branch_line_state[branch_id] = value
-            
-            #for branch_id in graph_viz.branch_lines.keys():
-            #    state.branch_line_state[branch_id] = None
-            
-            scheduler = FilterScheduler(state.filter_changed)
-            if file_ids:
-                file_id_filter = FileIdFilter(
-                    graph_viz, scheduler.filter_changed, file_ids)
-                state.filters.append(file_id_filter)
-            else:
-                file_id_filter = None
-            
-            if isinstance(graph_viz, WithWorkingTreeGraphVizLoader):
-                working_tree_filter = WorkingTreeHasChangeFilter(
-                    graph_viz, scheduler.filter_changed, file_ids)
-                state.filters.append(working_tree_filter)
-            else:
-                working_tree_filter = None
-            
-            prop_search_filter = PropertySearchFilter(graph_viz,
-                                                      scheduler.filter_changed)
-            state.filters.append(prop_search_filter)
-            
-            self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
-            self.graph_viz = graph_viz
-            self.state = state
-            self.file_ids = file_ids
-            self.file_id_filter = file_id_filter
-            self.working_tree_filter = working_tree_filter
-            self.prop_search_filter = prop_search_filter
-            self.computed = loggraphviz.ComputedGraphViz(graph_viz)
-            self.emit(QtCore.SIGNAL("layoutChanged()"))
-            
-            self.compute_lines()
-            # Start later so that it does not run in the loading queue.
-            if self.working_tree_filter:
-                QtCore.QTimer.singleShot(1, self.working_tree_filter.load)
-            if self.file_id_filter:
-                QtCore.QTimer.singleShot(1, self.file_id_filter.load)
+        
+        #for branch_id in graph_viz.branch_lines.keys():
+        #    state.branch_line_state[branch_id] = None
+        
+        scheduler = FilterScheduler(state.filter_changed)
+        if file_ids:
+            file_id_filter = FileIdFilter(
+                graph_viz, scheduler.filter_changed, file_ids)
+            state.filters.append(file_id_filter)
+        else:
+            file_id_filter = None
+        
+        if isinstance(graph_viz, WithWorkingTreeGraphVizLoader):
+            working_tree_filter = WorkingTreeHasChangeFilter(
+                graph_viz, scheduler.filter_changed, file_ids)
+            state.filters.append(working_tree_filter)
+        else:
+            working_tree_filter = None
+        
+        prop_search_filter = PropertySearchFilter(graph_viz,
+                                                  scheduler.filter_changed)
+        state.filters.append(prop_search_filter)
+        # A search that was asked for while loading is for the new graph.
+        if self.prop_search_filter.pending_search is not None:
+            prop_search_filter.pending_search = \
+                self.prop_search_filter.pending_search
+            self.prop_search_filter.pending_search = None
+        
+        computed = self.compute_viz(graph_viz, state)
+        
+        self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
+        self.graph_viz = graph_viz
+        self.state = state
+        self.file_ids = file_ids
+        self.file_id_filter = file_id_filter
+        self.working_tree_filter = working_tree_filter
+        self.prop_search_filter = prop_search_filter
+        self.computed = computed
+        self.display_records.clear()
+        self.graph_data = {}
+        self.emit(QtCore.SIGNAL("layoutChanged()"))
+        
+        # Start later so that it does not run in the loading queue.
+        if self.working_tree_filter:
+            QtCore.QTimer.singleShot(1, self.working_tree_filter.load)
+        if self.file_id_filter:
+            QtCore.QTimer.singleShot(1, self.file_id_filter.load)
+        QtCore.QTimer.singleShot(
+            1, self.prop_search_filter.update_search_index)
+        QtCore.QTimer.singleShot(1, self.prop_search_filter.run_pending)
+    
+    def refresh(self):
+        """Add revisions that were committed, or pulled, since the graph was
+        loaded, keeping the expanded branches, and the filter state.
+        
+        The new revisions are read in a thread, and this returns straight
+        away. If the graph can't be updated, it is loaded again with `load`.
+        "loaded()" is emitted once the graph is shown.
+        """
+        if self.loader_thread is not None:
+            self.pending_load = self.refresh
+            return
+        thread = GraphVizLoaderThread(self.graph_viz,
+                                      self.graph_viz.read_update)
+        self.start_loader_thread(thread, self.graph_updated)
+    
+    def graph_updated(self):
+        thread = self.loader_thread
+        new_revs = None
+        try:
+            if thread.exc_info is None and thread.result is not None:
+                new_revs = self.graph_viz.apply_update(thread.result)
+                if new_revs is not None:
+                    self.state.revisions_added(new_revs)
+                    self.compute_lines()
         finally:
-            self.throbber.hide()
+            self.end_loader_thread()
+        
+        if thread.exc_info is None and new_revs is None:
+            # The graph could not be updated, so load it again, unless
+            # another load was asked for.
+            if self.pending_load is None:
+                self.pending_load = lambda: self.load(*self.load_args)
+            self.run_pending_load()
+            return
+        
+        if new_revs:
+            revids = [rev.revid for rev in new_revs]
+            if self.file_id_filter:
+                QtCore.QTimer.singleShot(
+                    1, lambda: self.file_id_filter.load(revids))
+            QtCore.QTimer.singleShot(
+                1,
+                lambda: self.prop_search_filter.load_search_revisions(
+                    revids))
+        self.loader_thread_done(thread)
+        self.run_pending_load()
     
-    def compute_lines(self):
-        computed = self.graph_viz.compute_viz(self.state)
+    def compute_viz(self, graph_viz, state):
+        # Only the lines for rows that are painted are worked out, in data.
+        computed = graph_viz.compute_viz(state, lazy_lines=True)
         if self.last_rev_is_placeholder:
             computed.filtered_revs[-1].col_index = None
+        return computed
+    
+    def compute_lines(self):
+        computed = self.compute_viz(self.graph_viz, self.state)
+        removed, inserted = loggraphviz.filtered_revs_changes(
+            self.computed.filtered_revs, computed.filtered_revs)
+        
+        if len(removed) + len(inserted) > self.max_row_changes:
+            # Telling the view about each change would be slower than
+            # having it lay out everything again.
+            self.relayout(computed)
+            return
+        
+        # Tell the view about only the rows that were removed, or inserted,
+        # so that it keeps the scroll position and selection. While it is
+        # told, changing_rows holds the rows it knows about, which are
+        # shown without their graph.
+        old_computed = self.computed
+        parent = QtCore.QModelIndex()
+        self.changing_rows = list(old_computed.filtered_revs)
+        try:
+            for first, last in reversed(removed):
+                self.beginRemoveRows(parent, first, last)
+                del self.changing_rows[first:last + 1]
+                self.endRemoveRows()
+            for first, last in inserted:
+                self.beginInsertRows(parent, first, last)
+                self.changing_rows[first:first] = \
+                    computed.filtered_revs[first:last + 1]
+                self.endInsertRows()
+        finally:
+            self.changing_rows = None
+        self.computed = computed
+        self.graph_data = {}
+        
+        # Only the rows that are drawn differently, and the inserted rows,
+        # need to be painted again.
+        changed = loggraphviz.changed_rows(old_computed, computed)
+        if changed is not None:
+            first, last = changed
+            self.emit(QtCore.SIGNAL("dataChanged(QModelIndex, QModelIndex)"),
+                      self.index(first, COL_REV, parent),
+                      self.index(last, len(header_labels) - 1, parent))
+    
+    def relayout(self, computed):
+        """Swap in a new layout, and tell the view that the whole layout
+        changed."""
         self.emit(QtCore.SIGNAL("layoutAboutToBeChanged()"))
+        # Move the persistent indexes to the rows of their revisions in the
+        # new layout, or drop them if their revisions are no longer shown.
+        old_indexes = self.persistentIndexList()
+        new_indexes = []
+        for index in old_indexes:
+            rev = self.computed.filtered_revs[index.row()].rev
+            c_rev = computed.revisions[rev.index]
+            if c_rev is None:
+                new_indexes.append(QtCore.QModelIndex())
+            else:
+                new_indexes.append(self.createIndex(c_rev.f_index,
+                                                    index.column()))
         self.computed = computed
+        # The rows, and their lines and branch labels may have changed.
+        self.graph_data = {}
+        self.changePersistentIndexList(old_indexes, new_indexes)
         self.emit(QtCore.SIGNAL("layoutChanged()"))
     
     def collapse_expand_rev(self, c_rev):
@@ -259,6 +668,8 @@ class LogModel(QtCore.QAbstractTableModel):
     def rowCount(self, parent):
         if parent.isValid():
             return 0
+        if self.changing_rows is not None:
+            return len(self.changing_rows)
         return len(self.computed.filtered_revs)
     
     def data(self, index, role):
@@ -271,56 +682,24 @@ class LogModel(QtCore.QAbstractTableModel):
                 return QtCore.QVariant("")
             return QtCore.QVariant()
         
-        c_rev = self.computed.filtered_revs[index.row()]
+        if self.changing_rows is not None:
+            c_rev = self.changing_rows[index.row()]
+        else:
+            c_rev = self.computed.filtered_revs[index.row()]
         if c_rev is None:
             return blank()
         
-        if c_rev.rev.revid in cached_revisions:
-            revision = cached_revisions[c_rev.rev.revid]
-        else:
-            revision = None
-        
         if role == GraphDataRole:
-            prev_c_rev = None
-            prev_c_rev_f_index = c_rev.f_index - 1
-            if prev_c_rev_f_index >= 0:
-                prev_c_rev = self.computed.filtered_revs[prev_c_rev_f_index]
-            
-            tags = []
-            # Branch labels
-            tags.extend([(label,
-                          QtGui.QColor(24, 80, 200),
-                          QtGui.QColor(QtCore.Qt.white))
-                         for (branch_info, label) in c_rev.branch_labels
-                         if label])
-            # Tags
-            if c_rev.rev.revid in self.graph_viz.tags:
-                tags.extend(
-                    [(tag,
-                      QtGui.QColor(80, 128, 32),
-                      QtGui.QColor(QtCore.Qt.white))
-                     for tag in self.graph_viz.tags[c_rev.rev.revid]])
-            
-            # Bugs
-            if revision:
-                if hasattr(revision, '_qlog_bugs'):
-                    bugs = revision._qlog_bugs
-                else:
-                    bugs = []
-                    for bug in revision.properties.get('bugs', '').split('\n'):
-                        if bug:
-                            url = bug.split(' ', 1)[0]
-                            bug_id = get_bug_id(url)
-                            if bug_id:
-                                bugs.append(self.bugtext % bug_id)
-                    revision._qlog_bugs = bugs
-                tags.extend([(bug,
-                              QtGui.QColor(164, 0, 0),
-                              QtGui.QColor(QtCore.Qt.white))
-                             for bug in bugs])
-            is_clicked = c_rev.f_index == self.clicked_f_index
-            
-            return QtCore.QVariant((c_rev, prev_c_rev, tags, is_clicked))
+            if self.changing_rows is not None:
+                # The graph is drawn once all the rows are in place.
+                return blank()
+            if c_rev.f_index == self.clicked_f_index:
+                return self.make_graph_data(c_rev, True)
+            graph_data = self.graph_data.get(c_rev.f_index)
+            if graph_data is None:
+                graph_data = self.make_graph_data(c_rev, False)
+                self.graph_data[c_rev.f_index] = graph_data
+            return graph_data
         
         if (role == QtCore.Qt.DisplayRole and index.column() == COL_REV):
             return QtCore.QVariant(c_rev.rev.revno_str)
@@ -335,18 +714,75 @@ class LogModel(QtCore.QAbstractTableModel):
             return QtCore.QVariant(c_rev.rev.revid)
         
         #Everything from here foward will need to have the revision loaded.
-        if revision is None:
+        record = self.get_display_record(c_rev.rev.revid)
+        if record is None:
             return blank()
         
         if role == QtCore.Qt.DisplayRole and index.column() == COL_DATE:
-            return QtCore.QVariant(strftime("%Y-%m-%d %H:%M",
-                                            localtime(revision.timestamp)))
+            return record.date
         if role == QtCore.Qt.DisplayRole and index.column() == COL_AUTHOR:
-            return QtCore.QVariant(extract_name(get_apparent_author(revision)))
+            return record.author
         if role == QtCore.Qt.DisplayRole and index.column() == COL_MESSAGE:
-            return QtCore.QVariant(revision.get_summary())
+            return record.summary
         
         return blank()
+    
+    def make_graph_data(self, c_rev, is_clicked):
+        """Return the GraphDataRole data for a row."""
+        prev_c_rev = None
+        prev_c_rev_f_index = c_rev.f_index - 1
+        self.computed.ensure_lines(prev_c_rev_f_index, c_rev.f_index + 1)
+        if prev_c_rev_f_index >= 0:
+            prev_c_rev = self.computed.filtered_revs[prev_c_rev_f_index]
+        
+        revid = c_rev.rev.revid
+        labels = [(label, branch_label_color, label_text_color)
+                  for (branch_info, label) in c_rev.branch_labels
+                  if label]
+        labels.extend(self.get_tag_labels(revid))
+        record = self.get_display_record(revid)
+        if record is not None:
+            labels.extend(record.bug_labels)
+        
+        return QtCore.QVariant((c_rev, prev_c_rev, tuple(labels), is_clicked))
+    
+    def get_display_record(self, revid):
+        """Return the RevisionDisplayRecord for a revision, or None if the
+        revision has not been loaded."""
+        record = self.display_records.get(revid)
+        if record is None:
+            revision = cached_revisions.get(revid)
+            if revision is None:
+                return None
+            record = RevisionDisplayRecord(revision, self.bugtext)
+            self.display_records[revid] = record
+        return record
+    
+    def get_tag_labels(self, revid):
+        """Return the labels for the tags of a revision."""
+        tags = self.graph_viz.tags
+        if self.tag_labels_tags is not tags:
+            # The tags were loaded again.
+            self.tag_labels_tags = tags
+            self.tag_labels = {}
+        labels = self.tag_labels.get(revid)
+        if labels is None:
+            labels = tuple([(tag, tag_label_color, label_text_color)
+                            for tag in tags.get_revid_sorted_tags(revid)])
+            self.tag_labels[revid] = labels
+        return labels
+    
+    def tags_loaded(self):
+        """Update the tag search and labels, after the tags were loaded
+        again."""
+        self.prop_search_filter.tags_loaded()
+        self.graph_data = {}
+        if self.computed.filtered_revs:
+            parent = QtCore.QModelIndex()
+            self.emit(QtCore.SIGNAL("dataChanged(QModelIndex, QModelIndex)"),
+                      self.index(0, COL_MESSAGE, parent),
+                      self.index(len(self.computed.filtered_revs) - 1,
+                                 COL_MESSAGE, parent))
 
     def flags(self, index):
         if not index.isValid():
@@ -360,12 +796,25 @@ class LogModel(QtCore.QAbstractTableModel):
         return QtCore.QVariant()
 
     def on_revisions_loaded(self, revisions, last_call):
-        for revid in revisions.iterkeys():
-            rev = self.graph_viz.revid_rev[revid]
+        for revid, revision in revisions.iteritems():
+            if revid in self.display_records:
+                self.display_records[revid] = RevisionDisplayRecord(
+                    revision, self.bugtext)
+            rev = self.graph_viz.revid_rev.get(revid)
+            if rev is None:
+                # Only the mainline is shown while the graph is loading.
+                continue
+            try:
+                c_rev = self.computed.revisions[rev.index]
+            except IndexError:
+                continue
+            if c_rev is None:
+                continue
+            self.graph_data.pop(c_rev.f_index, None)
             self.emit(
                 QtCore.SIGNAL("dataChanged(QModelIndex, QModelIndex)"),
-                self.index(rev.index, COL_MESSAGE, QtCore.QModelIndex()),
-                self.index(rev.index, COL_AUTHOR, QtCore.QModelIndex()))
+                self.index(c_rev.f_index, COL_MESSAGE, QtCore.QModelIndex()),
+                self.index(c_rev.f_index, COL_AUTHOR, QtCore.QModelIndex()))
     
     def on_filter_changed(self):
         self.compute_lines()
@@ -399,15 +848,38 @@ class LogModel(QtCore.QAbstractTableModel):
         except IndexError:
             return None    
 
+def wildcard2regex(wildcard):
+    """Translate shel pattern to regexp."""
+    return fnmatch.translate(wildcard + '*')
+
+
 class PropertySearchFilter (object):
+    
+    match_slice_time = 0.05
+    """How long to match revisions for, before processing events."""
+    
     def __init__(self, graph_viz, filter_changed_callback):
         self.graph_viz = graph_viz
         self.filter_changed_callback = filter_changed_callback
         self.field = None
+        self.search_str = None
         self.filter_re = None
         self.cache = None
         self.index_matched_revids = None
+        self.search_matched_revids = None
+        """The revids that are known to match the search."""
+        self.search_unchecked_revids = None
+        """The revids that have not been matched against the search yet,
+        because they have not been loaded."""
+        self.search_index = None
         self.loading_revisions = False
+        self.pending_search = None
+        """The search to start once the revisions that are being matched or
+        loaded are done. Setting this cancels the matching and loading."""
+        self.pending_search_revids = []
+        self.paused = False
+        """True while a worker thread uses the branches and repositories.
+        Searching and loading waits until run_pending is called."""
     
     def set_search(self, str, field):
         """Set search string for specified kind of data.
@@ -417,29 +889,45 @@ class PropertySearchFilter (object):
                 - message
                 - index (require bzr-search plugin)
                 - author
+                - committer
                 - tag
                 - bug
 
         Value of `str` interpreted based on field value. For index it's used
         as input value for bzr-search engine.
-        For message, author, tag and bug it's used as shell pattern
+        For message, author, committer, tag and bug it's used as shell pattern
         (glob pattern) to search in corresponding metadata of revisions.
+        Message, author, committer and bug searches use the search index for
+        the revisions that have been indexed, then match the revisions that
+        are already loaded, and then load the rest. If the new pattern only
+        narrows the last one, only the revisions that matched the last one
+        are searched.
+        
+        If this is called while revisions are being matched or loaded for
+        the last search (from an event that is processed while doing so),
+        that is cancelled, and the search starts once it has stopped.
         """
-        self.field = field
+        if self.loading_revisions or self.paused:
+            self.pending_search = (str, field)
+            return
         
-        def revisions_loaded(revisions, last_call):
-            revs = [self.graph_viz.revid_rev[revid]
-                    for revid in revisions.iterkeys()]
-            self.filter_changed_callback(revs, last_call)
+        self.loading_revisions = True
+        try:
+            self._set_search(str, field)
+        finally:
+            self.loading_revisions = False
+        self.run_pending()
+    
+    def _set_search(self, str, field):
+        old_str = self.search_str
+        old_field = self.field
+        old_matched_revids = self.search_matched_revids
+        old_unchecked_revids = self.search_unchecked_revids
         
-        def before_batch_load(repo, revids):
-            if self.filter_re is None:
-                return True
-            return False
-
-        def wildcard2regex(wildcard):
-            """Translate shel pattern to regexp."""
-            return fnmatch.translate(wildcard + '*')
+        self.field = field
+        self.search_str = str
+        self.search_matched_revids = None
+        self.search_unchecked_revids = None
         
         if str is None or str == u"":
             self.filter_re = None
@@ -469,59 +957,200 @@ class PropertySearchFilter (object):
                                 pass
             elif self.field == "tag":
                 self.filter_re = None
-                filter_re = re.compile(wildcard2regex(str), re.IGNORECASE)
-                self.index_matched_revids = {}
-                for revid in self.graph_viz.tags:
-                    for t in self.graph_viz.tags[revid]:
-                        if filter_re.search(t):
-                            self.index_matched_revids[revid] = True
-                            break
+                self.load_tag_matches()
             else:
                 self.filter_re = re.compile(wildcard2regex(str),
                     re.IGNORECASE)
                 self.index_matched_revids = None
+                
+                if (old_matched_revids is not None and old_field == field
+                    and pattern_narrows(old_str, str)):
+                    # Only the revisions that matched the last search, or
+                    # that it did not get to, can match.
+                    revids = list(old_matched_revids)
+                    revids.extend(old_unchecked_revids)
+                else:
+                    revids = [rev.revid for rev in self.graph_viz.revisions]
+                
+                self.search_matched_revids = set()
+                search_index = self.get_search_index()
+                if search_index is not None:
+                    index_matched_revids = search_index.search(
+                        field, str, self.filter_re)
+                    if index_matched_revids is not None:
+                        revids_set = set(revids)
+                        self.search_matched_revids.update(
+                            [revid for revid in index_matched_revids
+                             if revid in revids_set])
+                        revids = search_index.get_unindexed_revids(revids)
+                
+                # Revisions are matched, and indexed, by their message, so
+                # those whose message has been dropped are loaded again.
+                loaded_revids = [revid for revid in revids
+                                 if cached_revisions.has_message(revid)]
+                self.search_unchecked_revids = set(
+                    [revid for revid in revids
+                     if not cached_revisions.has_message(revid)])
             
             self.filter_changed_callback(None, True)
             
-            if self.filter_re is not None\
-               and not self.loading_revisions:
-                
-                self.loading_revisions = True
-                try:
-                    revids = [rev.revid
-                              for rev in self.graph_viz.revisions ]
-                    load_revisions(revids, self.graph_viz.get_repo_revids,
-                                   time_before_first_ui_update = 0,
-                                   local_batch_size = 100,
-                                   remote_batch_size = 10,
-                                   before_batch_load = before_batch_load,
-                                   revisions_loaded = revisions_loaded)
-                finally:
-                    self.loading_revisions = False
+            if self.filter_re is not None:
+                if self.match_loaded_revisions(loaded_revids):
+                    self._load_search_revisions(
+                        list(self.search_unchecked_revids))
+    
+    def run_pending(self):
+        """Start the search, or the loading, that was asked for while
+        revisions were being matched or loaded, or while paused."""
+        if self.pending_search is not None:
+            str, field = self.pending_search
+            self.pending_search = None
+            self.set_search(str, field)
+        elif self.pending_search_revids:
+            revids = self.pending_search_revids
+            self.pending_search_revids = []
+            self.load_search_revisions(revids)
+    
+    def match_loaded_revisions(self, revids):
+        """Match revisions that are already loaded against the search.
+        
+        Events are processed every so often, so that the ui stays responsive.
+        
+        :return: False if this was cancelled by a new search.
+        """
+        search_index = self.get_search_index()
+        revid_rev = self.graph_viz.revid_rev
+        offset = 0
+        while offset < len(revids):
+            if self.pending_search is not None:
+                # The next search may narrow this one, so it needs to know
+                # what we did not get to.
+                self.search_unchecked_revids.update(revids[offset:])
+                return False
+            slice_start = clock()
+            matched_revs = []
+            revisions = []
+            while (offset < len(revids) and
+                   clock() - slice_start < self.match_slice_time):
+                revid = revids[offset]
+                offset += 1
+                if not cached_revisions.has_message(revid):
+                    # The message was dropped since we checked.
+                    self.search_unchecked_revids.add(revid)
+                    continue
+                revision = cached_revisions[revid]
+                revisions.append(revision)
+                if self.revision_matches(revision):
+                    self.search_matched_revids.add(revid)
+                    matched_revs.append(revid_rev[revid])
+            if search_index is not None:
+                search_index.add_revisions(revisions)
+            self.filter_changed_callback(matched_revs, offset == len(revids))
+            self.graph_viz.update_ui()
+        return True
+    
+    def get_search_index(self):
+        """Return the search index for the repositories of the graph, or None
+        if it can't be used."""
+        if self.search_index is None:
+            try:
+                filename = diskcache.get_repos_cache_filename(
+                    'search', self.graph_viz.repos)
+            except (IOError, OSError):
+                return None
+            self.search_index = RevisionSearchIndex(filename)
+        if self.search_index.broken:
+            return None
+        return self.search_index
+    
+    def update_search_index(self):
+        """Index the revisions that are not in the search index yet, if it
+        has been used before."""
+        self.load_search_revisions(
+            [rev.revid for rev in self.graph_viz.revisions])
+    
+    def load_tag_matches(self):
+        self.index_matched_revids = self.graph_viz.tags.search(self.search_str)
+    
+    def tags_loaded(self):
+        """Match the search again, after the tags were loaded again."""
+        if self.field == "tag" and self.index_matched_revids is not None:
+            self.load_tag_matches()
+            self.filter_changed_callback(None, True)
+    
+    def load_search_revisions(self, revids):
+        """Load the revisions, so that they can be indexed, and matched
+        against the search."""
+        if self.loading_revisions or self.paused:
+            if self.filter_re is not None:
+                self.search_unchecked_revids.update(revids)
+            self.pending_search_revids.extend(revids)
+            return
+        
+        self.loading_revisions = True
+        try:
+            self._load_search_revisions(revids)
+        finally:
+            self.loading_revisions = False
+        self.run_pending()
+    
+    def _load_search_revisions(self, revids):
+        search_index = self.get_search_index()
+        if search_index is not None and (self.filter_re is not None or
+                                         search_index.exists()):
+            revids = search_index.get_unindexed_revids(revids)
+        else:
+            search_index = None
+            if self.filter_re is None:
+                return
+        if self.filter_re is not None:
+            self.search_unchecked_revids.update(revids)
+        
+        def revisions_loaded(revisions, last_call):
+            if search_index is not None:
+                search_index.add_revisions(revisions.values())
+            if self.filter_re is not None:
+                self.search_unchecked_revids.difference_update(revisions)
+                for revid, revision in revisions.iteritems():
+                    if self.revision_matches(revision):
+                        self.search_matched_revids.add(revid)
+                revs = [self.graph_viz.revid_rev[revid]
+                        for revid in revisions.iterkeys()]
+                self.filter_changed_callback(revs, last_call)
+        
+        def before_batch_load(repo, revids):
+            # Stop if there is a new search.
+            if self.pending_search is not None:
+                return True
+            # Without an index, the revisions are only needed while there is
+            # a search.
+            if search_index is None and self.filter_re is None:
+                return True
+            return False
+        
+        if not revids:
+            return
+        
+        load_revisions(revids, self.graph_viz.get_repo_revids,
+                       time_before_first_ui_update = 0,
+                       local_batch_size = 100,
+                       remote_batch_size = 10,
+                       before_batch_load = before_batch_load,
+                       revisions_loaded = revisions_loaded,
+                       pass_prev_loaded_rev = True,
+                       with_messages = True)
+    
+    def revisions_added(self, revs):
+        # The tags may have changed too.
+        if self.field == "tag" and self.index_matched_revids is not None:
+            self.load_tag_matches()
     
     def get_revision_visible(self, rev):
         
         if self.filter_re:
             revid = rev.revid
-            if revid not in cached_revisions:
+            if revid not in self.search_matched_revids:
                 return False
-            revision = cached_revisions[revid]
-            
-            filtered_str = None
-            if self.field == "message":
-                filtered_str = revision.message
-            elif self.field == "author":
-                filtered_str = get_apparent_author(revision)
-            elif self.field == "bug":
-                rbugs = revision.properties.get('bugs', '')
-                if rbugs:
-                    filtered_str = rbugs.replace('\n', ' ')
-                else:
-                    return False
-
-            if filtered_str is not None:
-                if self.filter_re.search(filtered_str) is None:
-                    return False
         
         if self.index_matched_revids is not None:
             revid = rev.revid
@@ -529,3 +1158,44 @@ class PropertySearchFilter (object):
                 return False
         
         return True
+    
+    def get_revisions_visible(self):
+        if not self.filter_re and self.index_matched_revids is None:
+            return None
+        
+        if self.filter_re and self.index_matched_revids is not None:
+            matched_revids = [revid for revid in self.search_matched_revids
+                              if revid in self.index_matched_revids]
+        elif self.filter_re:
+            matched_revids = self.search_matched_revids
+        else:
+            matched_revids = self.index_matched_revids
+        
+        visible = array('b', [0]) * len(self.graph_viz.revisions)
+        revid_rev = self.graph_viz.revid_rev
+        for revid in matched_revids:
+            rev = revid_rev.get(revid)
+            if rev is not None:
+                visible[rev.index] = 1
+        return visible
+    
+    def revision_matches(self, revision):
+        """Return whether revision matches the search."""
+        filtered_str = None
+        if self.field == "message":
+            filtered_str = revision.message
+        elif self.field == "author":
+            filtered_str = get_apparent_author(revision)
+        elif self.field == "committer":
+            filtered_str = revision.committer
+        elif self.field == "bug":
+            rbugs = revision.properties.get('bugs', '')
+            if rbugs:
+                filtered_str = rbugs.replace('\n', ' ')
+            else:
+                return False
+        
+        if filtered_str is not None:
+            if self.filter_re.search(filtered_str) is None:
+                return False
+        return True
@@ -22,6 +22,7 @@ from PyQt4 import QtCore, QtGui
 from bzrlib.plugins.qbzr.lib.revtreeview import (RevisionTreeView,
                                                  RevNoItemDelegate,
                                                  get_text_color)
+from bzrlib.lru_cache import LRUSizeCache
 from bzrlib.revision import NULL_REVISION, CURRENT_REVISION
 from bzrlib.plugins.qbzr.lib.util import (
     runs_in_loading_queue,
@@ -58,8 +59,9 @@ class LogList(RevisionTreeView):
         self.setRootIsDecorated (False)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOn)
 
+        self.graph_tags_bugs_item_delegate = GraphTagsBugsItemDelegate(self)
         self.setItemDelegateForColumn(logmodel.COL_MESSAGE,
-                                      GraphTagsBugsItemDelegate(self))
+                                      self.graph_tags_bugs_item_delegate)
         self.rev_no_item_delegate = RevNoItemDelegate(parent=self)
         self.setItemDelegateForColumn(logmodel.COL_REV,
                                       self.rev_no_item_delegate)
@@ -74,6 +76,17 @@ class LogList(RevisionTreeView):
         self.connect(self.log_model,
                      QtCore.SIGNAL("layoutChanged()"),
                      self.lines_updated_restore_selection)
+        # The rendered graph cells of the old layout are unlikely to be
+        # used again.
+        self.connect(self.log_model,
+                     QtCore.SIGNAL("layoutChanged()"),
+                     self.graph_tags_bugs_item_delegate.clear_pixmaps)
+        self.connect(self.log_model,
+                     QtCore.SIGNAL("mainlineLoaded()"),
+                     self._adjust_revno_column)
+        self.connect(self.log_model,
+                     QtCore.SIGNAL("loaded()"),
+                     self.graph_loaded)
         
         header = self.header()
         header.setStretchLastSection(False)
@@ -100,21 +113,31 @@ class LogList(RevisionTreeView):
         if self.view_commands:
             self.connect(self,
                          QtCore.SIGNAL("doubleClicked(QModelIndex)"),
-                         self.default_action)
+                         self.double_clicked)
         self.context_menu = QtGui.QMenu(self)
         self.context_menu_initialized = False
 
     def load(self, *args, **kargs):
-        self.load_args = (args, kargs)
+        """Start loading the log. See LogModel.load."""
         self.log_model.load(*args, **kargs)
-        self.create_context_menu()
-        self._adjust_revno_column()
     
     @runs_in_loading_queue
     @ui_current_widget
     def refresh(self, b=True):
-        (args, kargs) = self.load_args
-        self.load(*args, **kargs)
+        self.log_model.refresh()
+    
+    def graph_loaded(self):
+        self.create_context_menu()
+        self._adjust_revno_column()
+    
+    def is_loading(self):
+        """Return True while the graph is being loaded, or refreshed, in a
+        thread. The branches and repositories must not be used till then."""
+        return self.log_model.loader_thread is not None
+    
+    def double_clicked(self, index):
+        if not self.is_loading():
+            self.default_action(index)
     
     def create_context_menu(self, diff_is_default_action=True):
         if self.context_menu_initialized:
@@ -223,12 +246,25 @@ class LogList(RevisionTreeView):
         header.resizeSection(logmodel.COL_REV,
             fm.width(("8"*max_mainline_digits)+".8.888") + col_margin)
 
+    def scroll_changed(self, value):
+        # Work out the graph lines for the rows that are about to be shown,
+        # and a page either side, in one go, rather than as each row is
+        # painted.
+        top_index = self.indexAt(self.viewport().rect().topLeft())
+        if top_index.isValid():
+            page_rows = (self.viewport().height() //
+                         max(self.rowHeight(top_index), 1))
+            self.log_model.computed.ensure_lines(
+                top_index.row() - page_rows, top_index.row() + 2 * page_rows)
+        RevisionTreeView.scroll_changed(self, value)
+    
     def refresh_tags(self):
         self.log_model.graph_viz.lock_read_branches()
         try:
             self.log_model.graph_viz.load_tags()
         finally:
             self.log_model.graph_viz.unlock_branches()
+        self.log_model.tags_loaded()
 
     def get_c_rev_under_twisty_pos(self, pos):
         index = self.indexAt(pos)
@@ -267,7 +303,8 @@ class LogList(RevisionTreeView):
         e_key = e.key()
         if e_key in (QtCore.Qt.Key_Enter, QtCore.Qt.Key_Return) and self.view_commands:
             e.accept()
-            self.default_action()
+            if not self.is_loading():
+                self.default_action()
         elif e_key in (QtCore.Qt.Key_Left, QtCore.Qt.Key_Right):
             e.accept()
             indexes = self.get_selection_indexes()
@@ -586,6 +623,8 @@ class LogList(RevisionTreeView):
         self.window().windows.append(window)
 
     def show_context_menu(self, pos):
+        if self.is_loading():
+            return
         branch_count = len(self.log_model.graph_viz.branches)
         (top_revid, old_revid), count = \
               self.get_selection_top_and_parent_revids_and_count()
@@ -661,9 +700,28 @@ class BranchMenu(QtGui.QMenu):
         self.emit(QtCore.SIGNAL("bm_triggered"), branch_info)
 
 
+def _cached_pixmap_size(value):
+    """Return the number of bytes of a pixmap, or of the pixmap in a
+    (pixmap, graphCols) tuple, that is cached by GraphTagsBugsItemDelegate."""
+    if isinstance(value, tuple):
+        value = value[0]
+    return max(value.width() * value.height() * value.depth() / 8, 1)
+
+
 class GraphTagsBugsItemDelegate(QtGui.QStyledItemDelegate):
 
     _twistyColor = QtCore.Qt.black
+    
+    max_cached_pixmap_bytes = 16 * 1024 * 1024
+    """Number of bytes of rendered graph cells and labels that are kept."""
+    
+    def __init__(self, parent=None):
+        QtGui.QStyledItemDelegate.__init__(self, parent)
+        self.pixmaps = LRUSizeCache(self.max_cached_pixmap_bytes,
+                                    compute_size=_cached_pixmap_size)
+    
+    def clear_pixmaps(self):
+        self.pixmaps.clear()
 
     def paint(self, painter, option, index):
         data = index.data(logmodel.GraphDataRole)
@@ -699,102 +757,21 @@ class GraphTagsBugsItemDelegate(QtGui.QStyledItemDelegate):
         style.drawPrimitive(QtGui.QStyle.PE_PanelItemViewItem,
                             option, painter, widget)
         
-        graphCols = 0
         rect = option.rect
         if draw_graph:
-            painter.save()
-            try:
-                painter.setRenderHint(QtGui.QPainter.Antialiasing)            
-                boxsize = float(rect.height())
-                dotsize = 0.7
-                pen = QtGui.QPen()
-                penwidth = 1
-                pen.setWidth(penwidth)
-                pen.setCapStyle(QtCore.Qt.FlatCap)
-                #this is to try get lines 1 pixel wide to actualy be 1 pixel wide.
-                painter.translate(0.5, 0.5)
-                
-                # Draw lines into the cell
-                if prev_c_rev:
-                    for start, end, color, direct in prev_c_rev.lines:
-                        self.drawLine (painter, pen, rect, boxsize,
-                                       rect.y(), boxsize,
-                                       start, end, color, direct)
-                        graphCols = max((graphCols, min(start, end)))
-        
-                # Draw lines out of the cell
-                if c_rev:
-                    for start, end, color, direct in c_rev.lines:
-                        self.drawLine (painter, pen, rect,boxsize,
-                                       rect.y() + boxsize, boxsize,
-                                       start, end, color, direct)
-                        graphCols = max((graphCols, min(start, end)))
-                
-                # Draw the revision node in the right column
-                
-                if c_rev.col_index is not None:
-                    graphCols = max((graphCols, c_rev.col_index))
-                    pen.setColor(self.get_color(c_rev.rev.color, False))
-                    painter.setPen(pen)
-                    if not is_clicked:
-                        painter.setBrush(QtGui.QBrush(
-                            self.get_color(c_rev.rev.color,True)))
-                    else:
-                        painter.setBrush(QtGui.QBrush(QtCore.Qt.white))
-                        
-                    centerx = rect.x() + boxsize * (c_rev.col_index + 0.5)
-                    centery = rect.y() + boxsize * 0.5
-                    painter.drawEllipse(
-                        QtCore.QRectF(centerx - (boxsize * dotsize * 0.5 ),
-                                      centery - (boxsize * dotsize * 0.5 ),
-                                     boxsize * dotsize, boxsize * dotsize))
-    
-                    # Draw twisty
-                    if not is_clicked and c_rev.twisty_state is not None:
-                        linesize = 0.35
-                        pen.setColor(self._twistyColor)
-                        painter.setPen(pen)
-                        
-                        painter.drawLine(QtCore.QLineF
-                                         (centerx - boxsize * linesize / 2,
-                                          centery,
-                                          centerx + boxsize * linesize / 2,
-                                          centery))
-                        if not c_rev.twisty_state:
-                            painter.drawLine(QtCore.QLineF
-                                             (centerx,
-                                              centery - boxsize * linesize / 2,
-                                              centerx,
-                                              centery + boxsize * linesize / 2))
-                
-            finally:
-                painter.restore()
-                rect.adjust( (graphCols + 1.5) * boxsize, 0, 0, 0)        
-                
-            painter.save()
+            boxsize = rect.height()
+            graph_pixmap, graphCols = self.get_graph_pixmap(
+                c_rev, prev_c_rev, is_clicked, boxsize)
+            painter.drawPixmap(rect.topLeft(), graph_pixmap)
+            rect.adjust((graphCols + 1.5) * boxsize, 0, 0, 0)
+            
             x = 0
-            try:
-                tagFont = QtGui.QFont(option.font)
-                tagFont.setPointSizeF(tagFont.pointSizeF() * 9 / 10)
-        
-                for label, bg_color, text_color in labels:
-                    tagRect = rect.adjusted(1, 1, -1, -1)
-                    tagRect.setWidth(QtGui.QFontMetrics(tagFont).width(label) + 6)
-                    tagRect.moveLeft(tagRect.x() + x)
-                    painter.setPen(bg_color)
-                    painter.fillRect(tagRect.adjusted(1, 1, -1, -1), bg_color)
-                    tl = tagRect.topLeft()
-                    br = tagRect.bottomRight()
-                    painter.drawLine(tl.x(), tl.y() + 1, tl.x(), br.y() - 1)
-                    painter.drawLine(br.x(), tl.y() + 1, br.x(), br.y() - 1)
-                    painter.drawLine(tl.x() + 1, tl.y(), br.x() - 1, tl.y())
-                    painter.drawLine(tl.x() + 1, br.y(), br.x() - 1, br.y())
-                    painter.setFont(tagFont)
-                    painter.setPen(text_color)
-                    painter.drawText(tagRect.left() + 3, tagRect.bottom() - option.fontMetrics.descent() + 1, label)
-                    x += tagRect.width() + text_margin
-            finally:
-                painter.restore()
+            for label, bg_color, text_color in labels:
+                label_pixmap = self.get_label_pixmap(
+                    label, bg_color, text_color, option, rect.height())
+                painter.drawPixmap(rect.x() + 1 + x, rect.y() + 1,
+                                   label_pixmap)
+                x += label_pixmap.width() + text_margin
             rect.adjust(x, 0, 0, 0)
         
         if not option.text.isEmpty():
@@ -812,6 +789,137 @@ class GraphTagsBugsItemDelegate(QtGui.QStyledItemDelegate):
         
         painter.restore()
     
+    def get_graph_pixmap(self, c_rev, prev_c_rev, is_clicked, boxsize):
+        """Return a pixmap of the graph for a row, and the last column that
+        is used.
+        
+        Rows that look the same share the pixmap, so the pixmaps are keyed
+        by what is drawn, rather than by the row.
+        """
+        if prev_c_rev:
+            in_lines = tuple(prev_c_rev.lines)
+        else:
+            in_lines = ()
+        out_lines = tuple(c_rev.lines)
+        key = ('graph', boxsize, in_lines, out_lines, c_rev.col_index,
+               c_rev.rev.color, c_rev.twisty_state, is_clicked)
+        cached = self.pixmaps.get(key)
+        if cached is not None:
+            return cached
+        
+        graphCols = 0
+        max_col = 0
+        for start, end, color, direct in in_lines + out_lines:
+            graphCols = max((graphCols, min(start, end)))
+            max_col = max((max_col, start, end))
+        if c_rev.col_index is not None:
+            graphCols = max((graphCols, c_rev.col_index))
+            max_col = max((max_col, c_rev.col_index))
+        
+        pixmap = QtGui.QPixmap((max_col + 1) * boxsize + 1, boxsize)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        try:
+            self.draw_graph(painter, pixmap.rect(), c_rev, in_lines,
+                            out_lines, is_clicked)
+        finally:
+            painter.end()
+        self.pixmaps[key] = (pixmap, graphCols)
+        return pixmap, graphCols
+    
+    def draw_graph(self, painter, rect, c_rev, in_lines, out_lines,
+                   is_clicked):
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)            
+        boxsize = float(rect.height())
+        dotsize = 0.7
+        pen = QtGui.QPen()
+        penwidth = 1
+        pen.setWidth(penwidth)
+        pen.setCapStyle(QtCore.Qt.FlatCap)
+        #this is to try get lines 1 pixel wide to actualy be 1 pixel wide.
+        painter.translate(0.5, 0.5)
+        
+        # Draw lines into the cell
+        for start, end, color, direct in in_lines:
+            self.drawLine (painter, pen, rect, boxsize,
+                           rect.y(), boxsize,
+                           start, end, color, direct)
+        
+        # Draw lines out of the cell
+        for start, end, color, direct in out_lines:
+            self.drawLine (painter, pen, rect,boxsize,
+                           rect.y() + boxsize, boxsize,
+                           start, end, color, direct)
+        
+        # Draw the revision node in the right column
+        
+        if c_rev.col_index is not None:
+            pen.setColor(self.get_color(c_rev.rev.color, False))
+            painter.setPen(pen)
+            if not is_clicked:
+                painter.setBrush(QtGui.QBrush(
+                    self.get_color(c_rev.rev.color,True)))
+            else:
+                painter.setBrush(QtGui.QBrush(QtCore.Qt.white))
+                
+            centerx = rect.x() + boxsize * (c_rev.col_index + 0.5)
+            centery = rect.y() + boxsize * 0.5
+            painter.drawEllipse(
+                QtCore.QRectF(centerx - (boxsize * dotsize * 0.5 ),
+                              centery - (boxsize * dotsize * 0.5 ),
+                             boxsize * dotsize, boxsize * dotsize))
+
+            # Draw twisty
+            if not is_clicked and c_rev.twisty_state is not None:
+                linesize = 0.35
+                pen.setColor(self._twistyColor)
+                painter.setPen(pen)
+                
+                painter.drawLine(QtCore.QLineF
+                                 (centerx - boxsize * linesize / 2,
+                                  centery,
+                                  centerx + boxsize * linesize / 2,
+                                  centery))
+                if not c_rev.twisty_state:
+                    painter.drawLine(QtCore.QLineF
+                                     (centerx,
+                                      centery - boxsize * linesize / 2,
+                                      centerx,
+                                      centery + boxsize * linesize / 2))
+    
+    def get_label_pixmap(self, label, bg_color, text_color, option, height):
+        """Return a pixmap of a tag, bug or branch label."""
+        key = ('label', label, bg_color.rgba(), text_color.rgba(),
+               option.font.key(), height)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            return pixmap
+        
+        tagFont = QtGui.QFont(option.font)
+        tagFont.setPointSizeF(tagFont.pointSizeF() * 9 / 10)
+        tagRect = QtCore.QRect(0, 0,
+                               QtGui.QFontMetrics(tagFont).width(label) + 6,
+                               height - 2)
+        pixmap = QtGui.QPixmap(tagRect.size())
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        try:
+            painter.setPen(bg_color)
+            painter.fillRect(tagRect.adjusted(1, 1, -1, -1), bg_color)
+            tl = tagRect.topLeft()
+            br = tagRect.bottomRight()
+            painter.drawLine(tl.x(), tl.y() + 1, tl.x(), br.y() - 1)
+            painter.drawLine(br.x(), tl.y() + 1, br.x(), br.y() - 1)
+            painter.drawLine(tl.x() + 1, tl.y(), br.x() - 1, tl.y())
+            painter.drawLine(tl.x() + 1, br.y(), br.x() - 1, br.y())
+            painter.setFont(tagFont)
+            painter.setPen(text_color)
+            painter.drawText(tagRect.left() + 3, tagRect.bottom() - option.fontMetrics.descent() + 1, label)
+        finally:
+            painter.end()
+        self.pixmaps[key] = pixmap
+        return pixmap
+    
     def get_color(self, color, back):
         qcolor = QtGui.QColor()
         if color == 0:
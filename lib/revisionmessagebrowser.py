@@ -146,7 +146,8 @@ class RevisionMessageBrowser(QtGui.QTextBrowser):
         
         load_revisions(list(revids_to_load), repo, 
                        revisions_loaded=self.revisions_loaded,
-                       pass_prev_loaded_rev=True)
+                       pass_prev_loaded_rev=True,
+                       with_messages=True)
     
     def revisions_loaded(self, revs_loaded, last_call):
         self._all_loaded_revs.update(revs_loaded)
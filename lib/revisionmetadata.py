@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Store for the metadata of the revisions that have been loaded.
+
+Rather than keeping a full Revision object for every revision that has been
+loaded, the fields that qbzr shows (timestamp, committer, authors, summary,
+properties, ...) are kept in a list or array per field. Full messages are
+only needed for a few revisions at a time, so only a limited number of them
+are kept. Revisions whose message has been dropped are loaded again by
+`lookup` callers that ask for messages, such as
+`lazycachedrevloader.load_revisions` with ``with_messages=True``.
+
+Revisions never change, so revisions loaded from remote repositories may also
+be kept on disk, in a `RevisionDiskCache`.
+"""
+
+from array import array
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from bzrlib import trace
+from bzrlib.chk_serializer import chk_bencode_serializer
+from bzrlib.lru_cache import LRUCache
+from bzrlib.revision import Revision
+
+from bzrlib.plugins.qbzr.lib.bugs import get_bug_id
+
+
+class CachedRevision(object):
+    """A revision in a `RevisionMetadataStore`.
+
+    This has the attributes and methods of bzrlib.revision.Revision that
+    qbzr uses.
+    """
+
+    __slots__ = ["_store", "_index"]
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    @property
+    def revision_id(self):
+        return self._store.revids[self._index]
+
+    @property
+    def parent_ids(self):
+        return list(self._store.parent_ids[self._index])
+
+    @property
+    def committer(self):
+        return self._store.committers[self._index]
+
+    @property
+    def timestamp(self):
+        return self._store.timestamps[self._index]
+
+    @property
+    def timezone(self):
+        return self._store.timezones[self._index]
+
+    @property
+    def properties(self):
+        return self._store.properties[self._index]
+
+    @property
+    def repository(self):
+        return self._store.repositories[self._store.repo_indexes[self._index]]
+
+    @property
+    def message(self):
+        return self._store.get_message(self._index)
+
+    def get_summary(self):
+        """Return the first line of the message, or None if the message is
+        None."""
+        return self._store.summaries[self._index]
+
+    def get_apparent_authors(self):
+        return list(self._store.authors[self._index])
+
+    def __eq__(self, other):
+        return (isinstance(other, CachedRevision) and
+                self._store is other._store and
+                self._index == other._index)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.revision_id)
+
+
+def parse_bug_ids(properties):
+    """Return the ids of the bugs in the bugs property of a revision."""
+    bug_ids = []
+    for bug in properties.get('bugs', '').split('\n'):
+        if bug:
+            url = bug.split(' ', 1)[0]
+            bug_id = get_bug_id(url)
+            if bug_id:
+                bug_ids.append(bug_id)
+    return tuple(bug_ids)
+
+
+class RevisionMetadataStore(object):
+    """Store of the metadata of loaded revisions.
+
+    This can be used like a dict of revision id to revision. Revisions added
+    with `add_revision` are returned as `CachedRevision` objects. Other
+    revision objects (such as for a working tree) may be set directly, and
+    are kept as is.
+
+    The number of lookups that were found (``hits``), and not found
+    (``misses``) by `lookup`, the number of revisions that had to be loaded
+    again for their message (``message_misses``), and the number of messages
+    that were dropped (``evictions``) are counted.
+    """
+
+    max_messages = 1000
+    """The number of full messages to keep."""
+
+    def __init__(self, max_messages=None):
+        if max_messages is not None:
+            self.max_messages = max_messages
+        self.revid_index = {}
+        self.revids = []
+        self.parent_ids = []
+        self.committers = []
+        self.authors = []
+        self.timestamps = array('d')
+        self.timezones = []
+        self.summaries = []
+        self.properties = []
+        self.bug_ids = []
+        self.repo_indexes = array('i')
+        self.repositories = []
+        self._repository_index = {}
+        self._values = {}
+        self._messages = LRUCache(self.max_messages)
+        self.other_revisions = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.message_misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.revids) + len(self.other_revisions)
+
+    def __contains__(self, revid):
+        return revid in self.revid_index or revid in self.other_revisions
+
+    def __getitem__(self, revid):
+        if revid in self.other_revisions:
+            return self.other_revisions[revid]
+        return CachedRevision(self, self.revid_index[revid])
+
+    def __setitem__(self, revid, revision):
+        self.other_revisions[revid] = revision
+
+    def get(self, revid, default=None):
+        if revid in self:
+            return self[revid]
+        return default
+
+    def has_message(self, revid):
+        """Return whether a revision is in the store with its full
+        message."""
+        return (revid in self.other_revisions or
+                (revid in self.revid_index and revid in self._messages))
+
+    def lookup(self, revids, with_messages=False):
+        """Look up revisions.
+
+        :param with_messages: If True, revisions whose message has been
+            dropped are returned as not in the store, so that they are
+            loaded again.
+        :return: A dict of revid to revision for the revisions that are in
+            the store, and a list of the revids that are not.
+        """
+        found = {}
+        missing = []
+        for revid in revids:
+            if revid not in self:
+                missing.append(revid)
+            elif with_messages and not self.has_message(revid):
+                self.message_misses += 1
+                missing.append(revid)
+            else:
+                found[revid] = self[revid]
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def _intern(self, value):
+        return self._values.setdefault(value, value)
+
+    def add_revision(self, rev, repository):
+        """Add a revision loaded from repository.
+
+        :return: The revision as it will be returned by the store.
+        """
+        revid = rev.revision_id
+        if type(rev) is not Revision or rev.timestamp is None:
+            # Subclasses, such as foreign revisions, may have more
+            # attributes than we keep, so keep them as is.
+            rev.repository = repository
+            self.other_revisions[revid] = rev
+            return rev
+
+        repo_key = id(repository)
+        if repo_key not in self._repository_index:
+            self._repository_index[repo_key] = len(self.repositories)
+            self.repositories.append(repository)
+        repo_index = self._repository_index[repo_key]
+
+        if rev.message is None:
+            summary = None
+        else:
+            summary = rev.get_summary()
+
+        if revid in self.revid_index:
+            index = self.revid_index[revid]
+            self.parent_ids[index] = tuple(rev.parent_ids)
+            self.committers[index] = self._intern(rev.committer)
+            self.authors[index] = self._intern(
+                tuple(rev.get_apparent_authors()))
+            self.timestamps[index] = rev.timestamp
+            self.timezones[index] = rev.timezone
+            self.summaries[index] = summary
+            self.properties[index] = rev.properties
+            self.bug_ids[index] = None
+            self.repo_indexes[index] = repo_index
+        else:
+            index = len(self.revids)
+            self.revid_index[revid] = index
+            self.revids.append(revid)
+            self.parent_ids.append(tuple(rev.parent_ids))
+            self.committers.append(self._intern(rev.committer))
+            self.authors.append(self._intern(
+                tuple(rev.get_apparent_authors())))
+            self.timestamps.append(rev.timestamp)
+            self.timezones.append(rev.timezone)
+            self.summaries.append(summary)
+            self.properties.append(rev.properties)
+            self.bug_ids.append(None)
+            self.repo_indexes.append(repo_index)
+
+        self._add_message(revid, rev.message)
+        return CachedRevision(self, index)
+
+    def _add_message(self, revid, message):
+        if revid in self._messages:
+            self._messages[revid] = message
+        else:
+            count = len(self._messages)
+            self._messages[revid] = message
+            self.evictions += count + 1 - len(self._messages)
+
+    def get_message(self, index):
+        """Return the full message of the revision at index.
+
+        If it has been dropped, the summary is returned until the revision is
+        loaded again, as this may be called on the ui thread, where the
+        repository should not be read. See `lookup`.
+        """
+        revid = self.revids[index]
+        if revid in self._messages:
+            return self._messages[revid]
+        return self.summaries[index]
+
+    def get_bug_ids(self, revid):
+        """Return the ids of the bugs in the bugs property of a revision."""
+        if revid in self.other_revisions:
+            return parse_bug_ids(self.other_revisions[revid].properties)
+        index = self.revid_index[revid]
+        bug_ids = self.bug_ids[index]
+        if bug_ids is None:
+            bug_ids = parse_bug_ids(self.properties[index])
+            self.bug_ids[index] = bug_ids
+        return bug_ids
+
+
+class RevisionDiskCache(object):
+    """Cache on disk of the revisions of a repository.
+
+    The cache is a sqlite database of serialized revisions, keyed by revid.
+    When it has more than max_revisions, the revisions that were added first
+    are removed. If sqlite is not available, or anything goes wrong with the
+    database, the cache acts as if it is empty.
+    """
+
+    max_revisions = 100000
+
+    query_batch_size = 500
+    """The number of revisions to query at a time. sqlite limits the number
+    of parameters of a query."""
+
+    def __init__(self, filename, max_revisions=None):
+        self.filename = filename
+        if max_revisions is not None:
+            self.max_revisions = max_revisions
+        self._conn = None
+        self.broken = sqlite3 is None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.filename)
+            self._conn.text_factory = str
+            self._conn.execute('CREATE TABLE IF NOT EXISTS revisions '
+                               '(revid TEXT PRIMARY KEY, text BLOB)')
+        return self._conn
+
+    def _error(self, e):
+        trace.mutter('qbzr: revision cache %s disabled: %s'
+                     % (self.filename, e))
+        self.broken = True
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def get_revisions(self, revids):
+        """Return the revisions in revids that are in the cache."""
+        if self.broken or not revids:
+            return []
+        revs = []
+        try:
+            conn = self._connect()
+            for offset in xrange(0, len(revids), self.query_batch_size):
+                batch_revids = revids[offset:offset + self.query_batch_size]
+                cursor = conn.execute(
+                    'SELECT text FROM revisions WHERE revid IN (%s)'
+                    % ','.join(['?'] * len(batch_revids)),
+                    batch_revids)
+                for (text,) in cursor:
+                    revs.append(chk_bencode_serializer
+                                .read_revision_from_string(str(text)))
+        except sqlite3.Error, e:
+            self._error(e)
+            return []
+        return revs
+
+    def add_revisions(self, revs):
+        """Add revisions to the cache."""
+        if self.broken:
+            return
+        rows = []
+        for rev in revs:
+            if type(rev) is not Revision:
+                # We can't serialize subclasses, such as foreign revisions.
+                continue
+            try:
+                text = chk_bencode_serializer.write_revision_to_string(rev)
+            except (ValueError, TypeError, AttributeError), e:
+                trace.mutter('qbzr: could not cache revision %s: %s'
+                             % (rev.revision_id, e))
+                continue
+            rows.append((rev.revision_id, sqlite3.Binary(text)))
+        if not rows:
+            return
+        try:
+            conn = self._connect()
+            conn.executemany('INSERT OR REPLACE INTO revisions (revid, text) '
+                             'VALUES (?, ?)', rows)
+            (count,) = conn.execute('SELECT COUNT(*) FROM revisions'
+                                    ).fetchone()
+            if count > self.max_revisions:
+                # Remove the oldest revisions, leaving some room, so that we
+                # don't have to do this every time.
+                conn.execute(
+                    'DELETE FROM revisions WHERE rowid IN '
+                    '(SELECT rowid FROM revisions ORDER BY rowid LIMIT ?)',
+                    (count - self.max_revisions * 9 // 10,))
+            conn.commit()
+        except sqlite3.Error, e:
+            self._error(e)
@@ -17,13 +17,18 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
+from time import time
+
 from PyQt4 import QtCore, QtGui
 from bzrlib.plugins.qbzr.lib import MS_WINDOWS
 
 from bzrlib.lazy_import import lazy_import
 lazy_import(globals(), '''
 from bzrlib.plugins.qbzr.lib.util import run_in_loading_queue
-from bzrlib.plugins.qbzr.lib.lazycachedrevloader import load_revisions
+from bzrlib.plugins.qbzr.lib.lazycachedrevloader import (
+    load_revisions,
+    update_ui,
+    )
 from bzrlib.plugins.qbzr.lib.diff import ExtDiffContext
 from bzrlib.transport.local import LocalTransport
 ''')
@@ -34,7 +39,10 @@ RevIdRole = QtCore.Qt.UserRole + 1
 class RevisionTreeView(QtGui.QTreeView):
     """TreeView widget to shows revisions.
     
-    Only revisions that are visible on screen are loaded.
+    The revisions that are visible on screen are loaded. After that, the
+    revisions of the next few screens in the direction that the user is
+    scrolling are prefetched. The faster the user scrolls, the more screens
+    are prefetched.
     
     The model for this tree view must have the following methods:
     def on_revisions_loaded(self, revisions, last_call)
@@ -59,6 +67,11 @@ class RevisionTreeView(QtGui.QTreeView):
         self.load_revisions_call_count = 0
         self.load_revisions_throbber_shown = False
         self.revision_loading_disabled = False
+        self.view_change_count = 0
+        self.last_scroll_value = 0
+        self.last_scroll_time = 0
+        self.scroll_direction = 1
+        self.scroll_speed = 0.0
         self.diff_context = ExtDiffContext(self)
 
     def setModel(self, model):
@@ -76,19 +89,46 @@ class RevisionTreeView(QtGui.QTreeView):
                       QtCore.SIGNAL("layoutChanged()"),
                       self.layout_changed)
     
+    prefetch_pages = 2
+    """Number of screens of revisions to prefetch when not scrolling."""
+    
+    max_prefetch_pages = 8
+    
     def scroll_changed(self, value):
+        now = time()
+        delta = value - self.last_scroll_value
+        elapsed = now - self.last_scroll_time
+        if delta:
+            if delta > 0:
+                self.scroll_direction = 1
+            else:
+                self.scroll_direction = -1
+        if elapsed > 1 or elapsed <= 0:
+            self.scroll_speed = 0.0
+        else:
+            # Pages per second, smoothed.
+            page_step = max(self.verticalScrollBar().pageStep(), 1)
+            speed = abs(delta) / float(page_step) / elapsed
+            self.scroll_speed = (self.scroll_speed + speed) / 2
+        self.last_scroll_value = value
+        self.last_scroll_time = now
+        
+        self.view_change_count += 1
         self.load_visible_revisions()
     
     def data_changed(self, start_index, end_index):
         self.load_visible_revisions()
     
     def layout_changed(self):
+        self.view_change_count += 1
         self.load_visible_revisions()
     
     def collapsed_expanded(self, index):
+        self.view_change_count += 1
         self.load_visible_revisions()
     
     def resizeEvent(self, e):
+        self.view_change_count += 1
         self.load_visible_revisions()
         QtGui.QTreeView.resizeEvent(self, e)
     
@@ -107,25 +147,40 @@ class RevisionTreeView(QtGui.QTreeView):
         #    throbber_height = self.throbber.   etc...        
         bottom_index = self.indexAt(self.viewport().rect().bottomLeft()) # + throbber_height
         
+        top_index = index
         revids = []
+        rows = 0
         while True:
-            revid = index.data(RevIdRole)
-            if not revid.isNull():
-                revid = str(revid.toByteArray())
-                if revid not in revids:
-                    revids.append(revid)
+            self._append_index_revid(index, revids)
+            rows += 1
             if index == bottom_index:
                 break
             index = self.indexBelow(index)
             if not index.isValid():
                 break
         
-        revids = list(revids)
         if len(revids) == 0:
             return
         
+        # Work out what to prefetch once the visible revisions are loaded.
+        pages = min(self.prefetch_pages + int(self.scroll_speed),
+                    self.max_prefetch_pages)
+        prefetch_revids = []
+        if self.scroll_direction > 0:
+            index = self.indexBelow(bottom_index)
+            next_index = self.indexBelow
+        else:
+            index = self.indexAbove(top_index)
+            next_index = self.indexAbove
+        for i in xrange(rows * pages):
+            if not index.isValid():
+                break
+            self._append_index_revid(index, prefetch_revids)
+            index = next_index(index)
+        
         self.load_revisions_call_count += 1
         current_call_count = self.load_revisions_call_count
+        current_view_change_count = self.view_change_count
 
         def before_batch_load(repo, revids):
             if current_call_count < self.load_revisions_call_count:
@@ -139,15 +194,22 @@ class RevisionTreeView(QtGui.QTreeView):
                 #            and hasattr(self, "throbber"):
                 #    self.throbber.show()
                 #    self.load_revisions_throbber_shown = True
-                # Allow for more scrolling to happen.
-                self.delay(0.5)
+                # Handle any scrolling that has happened, so that we can stop
+                # if what we are loading is no longer needed.
+                update_ui()
             
-            return False
+            # If the view has changed, a new load will have been queued.
+            return current_view_change_count < self.view_change_count
 
         try:
             load_revisions(revids, model.get_repo(),
                            revisions_loaded = model.on_revisions_loaded,
                            before_batch_load = before_batch_load)
+            if (prefetch_revids and
+                current_view_change_count == self.view_change_count):
+                load_revisions(prefetch_revids, model.get_repo(),
+                               revisions_loaded = model.on_revisions_loaded,
+                               before_batch_load = before_batch_load)
         finally:
             self.load_revisions_call_count -=1
             if self.load_revisions_call_count == 0:
@@ -156,14 +218,12 @@ class RevisionTreeView(QtGui.QTreeView):
                     self.load_revisions_throbber_shown = False
                     self.throbber.hide()
     
-    def delay(self, timeout):
-        
-        def null():
-            pass
-        
-        QtCore.QTimer.singleShot(timeout, null)
-        QtCore.QCoreApplication.processEvents(
-                            QtCore.QEventLoop.WaitForMoreEvents)
+    def _append_index_revid(self, index, revids):
+        revid = index.data(RevIdRole)
+        if not revid.isNull():
+            revid = str(revid.toByteArray())
+            if revid not in revids:
+                revids.append(revid)
 
 
 has_vista_style = hasattr(QtGui, "QWindowsVistaStyle")
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Index of the messages, authors, committers and bugs of revisions.
+
+This lets qlog search revisions without loading them from the repository.
+The index is a sqlite database in the ``search`` cache directory. It keeps
+the text of each field for each revision, and an inverted index of the words
+in them. A search uses the words in the pattern to find the revisions that
+may match, and then matches the pattern against the text of only those
+revisions.
+"""
+
+import os
+import re
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from bzrlib import trace
+from bzrlib.revision import CURRENT_REVISION
+
+
+FIELDS = ('message', 'author', 'committer', 'bug')
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def get_words(text):
+    """Return the set of lower case words in text."""
+    return set([word.lower() for word in _word_re.findall(text)])
+
+
+def get_pattern_words(pattern):
+    """Return the words that text must contain a word containing, for it to
+    match the shell pattern.
+
+    :return: A list of words, or None if this can't be worked out, in which
+        case all texts have to be matched.
+    """
+    if '[' in pattern:
+        return None
+    words = set()
+    for fragment in re.split(r'[*?]', pattern):
+        words.update(get_words(fragment))
+    return list(words)
+
+
+def pattern_narrows(old_pattern, new_pattern):
+    """Return whether everything that matches the shell pattern new_pattern
+    also matches old_pattern, because new_pattern just adds to old_pattern.
+
+    Patterns match anywhere in a text, so this is the case as long as the
+    added characters don't complete a character class.
+    """
+    return (bool(old_pattern) and new_pattern.startswith(old_pattern) and
+            '[' not in new_pattern)
+
+
+def get_field_texts(rev):
+    """Return the text of each of FIELDS for a revision."""
+    return (rev.message or u'',
+            u', '.join(rev.get_apparent_authors()),
+            rev.committer or u'',
+            rev.properties.get('bugs', u'').replace('\n', ' '))
+
+
+class RevisionSearchIndex(object):
+    """Index of the messages, authors, committers and bugs of revisions.
+
+    If sqlite is not available, or anything goes wrong with the database,
+    the index is marked as broken, and `search` returns None.
+    """
+
+    query_batch_size = 500
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._conn = None
+        self._indexed_revids = None
+        self._word_ids = {}
+        self.broken = sqlite3 is None
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.filename)
+            conn.text_factory = str
+            conn.executescript('''
+                CREATE TABLE IF NOT EXISTS revisions (
+                    id INTEGER PRIMARY KEY, revid TEXT UNIQUE,
+                    message TEXT, author TEXT, committer TEXT, bug TEXT);
+                CREATE TABLE IF NOT EXISTS words (
+                    id INTEGER PRIMARY KEY, word TEXT UNIQUE);
+                CREATE TABLE IF NOT EXISTS postings (
+                    word_id INTEGER, field INTEGER, rev_id INTEGER);
+                CREATE INDEX IF NOT EXISTS postings_word
+                    ON postings (word_id, field);
+                ''')
+            self._conn = conn
+        return self._conn
+
+    def _error(self, e):
+        trace.mutter('qbzr: search index %s disabled: %s'
+                     % (self.filename, e))
+        self.broken = True
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def get_indexed_revids(self):
+        """Return the set of revids that have been indexed."""
+        if self._indexed_revids is None:
+            self._indexed_revids = set()
+            if not self.broken:
+                try:
+                    self._indexed_revids.update([revid for (revid,) in
+                        self._connect().execute(
+                            'SELECT revid FROM revisions')])
+                except sqlite3.Error, e:
+                    self._error(e)
+        return self._indexed_revids
+
+    def get_unindexed_revids(self, revids):
+        """Return the revids in revids that have not been indexed."""
+        indexed_revids = self.get_indexed_revids()
+        return [revid for revid in revids if revid not in indexed_revids]
+
+    def add_revisions(self, revs):
+        """Add revisions to the index.
+        
+        The revisions of working trees are not added, as they change.
+        """
+        if self.broken:
+            return
+        indexed_revids = self.get_indexed_revids()
+        try:
+            conn = self._connect()
+            word_ids = self._word_ids
+            for rev in revs:
+                revid = rev.revision_id
+                if (revid in indexed_revids or
+                    revid.startswith(CURRENT_REVISION)):
+                    continue
+                indexed_revids.add(revid)
+                texts = get_field_texts(rev)
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO revisions (revid, message, author, '
+                    'committer, bug) VALUES (?, ?, ?, ?, ?)',
+                    (revid,) + texts)
+                if cursor.rowcount == 0:
+                    # Another process has indexed it.
+                    continue
+                rev_id = cursor.lastrowid
+                postings = []
+                for field, text in enumerate(texts):
+                    for word in get_words(text):
+                        if word not in word_ids:
+                            conn.execute('INSERT OR IGNORE INTO words (word) '
+                                         'VALUES (?)', (word,))
+                            (word_ids[word],) = conn.execute(
+                                'SELECT id FROM words WHERE word = ?',
+                                (word,)).fetchone()
+                        postings.append((word_ids[word], field, rev_id))
+                conn.executemany('INSERT INTO postings (word_id, field, '
+                                 'rev_id) VALUES (?, ?, ?)', postings)
+            conn.commit()
+        except sqlite3.Error, e:
+            self._error(e)
+
+    def _get_word_rev_ids(self, conn, word, field_index):
+        like = (word.replace('\\', '\\\\').replace('%', '\\%')
+                    .replace('_', '\\_'))
+        return set([rev_id for (rev_id,) in conn.execute(
+            'SELECT DISTINCT postings.rev_id FROM words, postings '
+            "WHERE words.word LIKE ? ESCAPE '\\' "
+            'AND postings.word_id = words.id AND postings.field = ?',
+            ('%' + like + '%', field_index))])
+
+    def search(self, field, pattern, filter_re):
+        """Return the revids of the indexed revisions that match.
+
+        :param field: One of FIELDS.
+        :param pattern: The shell pattern that is being searched for.
+        :param filter_re: The compiled pattern.
+        :return: A set of revids, or None if the index is broken.
+        """
+        if self.broken:
+            return None
+        field_index = FIELDS.index(field)
+        matches = set()
+        try:
+            conn = self._connect()
+            words = get_pattern_words(pattern)
+            if words:
+                rev_ids = None
+                for word in words:
+                    word_rev_ids = self._get_word_rev_ids(conn, word,
+                                                          field_index)
+                    if rev_ids is None:
+                        rev_ids = word_rev_ids
+                    else:
+                        rev_ids.intersection_update(word_rev_ids)
+                    if not rev_ids:
+                        return matches
+                rev_ids = list(rev_ids)
+                rows = []
+                for offset in xrange(0, len(rev_ids), self.query_batch_size):
+                    batch = rev_ids[offset:offset + self.query_batch_size]
+                    rows.extend(conn.execute(
+                        'SELECT revid, %s FROM revisions WHERE id IN (%s)'
+                        % (field, ','.join(['?'] * len(batch))), batch))
+            else:
+                rows = conn.execute('SELECT revid, %s FROM revisions' % field)
+            for revid, text in rows:
+                if field == 'bug' and not text:
+                    # Revisions without bugs never match a bug search.
+                    continue
+                if isinstance(text, str):
+                    text = text.decode('utf-8')
+                if filter_re.search(text) is not None:
+                    matches.add(revid)
+        except sqlite3.Error, e:
+            self._error(e)
+            return None
+        return matches
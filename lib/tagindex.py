@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+"""Index of the tags of the revisions in a graph."""
+
+from bisect import bisect_left
+import fnmatch
+import re
+
+from bzrlib.plugins.qbzr.lib.searchindex import pattern_narrows
+
+
+class TagIndex(object):
+    """Index of the tags of the revisions in a graph.
+
+    This can be used like a dict of revid to the set of tag names of the
+    revision. It also keeps a sorted list of the tag names, so that tags can
+    be looked up by prefix or pattern without going through every revision.
+
+    Everything that is worked out from the tags is kept, so once tags have
+    been added, the index must not be changed. Make a new index to reload
+    the tags.
+    """
+
+    def __init__(self):
+        self.revid_tags = {}
+        """Dict of revid -> set of tag names."""
+        self._tag_revids = None
+        self._sorted_tags = None
+        self._revid_sorted_tags = {}
+        self._last_search = None
+
+    def add_reverse_tag_dict(self, reverse_tag_dict):
+        """Add tags from a dict of revid -> list of tag names, as returned
+        by BasicTags.get_reverse_tag_dict."""
+        for revid, tags in reverse_tag_dict.iteritems():
+            if revid in self.revid_tags:
+                self.revid_tags[revid].update(tags)
+            else:
+                self.revid_tags[revid] = set(tags)
+
+    def __len__(self):
+        return len(self.revid_tags)
+
+    def __iter__(self):
+        return iter(self.revid_tags)
+
+    def __contains__(self, revid):
+        return revid in self.revid_tags
+
+    def __getitem__(self, revid):
+        return self.revid_tags[revid]
+
+    def get(self, revid, default=None):
+        return self.revid_tags.get(revid, default)
+
+    def iteritems(self):
+        return self.revid_tags.iteritems()
+
+    def get_tag_revids(self):
+        """Return a dict of tag name -> set of revids with that tag.
+
+        A tag may be on different revisions in different branches.
+        """
+        if self._tag_revids is None:
+            tag_revids = {}
+            for revid, tags in self.revid_tags.iteritems():
+                for tag in tags:
+                    tag_revids.setdefault(tag, set()).add(revid)
+            self._tag_revids = tag_revids
+        return self._tag_revids
+
+    def get_sorted_tags(self):
+        """Return a sorted list of all the tag names."""
+        if self._sorted_tags is None:
+            self._sorted_tags = sorted(self.get_tag_revids())
+        return self._sorted_tags
+
+    def get_revid_sorted_tags(self, revid):
+        """Return a sorted tuple of the tag names of revid, which is empty
+        if it has none."""
+        sorted_tags = self._revid_sorted_tags.get(revid)
+        if sorted_tags is None:
+            sorted_tags = tuple(sorted(self.revid_tags.get(revid, ())))
+            self._revid_sorted_tags[revid] = sorted_tags
+        return sorted_tags
+
+    def get_tags_with_prefix(self, prefix):
+        """Return a sorted list of the tag names that start with prefix."""
+        sorted_tags = self.get_sorted_tags()
+        tags = []
+        for i in xrange(bisect_left(sorted_tags, prefix), len(sorted_tags)):
+            tag = sorted_tags[i]
+            if not tag.startswith(prefix):
+                break
+            tags.append(tag)
+        return tags
+
+    def search(self, pattern):
+        """Return the set of revids with a tag that matches the shell
+        pattern, the way qlog matches searches: anywhere in the tag name,
+        ignoring case.
+
+        If the pattern narrows the last one that was searched for, only the
+        tags that matched that are matched.
+        """
+        if (self._last_search is not None and
+            pattern_narrows(self._last_search[0], pattern)):
+            if self._last_search[0] == pattern:
+                return self._last_search[2]
+            tags = self._last_search[1]
+        else:
+            tags = self.get_sorted_tags()
+
+        filter_re = re.compile(fnmatch.translate(pattern + '*'),
+                               re.IGNORECASE)
+        matched_tags = [tag for tag in tags if filter_re.search(tag)]
+        tag_revids = self.get_tag_revids()
+        revids = set()
+        for tag in matched_tags:
+            revids.update(tag_revids[tag])
+        self._last_search = (pattern, matched_tags, revids)
+        return revids
@@ -39,16 +39,22 @@ def load_tests(basic_tests, module, loader):
         'test_cat',
         'test_commit',
         'test_commit_data',
+        'test_diffcache',
+        'test_diffgroups',
         #'test_diffview', - broken by API changes
         'test_extra_isignored',
         'test_extra_isversioned',
+        'test_fileindex',
         'test_i18n',
         'test_log',
         'test_loggraphviz',
         'test_logmodel',
         'test_revisionmessagebrowser',
+        'test_revisionmetadata',
+        'test_searchindex',
         'test_spellcheck',
         'test_subprocess',
+        'test_tagindex',
         'test_tree_branch',
         'test_treewidget',
         'test_util',
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import time
+
+from bzrlib.tests import TestCaseWithTransport
+
+from bzrlib.plugins.qbzr.lib import diffcache
+
+
+class TestDiffCache(TestCaseWithTransport):
+
+    def test_get_tree_key(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree_contents([('tree/file', 'content\n')])
+        tree.add(['file'], ['file-id'])
+        tree.commit('one', rev_id='rev-1')
+        self.assertEqual(('revision', 'rev-1'), diffcache.get_tree_key(
+            tree.branch.repository.revision_tree('rev-1'), 'file-id', 1.0))
+        tree.lock_read()
+        self.addCleanup(tree.unlock)
+        self.assertEqual(('revision', 'rev-1'), diffcache.get_tree_key(
+            tree.basis_tree(), 'file-id', 1.0))
+        self.assertEqual(('working', tree.basedir, 1.0, 8),
+                         diffcache.get_tree_key(tree, 'file-id', 1.0))
+        self.assertEqual(None, diffcache.get_tree_key(object(), 'file-id',
+                                                      1.0))
+
+    def test_get_tree_key_recently_modified(self):
+        tree = self.make_branch_and_tree('tree')
+        self.build_tree_contents([('tree/file', 'content\n')])
+        tree.add(['file'], ['file-id'])
+        now = time.time()
+        self.assertEqual(None, diffcache.get_tree_key(tree, 'file-id', now))
+        self.assertEqual(None, diffcache.get_tree_key(tree, 'file-id', None))
+        self.assertEqual(('working', tree.basedir, now - 10, 8),
+                         diffcache.get_tree_key(tree, 'file-id', now - 10))
+
+    def test_lines(self):
+        cache = diffcache.DiffCache(max_lines_size=10)
+        key = ('revision', 'rev-1')
+        self.assertEqual(None, cache.get_lines(key, 'file-id'))
+        cache.set_lines(key, 'file-id', ['a\n', 'b\n'])
+        self.assertEqual(['a\n', 'b\n'], cache.get_lines(key, 'file-id'))
+        self.assertEqual(None, cache.get_lines(('working', 'tree', 1.0, 8),
+                                               'file-id'))
+        cache.set_lines(None, 'file-id', ['a\n'])
+        self.assertEqual(None, cache.get_lines(None, 'file-id'))
+        # Too big to keep.
+        cache.set_lines(key, 'other-id', ['a' * 20])
+        self.assertEqual(None, cache.get_lines(key, 'other-id'))
+
+    def test_groups(self):
+        cache = diffcache.DiffCache()
+        keys = (('revision', 'rev-1'), ('working', 'tree', 1.0, 8))
+        groups = [[('equal', 0, 1, 0, 1)]]
+        cache.set_groups(keys, 'file-id', False, False, None, groups)
+        self.assertEqual(groups, cache.get_groups(keys, 'file-id', False,
+                                                  False, None))
+        self.assertEqual(None, cache.get_groups(keys, 'file-id', True,
+                                                False, None))
+        # The file was changed.
+        self.assertEqual(None, cache.get_groups(
+            (keys[0], ('working', 'tree', 2.0, 8)), 'file-id', False, False,
+            None))
+        cache.set_groups((keys[0], None), 'file-id', True, False, None,
+                         groups)
+        self.assertEqual(None, cache.get_groups((keys[0], None), 'file-id',
+                                                True, False, None))
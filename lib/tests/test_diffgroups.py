@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from bzrlib.tests import TestCase, TestNotApplicable
+
+from bzrlib.plugins.qbzr.lib import diffgroups
+
+
+class FakeDiffItem(object):
+    """The parts of DiffItem that DiffGroupsPipeline uses."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.groups = {}
+
+    def needs_difference_groups(self, complete, ignore_whitespace):
+        return (complete, ignore_whitespace) not in self.groups
+
+    def set_groups(self, complete, ignore_whitespace, groups):
+        self.groups[(complete, ignore_whitespace)] = groups
+
+
+class TestDiffGroups(TestCase):
+
+    def test_difference_groups(self):
+        lines = (['a\n', 'b\n', 'c\n'], ['a\n', 'B\n', 'c\n'])
+        self.assertEqual([[('equal', 0, 1, 0, 1), ('replace', 1, 2, 1, 2),
+                           ('equal', 2, 3, 2, 3)]],
+                         diffgroups.difference_groups(lines, True, False))
+        self.assertEqual([[('equal', 0, 1, 0, 1)]],
+                         diffgroups.difference_groups(
+                            (['a  b\n'], ['a b\n']), True, True))
+
+    def make_items(self):
+        left = ['line %d\n' % i for i in xrange(100)]
+        right = left[:50] + ['changed\n'] + left[51:]
+        return [FakeDiffItem((left, right)),
+                FakeDiffItem((['a\n'], ['b\n'])),
+                FakeDiffItem((right, left))]
+
+    def assertPipeline(self, processes):
+        items = self.make_items()
+        pipeline = diffgroups.DiffGroupsPipeline(items, False, False,
+                                                 processes=processes)
+        pipeline.min_parallel_lines = 10
+        pipeline.lookahead = 2
+        self.assertEqual(items, list(pipeline))
+        self.assertEqual(None, pipeline.pool)
+        return items
+
+    def test_pipeline_without_workers(self):
+        items = self.assertPipeline(0)
+        for di in items:
+            self.assertEqual({}, di.groups)
+
+    def test_pipeline(self):
+        if diffgroups.get_worker_count() == 0:
+            raise TestNotApplicable('worker processes can not be used')
+        # The pool is kept for the next pipeline, until the process exits.
+        self.addCleanup(diffgroups._close_pool)
+        items = self.assertPipeline(2)
+        self.assertNotEqual(None, diffgroups._pool)
+        self.assertEqual(
+            diffgroups.difference_groups(items[0].lines, False, False),
+            items[0].groups[(False, False)])
+        self.assertEqual(
+            diffgroups.difference_groups(items[2].lines, False, False),
+            items[2].groups[(False, False)])
+        # Too small to send to a worker.
+        self.assertEqual({}, items[1].groups)
+
+    def test_closed_pipeline(self):
+        if diffgroups.get_worker_count() == 0:
+            raise TestNotApplicable('worker processes can not be used')
+        self.addCleanup(diffgroups._close_pool)
+        items = self.make_items()
+        pipeline = diffgroups.DiffGroupsPipeline(items, False, False,
+                                                 processes=2)
+        pipeline.min_parallel_lines = 10
+        pipeline.start(items[0]).wait()
+        args = (pipeline.generation, items[0].lines, False, False, None)
+        self.assertNotEqual(None, diffgroups._difference_groups(args))
+        # The jobs of a closed pipeline are skipped.
+        pipeline.close()
+        self.assertEqual(None, diffgroups._difference_groups(args))
+
+
+class TestAlgorithms(TestCase):
+
+    def assertOpcodes(self, a, b, algorithm):
+        """Check that the opcodes for a and b turn a into b."""
+        opcodes = diffgroups.difference_groups((a, b), True, False,
+                                               algorithm)[0]
+        result = []
+        last_i = last_j = 0
+        for tag, i1, i2, j1, j2 in opcodes:
+            self.assertEqual((last_i, last_j), (i1, j1))
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+            result.extend(b[j1:j2])
+            last_i, last_j = i2, j2
+        self.assertEqual((len(a), len(b)), (last_i, last_j))
+        self.assertEqual(b, result)
+        return opcodes
+
+    def test_algorithms(self):
+        a = list('abcabba')
+        b = list('cbabac')
+        for algorithm in diffgroups.algorithms:
+            self.assertOpcodes(a, b, algorithm)
+            self.assertOpcodes([], b, algorithm)
+            self.assertOpcodes(a, [], algorithm)
+            self.assertOpcodes(a, a, algorithm)
+            self.assertOpcodes(list('xay'), list('zaw'), algorithm)
+
+    def test_myers_fewest_changes(self):
+        opcodes = self.assertOpcodes(list('abcabba'), list('cbabac'),
+                                     'myers')
+        changed = 0
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag != 'equal':
+                changed += (i2 - i1) + (j2 - j1)
+        self.assertEqual(5, changed)
+
+    def test_myers_cutoff(self):
+        a = ['%d\n' % i for i in xrange(200)]
+        b = ['%d\n' % i for i in xrange(0, 400, 2)]
+        expected = self.assertOpcodes(a, b, 'patience')
+        max_cost = diffgroups.MyersSequenceMatcher.max_cost
+        diffgroups.MyersSequenceMatcher.max_cost = 10
+        try:
+            self.assertEqual(expected, self.assertOpcodes(a, b, 'myers'))
+        finally:
+            diffgroups.MyersSequenceMatcher.max_cost = max_cost
+
+    def test_myers_isjunk(self):
+        self.assertRaises(ValueError, diffgroups.MyersSequenceMatcher,
+                          lambda line: not line.strip(), ['a'], ['b'])
+
+    def test_unknown_algorithm(self):
+        self.assertTrue(diffgroups.get_matcher_class('unknown') is
+                        diffgroups.algorithms[diffgroups.default_algorithm])
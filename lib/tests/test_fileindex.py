@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from bzrlib.tests import TestCaseWithTransport, TestNotApplicable
+
+from bzrlib.plugins.qbzr.lib import fileindex
+
+
+class TestFileRevisionsIndex(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestFileRevisionsIndex, self).setUp()
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'root-id', 'directory', '')),
+            ('add', ('dir', 'dir-id', 'directory', '')),
+            ('add', ('dir/sub', 'sub-id', 'directory', '')),
+            ('add', ('dir/sub/file', 'file-id', 'file', 'a\n')),
+            ('add', ('other', 'other-id', 'file', 'a\n')),
+            ])
+        builder.build_snapshot('rev-b', ['rev-a'], [
+            ('modify', ('file-id', 'b\n')),
+            ])
+        builder.build_snapshot('rev-c', ['rev-b'], [
+            ('modify', ('other-id', 'c\n')),
+            ])
+        builder.finish_series()
+        self.repo = builder.get_branch().repository
+        self.repo.lock_read()
+        self.addCleanup(self.repo.unlock)
+
+    def test_get_touched_file_ids(self):
+        touched = fileindex.get_touched_file_ids(self.repo,
+                                                 ['rev-b', 'rev-c'])
+        self.assertEqual(set(['root-id', 'dir-id', 'sub-id', 'file-id']),
+                         touched['rev-b'])
+        self.assertEqual(set(['root-id', 'other-id']), touched['rev-c'])
+
+    def test_index(self):
+        if fileindex.sqlite3 is None:
+            raise TestNotApplicable('sqlite3 is not available')
+        index = fileindex.FileRevisionsIndex('index')
+        index.add_revisions(self.repo, ['rev-a', 'rev-b'])
+        self.assertEqual(set(['rev-a', 'rev-b']),
+                         index.get_touching_revids(['dir-id']))
+        index.close()
+
+        index = fileindex.FileRevisionsIndex('index')
+        self.assertEqual(['rev-c'], index.get_unindexed_revids(
+            ['rev-a', 'rev-b', 'rev-c']))
+        index.add_revisions(self.repo, ['rev-c'])
+        self.assertEqual(set(['rev-a', 'rev-c']),
+                         index.get_touching_revids(['other-id']))
+        self.assertEqual(set(['rev-a', 'rev-b', 'rev-c']),
+                         index.get_touching_revids(['file-id', 'other-id']))
+
+    def test_corrupt(self):
+        if fileindex.sqlite3 is None:
+            raise TestNotApplicable('sqlite3 is not available')
+        self.build_tree_contents([('index', 'not a database')])
+        index = fileindex.FileRevisionsIndex('index')
+        self.assertEqual(['rev-a'], index.get_unindexed_revids(['rev-a']))
+        self.assertTrue(index.broken)
+        self.assertEqual(None, index.get_touching_revids(['file-id']))
+        # The touched files are still worked out.
+        self.assertEqual(set(['root-id', 'other-id']), index.add_revisions(
+            self.repo, ['rev-c'])['rev-c'])
@@ -19,6 +19,7 @@
 from bzrlib.tests import TestCase, TestCaseWithTransport
 from StringIO import StringIO
 
+from bzrlib.graph import KnownGraph
 from bzrlib.plugins.qbzr.lib import loggraphviz
 from bzrlib.revision import NULL_REVISION
 
@@ -382,6 +383,389 @@ class TestLogGraphVizWithBranches(TestCaseWithTransport, TestLogGraphVizMixin):
         self.assertRaises(loggraphviz.GhostRevisionError,
                           gv.get_revid_branch_info, 'rev-b')
 
+    def test_compute_head_info_many_branches(self):
+        builder = self.make_branch_builder('trunk')
+        builder.start_series()
+        builder.build_snapshot('rev-trunk-0', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        tips = []
+        for i in range(1, 13):
+            builder.build_snapshot('rev-trunk-%d' % i,
+                                   ['rev-trunk-%d' % (i - 1)], [])
+            # Branch off trunk, and for every third branch, merge the
+            # previous branch in.
+            parents = ['rev-trunk-%d' % (i // 2)]
+            if i % 3 == 0:
+                parents.append(tips[-1])
+            builder.build_snapshot('rev-b%d-1' % i, parents, [])
+            builder.build_snapshot('rev-b%d-2' % i, ['rev-b%d-1' % i], [])
+            tips.append('rev-b%d-2' % i)
+        # Merge some of the branches back into trunk.
+        builder.build_snapshot('rev-trunk-13', ['rev-trunk-12', tips[1]], [])
+        builder.build_snapshot('rev-trunk-14', ['rev-trunk-13', tips[7]], [])
+        builder.finish_series()
+        
+        trunk = builder.get_branch()
+        branch_infos = [loggraphviz.BranchInfo('trunk', None, trunk)]
+        # Include a branch that has the same tip as another branch, and one
+        # that has been merged into trunk.
+        for i, tip in enumerate(tips + [tips[4]]):
+            branch = trunk.bzrdir.sprout('../b%d' % i,
+                                         revision_id=tip).open_branch()
+            branch_infos.append(loggraphviz.BranchInfo('b%d' % i, None,
+                                                       branch))
+        
+        gv = loggraphviz.GraphVizLoader(branch_infos, branch_infos[0], False)
+        gv.load()
+        
+        # Check that we get the same as find_unique_ancestors would give.
+        trunk.repository.lock_read()
+        self.addCleanup(trunk.repository.unlock)
+        graph = trunk.repository.get_graph()
+        
+        heads = sorted([(revid, branch_info)
+                        for revid, (head_info, ur)
+                        in gv.revid_head_info.iteritems()
+                        for (branch_info, tag) in head_info],
+                       key=lambda x: not loggraphviz.repo_is_local(
+                           x[1].branch.repository))
+        expected_revid_branch_info = {}
+        for i, (revid, branch_info) in enumerate(heads):
+            for ancestor_revid in graph.find_unique_ancestors(
+                    revid, [prev_revid for prev_revid, bi in heads[:i]]):
+                if ancestor_revid != NULL_REVISION:
+                    expected_revid_branch_info[ancestor_revid] = branch_info
+        self.assertEqual(expected_revid_branch_info, gv.revid_branch_info)
+        
+        for revid, (head_info, ur) in gv.revid_head_info.iteritems():
+            other_revids = [other_revid for other_revid in gv.revid_head_info
+                            if other_revid != revid]
+            expected_ur = [revid] + [
+                unique_revid for unique_revid
+                in graph.find_unique_ancestors(revid, other_revids)
+                if unique_revid != NULL_REVISION]
+            expected_ur.sort(key=lambda x: gv.revid_rev[x].index)
+            self.assertEqual(expected_ur, ur)
+
+    def make_branch_builder_with_merge(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        builder.build_snapshot('rev-c', ['rev-a', 'rev-b'], [])
+        builder.finish_series()
+        return builder
+    
+    def load_computed(self, branch, graph_cache_enabled):
+        bi = loggraphviz.BranchInfo(None, None, branch)
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.graph_cache_enabled = graph_cache_enabled
+        gv.load()
+        
+        state = loggraphviz.GraphVizFilterState(gv)
+        state.expand_all_branch_lines()
+        return gv, gv.compute_viz(state)
+    
+    def test_graph_cache(self):
+        branch = self.make_branch_builder_with_merge().get_branch()
+        gv, computed = self.load_computed(branch, True)
+        
+        # The second load must use the cached merge_sort.
+        self.overrideAttr(loggraphviz, 'KnownGraph', NoMergeSortKnownGraph)
+        gv, cached_computed = self.load_computed(branch, True)
+        self.assertEqual(self.computed_to_list(computed),
+                         self.computed_to_list(cached_computed))
+    
+    def test_graph_cache_new_tip(self):
+        builder = self.make_branch_builder_with_merge()
+        branch = builder.get_branch()
+        self.load_computed(branch, True)
+        
+        builder.build_snapshot('rev-d', ['rev-c'], [])
+        
+        # The tip changed, so the cached merge_sort must not be used.
+        gv, cached_computed = self.load_computed(branch, True)
+        gv, computed = self.load_computed(branch, False)
+        self.assertEqual(self.computed_to_list(computed),
+                         self.computed_to_list(cached_computed))
+        self.assertEqual(['rev-d', 'rev-c', 'rev-b', 'rev-a'],
+                         [rev.revid for rev in gv.revisions])
+    
+    def test_file_id_filter_file_index(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),
+            ('add', ('dir', 'dir-id', 'directory', '')),
+            ('add', ('dir/file', 'file-id', 'file', 'a\n')),
+            ('add', ('other', 'other-id', 'file', 'a\n')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [
+            ('modify', ('other-id', 'b\n')),])
+        builder.build_snapshot('rev-c', ['rev-b'], [
+            ('modify', ('file-id', 'c\n')),])
+        builder.finish_series()
+        branch = builder.get_branch()
+        
+        bi = loggraphviz.BranchInfo(None, None, branch)
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        
+        def load_filter(file_ids, file_index_enabled):
+            file_id_filter = loggraphviz.FileIdFilter(
+                gv, lambda revs, last_call: None, file_ids)
+            file_id_filter.file_index_enabled = file_index_enabled
+            file_id_filter.load()
+            return [rev.revid for rev in gv.revisions
+                    if file_id_filter.get_revision_visible(rev)]
+        
+        for file_ids in (['file-id'], ['dir-id'], ['other-id']):
+            expected = load_filter(file_ids, False)
+            # Once to build the index, and once to use it.
+            self.assertEqual(expected, load_filter(file_ids, True))
+            self.assertEqual(expected, load_filter(file_ids, True))
+        self.assertEqual(['rev-c', 'rev-a'], load_filter(['dir-id'], True))
+    
+    def test_get_repo_revids(self):
+        builder = self.make_branch_builder('branch1')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        builder.finish_series()
+        branch1 = builder.get_branch()
+        branch2 = branch1.bzrdir.sprout('branch2').open_branch()
+        tree2 = branch2.bzrdir.open_workingtree()
+        tree2.commit('c', rev_id='rev-c')
+        
+        bi1 = loggraphviz.BranchInfo('branch1', None, branch1)
+        bi2 = loggraphviz.BranchInfo('branch2', None, branch2)
+        for graph_cache_enabled in (True, True, False):
+            gv = loggraphviz.GraphVizLoader([bi1, bi2], bi1, False)
+            gv.graph_cache_enabled = graph_cache_enabled
+            gv.load()
+            
+            revids = ['rev-a', 'rev-b', 'rev-c']
+            repo_revids = gv.get_repo_revids(revids)
+            self.assertEqual(['rev-a', 'rev-b', 'rev-c'], revids)
+            self.assertEqual(gv.repos, [repo for repo, r in repo_revids])
+            self.assertEqual(revids, sorted([revid for repo, r in repo_revids
+                                             for revid in r]))
+            for repo, repo_revids in repo_revids:
+                self.assertEqual(set(repo_revids),
+                                 repo.has_revisions(repo_revids))
+    
+    def test_get_repo_revids_local_repo_copies(self):
+        builder = self.make_branch_builder_with_merge()
+        branch = builder.get_branch()
+        bi = loggraphviz.BranchInfo(None, None, branch)
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        
+        copy_repo = self.make_repository('copy')
+        copy_repo.fetch(branch.repository, revision_id='rev-b')
+        gv.revid_repo = {}
+        gv.repos.append(copy_repo)
+        gv.local_repo_copies.append(copy_repo)
+        
+        repo_revids = dict([(repo.base, revids) for repo, revids
+                            in gv.get_repo_revids(['rev-a', 'rev-b', 'rev-c'])])
+        self.assertEqual(['rev-a', 'rev-b'], repo_revids[copy_repo.base])
+        self.assertEqual(['rev-c'], repo_revids[branch.repository.base])
+        self.assertEqual(set(['rev-c']), gv.local_copy_missing_revids)
+    
+    def test_file_id_filter_parallel_load(self):
+        branches = []
+        for name in ('branch1', 'branch2'):
+            builder = self.make_branch_builder(name)
+            builder.start_series()
+            builder.build_snapshot(name + '-a', None, [
+                ('add', ('', 'TREE_ROOT', 'directory', '')),
+                ('add', ('file', 'file-id', 'file', 'a\n')),
+                ('add', ('other', 'other-id', 'file', 'a\n')),])
+            builder.build_snapshot(name + '-b', [name + '-a'], [
+                ('modify', ('other-id', 'b\n')),])
+            builder.build_snapshot(name + '-c', [name + '-b'], [
+                ('modify', ('file-id', 'c\n')),])
+            builder.finish_series()
+            branches.append(loggraphviz.BranchInfo(
+                name, None, builder.get_branch()))
+        
+        gv = loggraphviz.GraphVizLoader(branches, branches[0], False)
+        gv.load()
+        
+        def load_filter(parallel_load, file_index_enabled):
+            file_id_filter = loggraphviz.FileIdFilter(
+                gv, lambda revs, last_call: None, ['file-id'])
+            file_id_filter.parallel_load = parallel_load
+            file_id_filter.file_index_enabled = file_index_enabled
+            file_id_filter.load()
+            self.assertEqual([], file_id_filter.load_threads)
+            return sorted([rev.revid for rev in gv.revisions
+                           if file_id_filter.get_revision_visible(rev)])
+        
+        expected = ['branch1-a', 'branch1-c', 'branch2-a', 'branch2-c']
+        self.assertEqual(expected, load_filter(False, False))
+        self.assertEqual(expected, load_filter(True, False))
+        self.assertEqual(expected, load_filter(True, True))
+    
+    def assertSameGraph(self, expected_gv, gv):
+        def rev_data(gv):
+            return [(rev.index, rev.revid, rev.revno_sequence,
+                     rev.merge_depth, rev.merges, rev.merged_by)
+                    for rev in gv.revisions]
+        
+        def branch_line_data(gv):
+            return [(branch_id, [rev.index for rev in branch_line.revs],
+                     branch_line.merge_depth, sorted(branch_line.merges),
+                     sorted(branch_line.merged_by))
+                    for branch_id, branch_line
+                    in sorted(gv.branch_lines.items())]
+        
+        self.assertEqual(rev_data(expected_gv), rev_data(gv))
+        self.assertEqual(branch_line_data(expected_gv), branch_line_data(gv))
+        self.assertEqual(expected_gv.branch_ids, gv.branch_ids)
+        self.assertEqual(sorted(expected_gv.revid_head_info.keys()),
+                         sorted(gv.revid_head_info.keys()))
+        for rev in gv.revisions:
+            self.assertTrue(gv.revid_rev[rev.revid] is rev)
+            self.assertTrue(gv.revno_rev[rev.revno_sequence] is rev)
+    
+    def test_update(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        builder.build_snapshot('rev-c', ['rev-a'], [])
+        builder.build_snapshot('rev-d', ['rev-b', 'rev-c'], [])
+        builder.finish_series()
+        branch = builder.get_branch()
+        
+        bi = loggraphviz.BranchInfo(None, None, branch)
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        state = loggraphviz.GraphVizFilterState(gv)
+        state.filters.append(BasicFilterer(set()))
+        
+        # A new revision on the branch line of rev-c, and a new branch line.
+        builder.build_snapshot('rev-e', ['rev-c'], [])
+        builder.build_snapshot('rev-f', ['rev-d'], [])
+        builder.build_snapshot('rev-g', ['rev-a'], [])
+        builder.build_snapshot('rev-h', ['rev-f', 'rev-e'], [])
+        builder.build_snapshot('rev-i', ['rev-h', 'rev-g'], [])
+        
+        new_revs = gv.update()
+        self.assertEqual(['rev-i', 'rev-g', 'rev-h', 'rev-e', 'rev-f'],
+                         [rev.revid for rev in new_revs])
+        state.revisions_added(new_revs)
+        
+        expected_gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        expected_gv.load()
+        self.assertSameGraph(expected_gv, gv)
+        
+        self.assertEqual(len(gv.revisions), len(state.filter_cache))
+        state.expand_all_branch_lines()
+        expected_state = loggraphviz.GraphVizFilterState(expected_gv)
+        expected_state.expand_all_branch_lines()
+        self.assertEqual(
+            self.computed_to_list(expected_gv.compute_viz(expected_state)),
+            self.computed_to_list(gv.compute_viz(state)))
+    
+    def test_update_no_change(self):
+        builder = self.make_branch_builder('branch')
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        bi = loggraphviz.BranchInfo(None, None, builder.get_branch())
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        
+        self.assertEqual([], gv.update())
+        self.assertEqual(['rev-a'], [rev.revid for rev in gv.revisions])
+    
+    def test_read_update(self):
+        builder = self.make_branch_builder('branch')
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        bi = loggraphviz.BranchInfo(None, None, builder.get_branch())
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        
+        # Reading the update does not change the graph.
+        changes = gv.read_update()
+        self.assertEqual(['rev-a'], [rev.revid for rev in gv.revisions])
+        self.assertEqual(['rev-a'], gv.revid_head_info.keys())
+        
+        new_revs = gv.apply_update(changes)
+        self.assertEqual(['rev-b'], [rev.revid for rev in new_revs])
+        self.assertEqual(['rev-b', 'rev-a'],
+                         [rev.revid for rev in gv.revisions])
+        self.assertEqual(['rev-b'], gv.revid_head_info.keys())
+    
+    def test_update_not_forward(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        builder.finish_series()
+        branch = builder.get_branch()
+        bi = loggraphviz.BranchInfo(None, None, branch)
+        gv = loggraphviz.GraphVizLoader([bi], bi, False)
+        gv.load()
+        
+        # The old tip is merged, rather than being the left hand parent.
+        builder.build_snapshot('rev-c', ['rev-a', 'rev-b'], [])
+        self.assertEqual(None, gv.update())
+        self.assertEqual(['rev-b', 'rev-a'],
+                         [rev.revid for rev in gv.revisions])
+        self.assertEqual(['rev-b'], gv.revid_head_info.keys())
+    
+    def test_mainline(self):
+        builder = self.make_branch_builder('branch')
+        builder.start_series()
+        builder.build_snapshot('rev-a', None, [
+            ('add', ('', 'TREE_ROOT', 'directory', '')),])
+        builder.build_snapshot('rev-b', ['rev-a'], [])
+        builder.build_snapshot('rev-c', ['rev-a'], [])
+        builder.build_snapshot('rev-d', ['rev-b', 'rev-c'], [])
+        builder.build_snapshot('rev-e', ['rev-d'], [])
+        builder.finish_series()
+        bi = loggraphviz.BranchInfo(None, None, builder.get_branch())
+        
+        gv = loggraphviz.MainlineGraphVizLoader([bi], bi, False)
+        gv.load()
+        self.assertEqual(
+            [('rev-e', '4'), ('rev-d', '3'), ('rev-b', '2'), ('rev-a', '1')],
+            [(rev.revid, rev.revno_str) for rev in gv.revisions])
+        self.assertEqual([], gv.known_graph.get_parent_keys('rev-a'))
+        self.assertEqual(None, gv.update())
+        
+        state = loggraphviz.GraphVizFilterState(gv)
+        self.assertComputed(
+            [('rev-e', 0, None, []) ,
+             ('rev-d', 0, None, []) ,
+             ('rev-b', 0, None, []) ,
+             ('rev-a', 0, None, []) ],
+            gv.compute_viz(state))
+        
+        gv = loggraphviz.MainlineGraphVizLoader([bi], bi, False)
+        gv.max_revisions = 2
+        gv.load()
+        self.assertEqual(
+            [('rev-e', '4'), ('rev-d', '3')],
+            [(rev.revid, rev.revno_str) for rev in gv.revisions])
+        self.assertEqual(['rev-b'], gv.known_graph.get_parent_keys('rev-d'))
+    
+    def test_mainline_no_commits(self):
+        bi = loggraphviz.BranchInfo(None, None, self.make_branch('branch'))
+        gv = loggraphviz.MainlineGraphVizLoader([bi], bi, False)
+        gv.load()
+        self.assertEqual(0, len(gv.revisions))
+        self.assertEqual({}, gv.revid_head_info)
+
+
 class TestLogGraphVizLayouts(TestCase, TestLogGraphVizMixin):
     
     def test_basic_branch_line(self):
@@ -543,6 +927,38 @@ class TestLogGraphVizLayouts(TestCase, TestLogGraphVizMixin):
              ('rev-a', 0, None, [])                                                                           ],# ○ 
             computed)
     
+    def test_lazy_lines(self):
+        gv = BasicGraphVizLoader(('rev-g',), {
+         'rev-a': (NULL_REVISION, ), 
+         'rev-b': ('rev-a', ),
+         'rev-c': ('rev-b', ),
+         'rev-d': ('rev-a', ),
+         'rev-e': ('rev-d', 'rev-b',),
+         'rev-f': ('rev-e', 'rev-c',),
+         'rev-g': ('rev-c', 'rev-f',),
+        })
+        gv.load()
+        
+        state = loggraphviz.GraphVizFilterState(gv)
+        state.expand_all_branch_lines()
+        computed = gv.compute_viz(state)
+        
+        self.overrideAttr(loggraphviz.ComputedGraphViz, 'lines_chunk_size', 2)
+        lazy_computed = gv.compute_viz(state, lazy_lines=True)
+        self.assertEqual([[]] * 7,
+                         [c_rev.lines for c_rev in lazy_computed.filtered_revs])
+        
+        # Only the chunk with rows 2 and 3 is computed.
+        lazy_computed.ensure_lines(3, 4)
+        self.assertEqual(
+            [[], [], computed.filtered_revs[2].lines,
+             computed.filtered_revs[3].lines, [], [], []],
+            [c_rev.lines for c_rev in lazy_computed.filtered_revs])
+        
+        lazy_computed.ensure_lines(0, 7)
+        self.assertEqual(self.computed_to_list(computed),
+                         self.computed_to_list(lazy_computed))
+    
     def test_hidden_branch_line_hides_child_line(self):
         gv = BasicGraphVizLoader(('rev-g',), {
          'rev-a': (NULL_REVISION, ), 
@@ -800,6 +1216,64 @@ class TestLogGraphProviderState(TestCase):
         # just mainline showing
         self.assertFilteredRevisions('ca', state)
 
+    def test_filtered_revs_changes(self):
+        gv = self.get_expanded_by_graph_provider()
+        state = loggraphviz.GraphVizFilterState(gv)
+        mainline = gv.compute_viz(state)
+        self.assertFilteredRevisions('fda', state)
+        
+        # expand 'f'
+        state.collapse_expand_rev(mainline.filtered_revs[0])
+        expanded = gv.compute_viz(state)
+        self.assertFilteredRevisions('fedba', state)
+        
+        self.assertEqual(
+            ([], [(1, 1), (3, 3)]),
+            loggraphviz.filtered_revs_changes(mainline.filtered_revs,
+                                              expanded.filtered_revs))
+        self.assertEqual(
+            ([(1, 1), (3, 3)], []),
+            loggraphviz.filtered_revs_changes(expanded.filtered_revs,
+                                              mainline.filtered_revs))
+        
+        state.filters.append(BasicFilterer(('e', 'b')))
+        state.filter_changed()
+        filtered = gv.compute_viz(state)
+        self.assertFilteredRevisions('fda', state)
+        self.assertEqual(
+            ([(1, 1), (3, 3)], []),
+            loggraphviz.filtered_revs_changes(expanded.filtered_revs,
+                                              filtered.filtered_revs))
+        self.assertEqual(
+            ([], [(0, 2)]),
+            loggraphviz.filtered_revs_changes([], filtered.filtered_revs))
+    
+    def test_changed_rows(self):
+        gv = self.get_expanded_by_graph_provider()
+        state = loggraphviz.GraphVizFilterState(gv)
+        mainline = gv.compute_viz(state)
+        self.assertEqual(None, loggraphviz.changed_rows(mainline, mainline))
+        
+        # expand 'f'
+        state.collapse_expand_rev(mainline.filtered_revs[0])
+        expanded = gv.compute_viz(state)
+        self.assertFilteredRevisions('fedba', state)
+        # The lines from f to e, and from b to a, are new, so all the rows
+        # are drawn differently.
+        self.assertEqual((0, 4),
+                         loggraphviz.changed_rows(mainline, expanded))
+        self.assertEqual((0, 2),
+                         loggraphviz.changed_rows(expanded, mainline))
+        
+        # Only the rows of the revisions that are no longer filtered, and
+        # the rows their lines pass through change.
+        state.filters.append(BasicFilterer(('e',)))
+        state.filter_changed()
+        filtered = gv.compute_viz(state)
+        self.assertFilteredRevisions('fdba', state)
+        self.assertEqual((0, 2),
+                         loggraphviz.changed_rows(expanded, filtered))
+    
     def get_expanded_by_graph_provider(self):
         gv = BasicGraphVizLoader(('f',), {
          'a': (NULL_REVISION, ), 
@@ -954,6 +1428,59 @@ class TestLogGraphProviderState(TestCase):
         # c shows even though it is filtered, because it merges a revision
         # that is not filtered.
         self.assertFilteredRevisions('ecb', state)
+    
+    def test_filter_bulk(self):
+        gv = BasicGraphVizLoader(('e',), {
+         'a': (NULL_REVISION, ), 
+         'b': ('a', ),
+         'c': ('a', 'b'),
+         'd': ('c', ),
+         'e': ('d', ),
+        })
+        gv.load()
+        
+        state = loggraphviz.GraphVizFilterState(gv)
+        state.collapse_expand_rev(gv.compute_viz(state).filtered_revs[2])
+        
+        state.filters.append(BulkFilterer(gv, ('d', 'c')))
+        state.filters.append(BasicFilterer(('a',)))
+        state.filter_changed()
+        # The same as test_filter, with the filter split between a filter
+        # that is evaluated in bulk, and one that is not.
+        self.assertFilteredRevisions('ecb', state)
+        
+        # Filters that don't filter anything are ignored.
+        state.filters[:] = [BulkFilterer(gv, None)]
+        state.filter_changed()
+        self.assertFilteredRevisions('edcba', state)
+
+    def test_filter_bulk_criss_cross(self):
+        gv = BasicGraphVizLoader(('f',), {
+         'a': (NULL_REVISION, ),
+         'b': ('a', ),
+         'c': ('a', ),
+         'd': ('b', 'c'),
+         'e': ('c', 'b'),
+         'f': ('d', 'e'),
+        })
+        gv.load()
+        
+        # c is merged by more than one revision, so the bulk filter must
+        # give the same result as the filter that is evaluated per revision.
+        filtered = ('a', 'b', 'd', 'e', 'f')
+        bulk_state = loggraphviz.GraphVizFilterState(gv)
+        bulk_state.filters.append(BulkFilterer(gv, filtered))
+        bulk_state.filter_changed()
+        state = loggraphviz.GraphVizFilterState(gv)
+        state.filters.append(BasicFilterer(filtered))
+        state.filter_changed()
+        self.assertEqual(
+            [state.get_revision_visible_if_branch_visible(rev)
+             for rev in gv.revisions],
+            [bulk_state.get_revision_visible_if_branch_visible(rev)
+             for rev in gv.revisions])
+        self.assertTrue(bulk_state.get_revision_visible_if_branch_visible(
+            gv.revid_rev['f']))
 
 
     
@@ -978,13 +1505,33 @@ class BasicGraphVizLoader(loggraphviz.GraphVizLoader):
             self.compute_merge_info()
 
 
+class NoMergeSortKnownGraph(KnownGraph):
+    def merge_sort(self, tip_key):
+        raise AssertionError('merge_sort should not be called.')
+
+
 class BasicFilterer(object):
     def __init__(self, filtered_revids):
         self.filtered_revids = filtered_revids
     
+    def revisions_added(self, revs):
+        pass
+    
     def get_revision_visible(self, rev):
         return rev.revid not in self.filtered_revids
 
+
+class BulkFilterer(BasicFilterer):
+    def __init__(self, graph_viz, filtered_revids):
+        self.graph_viz = graph_viz
+        self.filtered_revids = filtered_revids
+    
+    def get_revisions_visible(self):
+        if self.filtered_revids is None:
+            return None
+        return [rev.revid not in self.filtered_revids
+                for rev in self.graph_viz.revisions]
+
 def print_computed(computed):
     print_lines([(c_rev.rev.revid,
                  c_rev.col_index,
@@ -1132,6 +1679,35 @@ def format_graph_lines(list, use_unicode=True):
     return s.getvalue()
 
 
+class TestRevisionList(TestCase):
+    
+    def test_lazy(self):
+        gv = BasicGraphVizLoader(('c',), {
+         'a': (NULL_REVISION, ),
+         'b': ('a', ),
+         'c': ('a', 'b'),
+        })
+        gv.load()
+        self.assertEqual(['c', 'b', 'a'], gv.store.revids)
+        self.assertEqual(2, gv.max_mainline_revno)
+        
+        # RevisionData objects are only made when they are asked for.
+        revisions = loggraphviz.RevisionList(gv.store)
+        self.assertEqual([None, None, None], revisions._revs)
+        rev = revisions[-1]
+        self.assertEqual(('a', 2), (rev.revid, rev.index))
+        self.assertTrue(revisions[2] is rev)
+        self.assertEqual([None, None, rev], revisions._revs)
+        self.assertEqual(['c', 'b'], [r.revid for r in revisions[:2]])
+        
+        revno_rev = loggraphviz.RevisionMap(revisions, gv.store.iter_revnos)
+        self.assertTrue(revno_rev[(1,)] is rev)
+        self.assertEqual('b', revno_rev[(1, 1, 1)].revid)
+        self.assertFalse((3,) in revno_rev)
+        self.assertEqual(None, revno_rev.get((3,)))
+        self.assertEqual(3, len(revno_rev))
+
+
 class TestGroupOverlapping(TestCase):
     def test_group_overlapping(self):
         lines = [
@@ -19,7 +19,8 @@
 from bzrlib.tests import TestCase, TestCaseWithTransport
 from PyQt4 import QtCore
 
-from bzrlib.plugins.qbzr.lib import tests as qtests
+from bzrlib.plugins.qbzr.lib import logmodel, tests as qtests
+from bzrlib.plugins.qbzr.lib.lazycachedrevloader import load_revisions
 from bzrlib.plugins.qbzr.lib.logmodel import (LogModel, GraphVizLoader)
 from bzrlib.plugins.qbzr.lib.loggraphviz import BranchInfo
 from bzrlib.plugins.qbzr.lib.util import ThrobberWidget
@@ -38,6 +39,7 @@ class TestModel(qtests.QTestCase):
 
         bi = BranchInfo('', wt, wt.branch)
         log_model.load((bi,), bi, None, False, GraphVizLoader)
+        return log_model
 
     def test_empty_branch(self):
         wt = self.make_branch_and_tree('.')
@@ -73,3 +75,27 @@ class TestModel(qtests.QTestCase):
     def test_merges(self):
         wt = self._prepare_tree_with_merges()
         self._test(wt)
+
+    def test_search_cancelled_then_narrowed(self):
+        wt = self._prepare_tree_with_merges()
+        log_model = self._test(wt)
+        revids = ['rev-1', 'rev-2a', 'rev-2b']
+        load_revisions(revids, log_model.get_repo())
+        search_filter = log_model.prop_search_filter
+        search_filter.get_search_index = lambda: None
+        # Match one revision per slice.
+        ticks = [0]
+        def clock():
+            ticks[0] += 1
+            return ticks[0]
+        self.overrideAttr(logmodel, 'clock', clock)
+        search_filter.match_slice_time = 1.5
+        # Narrow the search while the first slice is being matched.
+        def update_ui():
+            if search_filter.search_str == 'rev':
+                search_filter.set_search('rev-', 'message')
+        search_filter.graph_viz.update_ui = update_ui
+
+        search_filter.set_search('rev', 'message')
+        self.assertEqual('rev-', search_filter.search_str)
+        self.assertEqual(set(revids), search_filter.search_matched_revids)
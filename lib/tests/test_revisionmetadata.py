@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from bzrlib.revision import Revision
+from bzrlib.tests import TestCaseWithTransport, TestNotApplicable
+
+from bzrlib.plugins.qbzr.lib import revisionmetadata
+from bzrlib.plugins.qbzr.lib.revisionmetadata import (
+    CachedRevision,
+    RevisionDiskCache,
+    RevisionMetadataStore,
+    )
+
+
+def make_revisions(test, count):
+    tree = test.make_branch_and_tree('tree')
+    for i in range(count):
+        tree.commit('summary %d\n\nbody %d' % (i, i), rev_id='rev-%d' % i,
+                    committer='Joe <joe@example.com>',
+                    authors=['Jane <jane@example.com>'],
+                    revprops={'bugs': 'https://launchpad.net/bugs/%d fixed'
+                              % (i + 100)})
+    repo = tree.branch.repository
+    repo.lock_read()
+    try:
+        revs = repo.get_revisions(['rev-%d' % i for i in range(count)])
+    finally:
+        repo.unlock()
+    return repo, revs
+
+
+class TestRevisionMetadataStore(TestCaseWithTransport):
+
+    def test_add_revision(self):
+        repo, (rev,) = make_revisions(self, 1)
+        store = RevisionMetadataStore()
+        cached = store.add_revision(rev, repo)
+
+        self.assertIsInstance(cached, CachedRevision)
+        self.assertTrue('rev-0' in store)
+        self.assertEqual(cached, store['rev-0'])
+        self.assertEqual('rev-0', cached.revision_id)
+        self.assertEqual(rev.parent_ids, cached.parent_ids)
+        self.assertEqual(rev.committer, cached.committer)
+        self.assertEqual(rev.timestamp, cached.timestamp)
+        self.assertEqual(rev.timezone, cached.timezone)
+        self.assertEqual(rev.properties, cached.properties)
+        self.assertEqual(rev.message, cached.message)
+        self.assertEqual('summary 0', cached.get_summary())
+        self.assertEqual([u'Jane <jane@example.com>'],
+                         cached.get_apparent_authors())
+        self.assertIs(repo, cached.repository)
+        self.assertEqual(('100',), store.get_bug_ids('rev-0'))
+
+    def test_no_message(self):
+        repo, (rev,) = make_revisions(self, 1)
+        rev.message = None
+        store = RevisionMetadataStore()
+        cached = store.add_revision(rev, repo)
+
+        self.assertEqual(None, cached.message)
+        self.assertEqual(None, cached.get_summary())
+
+    def test_lookup_counts(self):
+        repo, revs = make_revisions(self, 2)
+        store = RevisionMetadataStore()
+        store.add_revision(revs[0], repo)
+
+        found, missing = store.lookup(['rev-0', 'rev-1'])
+        self.assertEqual(['rev-0'], found.keys())
+        self.assertEqual(['rev-1'], missing)
+        self.assertEqual(1, store.hits)
+        self.assertEqual(1, store.misses)
+
+    def test_message_evicted(self):
+        repo, revs = make_revisions(self, 5)
+        store = RevisionMetadataStore(max_messages=4)
+        for rev in revs:
+            store.add_revision(rev, repo)
+        self.assertTrue(store.evictions > 0)
+
+        # The summary is still there without loading the message again.
+        self.assertEqual('summary 0', store['rev-0'].get_summary())
+        self.assertEqual(0, store.message_misses)
+
+        # The message is not loaded again by the revision, which has the
+        # summary until it is.
+        self.assertFalse(store.has_message('rev-0'))
+        self.assertEqual('summary 0', store['rev-0'].message)
+        self.assertEqual(0, store.message_misses)
+
+        found, missing = store.lookup(['rev-0', 'rev-4'])
+        self.assertEqual(['rev-0', 'rev-4'], sorted(found.keys()))
+        found, missing = store.lookup(['rev-0', 'rev-4'], with_messages=True)
+        self.assertEqual(['rev-4'], found.keys())
+        self.assertEqual(['rev-0'], missing)
+        self.assertEqual(1, store.message_misses)
+
+        store.add_revision(revs[0], repo)
+        self.assertTrue(store.has_message('rev-0'))
+        self.assertEqual('summary 0\n\nbody 0', store['rev-0'].message)
+
+    def test_other_revisions(self):
+        store = RevisionMetadataStore()
+        rev = Revision('current:')
+        rev.properties = {}
+        store['current:'] = rev
+        self.assertTrue('current:' in store)
+        self.assertIs(rev, store['current:'])
+        self.assertEqual((), store.get_bug_ids('current:'))
+        self.assertEqual(None, store.get('missing'))
+
+
+class TestRevisionDiskCache(TestCaseWithTransport):
+
+    def setUp(self):
+        super(TestRevisionDiskCache, self).setUp()
+        if revisionmetadata.sqlite3 is None:
+            raise TestNotApplicable('sqlite3 is not available')
+
+    def test_add_get_revisions(self):
+        repo, revs = make_revisions(self, 2)
+        cache = RevisionDiskCache('cache')
+        self.assertEqual([], cache.get_revisions(['rev-0', 'rev-1']))
+        cache.add_revisions(revs)
+        cache.close()
+
+        cache = RevisionDiskCache('cache')
+        cached_revs = cache.get_revisions(['rev-0', 'rev-1', 'rev-missing'])
+        self.assertEqual(sorted(revs, key=lambda rev: rev.revision_id),
+                         sorted(cached_revs, key=lambda rev: rev.revision_id))
+
+    def test_max_revisions(self):
+        repo, revs = make_revisions(self, 5)
+        cache = RevisionDiskCache('cache', max_revisions=3)
+        for rev in revs:
+            cache.add_revisions([rev])
+        cached_revids = [rev.revision_id for rev in cache.get_revisions(
+            ['rev-%d' % i for i in range(5)])]
+        self.assertTrue(len(cached_revids) <= 3)
+        self.assertTrue('rev-4' in cached_revids)
+        self.assertFalse('rev-0' in cached_revids)
+
+    def test_corrupt(self):
+        self.build_tree_contents([('cache', 'not a database')])
+        repo, revs = make_revisions(self, 1)
+        cache = RevisionDiskCache('cache')
+        self.assertEqual([], cache.get_revisions(['rev-0']))
+        self.assertTrue(cache.broken)
+        cache.add_revisions(revs)
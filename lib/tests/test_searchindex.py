@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+import fnmatch
+import re
+
+from bzrlib.revision import Revision
+from bzrlib.tests import TestCase, TestCaseInTempDir, TestNotApplicable
+
+from bzrlib.plugins.qbzr.lib import searchindex
+
+
+def make_revision(revid, message, committer, authors=None, bugs=None):
+    rev = Revision(revid, message=message, committer=committer,
+                   timestamp=0, timezone=0, properties={})
+    if authors:
+        rev.properties['authors'] = '\n'.join(authors)
+    if bugs:
+        rev.properties['bugs'] = '\n'.join(bugs)
+    return rev
+
+
+class TestPatterns(TestCase):
+
+    def test_get_pattern_words(self):
+        self.assertEqual(['fix'], searchindex.get_pattern_words(u'Fix'))
+        self.assertEqual(['fix', 'crash'], sorted(
+            searchindex.get_pattern_words(u'fix*crash'), reverse=True))
+        self.assertEqual(['fo', 'bar'], sorted(
+            searchindex.get_pattern_words(u'fo?-bar'), reverse=True))
+        self.assertEqual([], searchindex.get_pattern_words(u'*'))
+        self.assertEqual(None, searchindex.get_pattern_words(u'[ab]c'))
+
+    def test_pattern_narrows(self):
+        self.assertTrue(searchindex.pattern_narrows(u'fix', u'fix crash'))
+        self.assertTrue(searchindex.pattern_narrows(u'fix', u'fix*'))
+        self.assertFalse(searchindex.pattern_narrows(u'fix', u'fi'))
+        self.assertFalse(searchindex.pattern_narrows(u'fix', u'bug'))
+        self.assertFalse(searchindex.pattern_narrows(u'', u'fix'))
+        self.assertFalse(searchindex.pattern_narrows(None, u'fix'))
+        self.assertFalse(searchindex.pattern_narrows(u'fix[', u'fix[ab]'))
+
+
+class TestRevisionSearchIndex(TestCaseInTempDir):
+
+    def setUp(self):
+        super(TestRevisionSearchIndex, self).setUp()
+        if searchindex.sqlite3 is None:
+            raise TestNotApplicable('sqlite3 is not available')
+        self.revs = [
+            make_revision('rev-1', u'Fix the crash on startup',
+                          u'Joe <joe@example.com>'),
+            make_revision('rev-2', u'Add a unicode \xfcmlaut test\n\nMore',
+                          u'Joe <joe@example.com>',
+                          authors=[u'Jane <jane@example.com>']),
+            make_revision('rev-3', u'Crash fixes',
+                          u'Bob <bob@example.com>',
+                          bugs=['https://launchpad.net/bugs/1234 fixed']),
+            make_revision('rev-4', u'', u'Bob <bob@example.com>'),
+            ]
+
+    def assertSearch(self, expected, field, pattern, index=None):
+        if index is None:
+            index = searchindex.RevisionSearchIndex('index')
+            index.add_revisions(self.revs)
+        filter_re = re.compile(fnmatch.translate(pattern + '*'),
+                               re.IGNORECASE)
+        self.assertEqual(set(expected),
+                         index.search(field, pattern, filter_re))
+
+    def test_search(self):
+        self.assertSearch(['rev-1', 'rev-3'], 'message', u'crash')
+        self.assertSearch(['rev-1'], 'message', u'fix*crash')
+        self.assertSearch(['rev-2'], 'message', u'\xfcMLAUT')
+        self.assertSearch(['rev-2'], 'message', u'more')
+        self.assertSearch(['rev-1', 'rev-2', 'rev-3', 'rev-4'],
+                          'message', u'*')
+        self.assertSearch(['rev-1', 'rev-3'], 'message', u'[c]rash')
+        self.assertSearch(['rev-2'], 'author', u'jane')
+        self.assertSearch(['rev-1'], 'author', u'joe')
+        self.assertSearch(['rev-1', 'rev-2'], 'committer', u'joe')
+        self.assertSearch(['rev-3'], 'bug', u'*')
+        self.assertSearch(['rev-3'], 'bug', u'1234')
+        self.assertSearch([], 'bug', u'4321')
+
+    def test_reopen(self):
+        index = searchindex.RevisionSearchIndex('index')
+        self.assertFalse(index.exists())
+        index.add_revisions(self.revs[:2])
+        index.close()
+
+        index = searchindex.RevisionSearchIndex('index')
+        self.assertTrue(index.exists())
+        self.assertEqual(['rev-3', 'rev-4'], index.get_unindexed_revids(
+            ['rev-1', 'rev-2', 'rev-3', 'rev-4']))
+        index.add_revisions(self.revs)
+        self.assertEqual([], index.get_unindexed_revids(
+            ['rev-1', 'rev-2', 'rev-3', 'rev-4']))
+        self.assertSearch(['rev-1', 'rev-3'], 'message', u'crash', index)
+
+    def test_working_tree_revisions_not_indexed(self):
+        index = searchindex.RevisionSearchIndex('index')
+        index.add_revisions(self.revs + [
+            make_revision('current:/tree', u'Crash in the tree',
+                          u'Joe <joe@example.com>')])
+        self.assertEqual(['current:/tree'], index.get_unindexed_revids(
+            ['rev-1', 'current:/tree']))
+        self.assertSearch(['rev-1', 'rev-3'], 'message', u'crash', index)
+
+    def test_corrupt(self):
+        self.build_tree_contents([('index', 'not a database')])
+        index = searchindex.RevisionSearchIndex('index')
+        self.assertEqual(['rev-1'], index.get_unindexed_revids(['rev-1']))
+        self.assertTrue(index.broken)
+        self.assertEqual(None, index.search('message', u'crash',
+                                            re.compile('crash')))
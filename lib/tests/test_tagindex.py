@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#
+# QBzr - Qt frontend to Bazaar commands
+# Copyright (C) 2026 QBzr Developers
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+from bzrlib.tests import TestCase
+
+from bzrlib.plugins.qbzr.lib.tagindex import TagIndex
+
+
+class TestTagIndex(TestCase):
+
+    def make_index(self):
+        index = TagIndex()
+        index.add_reverse_tag_dict({'rev-1': ['release-1.0', 'beta'],
+                                    'rev-2': ['release-2.0']})
+        # A tag on a different revision in another branch.
+        index.add_reverse_tag_dict({'rev-3': ['beta'],
+                                    'rev-2': ['Release-2.0-final']})
+        return index
+
+    def test_dict(self):
+        index = self.make_index()
+        self.assertEqual(3, len(index))
+        self.assertTrue('rev-2' in index)
+        self.assertFalse('rev-4' in index)
+        self.assertEqual(set(['release-2.0', 'Release-2.0-final']),
+                         index['rev-2'])
+        self.assertEqual(None, index.get('rev-4'))
+        self.assertEqual(['rev-1', 'rev-2', 'rev-3'], sorted(index))
+
+    def test_sorted_tags(self):
+        index = self.make_index()
+        self.assertEqual(['Release-2.0-final', 'beta', 'release-1.0',
+                          'release-2.0'], index.get_sorted_tags())
+        self.assertEqual(('beta', 'release-1.0'),
+                         index.get_revid_sorted_tags('rev-1'))
+        self.assertEqual((), index.get_revid_sorted_tags('rev-4'))
+        self.assertEqual(set(['rev-1', 'rev-3']),
+                         index.get_tag_revids()['beta'])
+
+    def test_get_tags_with_prefix(self):
+        index = self.make_index()
+        self.assertEqual(['release-1.0', 'release-2.0'],
+                         index.get_tags_with_prefix('release'))
+        self.assertEqual(['beta'], index.get_tags_with_prefix('b'))
+        self.assertEqual([], index.get_tags_with_prefix('x'))
+
+    def test_search(self):
+        index = self.make_index()
+        self.assertEqual(set(['rev-1', 'rev-2']), index.search(u'release'))
+        self.assertEqual(set(['rev-2']), index.search(u'release-2'))
+        self.assertEqual(set(['rev-2']), index.search(u'release-2'))
+        self.assertEqual(set(['rev-2']), index.search(u'2*final'))
+        self.assertEqual(set(['rev-1', 'rev-3']), index.search(u'bet'))
+        self.assertEqual(set(), index.search(u'[x]'))
@@ -918,6 +918,12 @@ class BackgroundJob(object):
 
 loading_queue = None
 
+loading_queue_holds = 0
+"""The number of hold_loading_queue calls that have not been released. The
+queued methods are not run while this is more than 0."""
+
+loading_queue_running = False
+
 def runs_in_loading_queue(f):
     """Methods decorated with this will not run at the same time, but will be
     queued. Methods decorated with this will not be able to return results,
@@ -935,19 +941,47 @@ def run_in_loading_queue(cur_f, *cur_args, **cur_kargs):
     global loading_queue
     if loading_queue is None:
         loading_queue = []
-        try:
-            loading_queue.append((cur_f, cur_args, cur_kargs))
-            
-            while len(loading_queue):
-                try:
-                    f, args, kargs = loading_queue.pop(0)
-                    f(*args, **kargs)
-                except:
-                    trace.report_exception()
-        finally:
+    loading_queue.append((cur_f, cur_args, cur_kargs))
+    if not loading_queue_running:
+        _run_loading_queue()
+
+def _run_loading_queue():
+    """Run the queued methods, until there are none left, or the queue is
+    held."""
+    global loading_queue, loading_queue_running
+    loading_queue_running = True
+    try:
+        while len(loading_queue) and not loading_queue_holds:
+            try:
+                f, args, kargs = loading_queue.pop(0)
+                f(*args, **kargs)
+            except:
+                trace.report_exception()
+    finally:
+        loading_queue_running = False
+        if not len(loading_queue) and not loading_queue_holds:
             loading_queue = None
-    else:
-        loading_queue.append((cur_f, cur_args, cur_kargs))
+
+def hold_loading_queue():
+    """Queue methods that are run in the loading queue, rather than
+    running them, until release_loading_queue is called.
+    
+    The queue may be held more than once. It only runs again once each hold
+    has been released.
+    """
+    global loading_queue, loading_queue_holds
+    loading_queue_holds += 1
+    if loading_queue is None:
+        loading_queue = []
+
+def release_loading_queue():
+    """Release a hold_loading_queue. If it was the last hold, the methods
+    that were queued while the queue was held are run before this
+    returns."""
+    global loading_queue_holds
+    loading_queue_holds -= 1
+    if not loading_queue_holds and not loading_queue_running:
+        _run_loading_queue()
 
 
 def get_apparent_authors_new(rev):